@@ -1,11 +1,20 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from models.anomaly_detector import AnomalyDetector
 from models.pattern_matcher import PatternMatcher
-import pandas as pd
-import numpy as np
+from models.threat_intel import ThreatIntelStore, CONFIDENCE_SCORES
+from models.detection_rules import detection_rules
+from models.coalescer import RequestCoalescer
+from models.stream_scoring import StreamScorer
+from models.sequence_correlation import SequenceCorrelator, escalate
+from models.result_cache import ResultCache
+from models.log_normalizer import LogNormalizer
+from models.warmup import Warmup
+from models import wire_format
+from models.instrumentation import INSTRUMENTATION, PROMETHEUS_CONTENT_TYPE
 from datetime import datetime
 from dotenv import load_dotenv
+import json
 import os
 
 load_dotenv()
@@ -16,51 +25,229 @@ CORS(app)
 print("BunaSIEM ML Service Starting...")
 print("Loading Ethiopian threat detection models...")
 
+# Detection rules shared by the detector and the pattern matcher, reloaded when the rule files change
+rule_store = detection_rules()
+rule_store.start_watcher(float(os.getenv('DETECTION_RULES_RELOAD_SECONDS', 30)))
+
 # Initialize ML models
 anomaly_detector = AnomalyDetector()
 pattern_matcher = PatternMatcher()
+threat_intel = ThreatIntelStore()
+threat_intel.start_watcher(float(os.getenv('THREAT_INTEL_RELOAD_SECONDS', 60)))
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    return jsonify({
-        'status': 'healthy',
+# Native CloudTrail / Azure Monitor / Ethio Telecom records are mapped to flat fields (ML_NORMALIZE_LOGS=0 disables)
+log_normalizer = LogNormalizer.from_env()
+
+
+def normalize_logs(logs):
+    return log_normalizer.normalize(logs) if log_normalizer is not None else logs
+
+
+# Opt-in per-IP/user tracking of the multi-step sequence rules (ML_CORRELATION=1)
+correlator = SequenceCorrelator.from_env(pattern_matcher)
+
+
+# Opt-in cache of detector/pattern results for repeated logs (ML_RESULT_CACHE_SIZE > 0)
+result_cache = ResultCache.from_env(anomaly_detector, pattern_matcher)
+
+
+def score_logs(logs):
+    """Detector and pattern results for each log, scored as one batch"""
+    if result_cache is not None:
+        return result_cache.score(logs)
+    ml_results = anomaly_detector.predict_batch(logs)
+    pattern_results = pattern_matcher.summarize_rows(pattern_matcher.rule_flags(logs))
+    return list(zip(ml_results, pattern_results))
+
+
+# Opt-in micro-batching of concurrent /predict/anomaly calls (ML_COALESCE_MAX_WAIT_MS > 0)
+coalescer = RequestCoalescer.from_env(score_logs)
+
+# /analyze/stream scores uploads in fixed-size chunks so memory stays bounded
+stream_scorer = StreamScorer(anomaly_detector, pattern_matcher, threat_intel, log_normalizer, correlator)
+STREAM_CHUNK_SIZE = int(os.getenv('ML_STREAM_CHUNK_SIZE', 1000))
+STREAM_MAX_CHUNK_SIZE = 10000
+
+# A dummy batch through every scoring path before /health reports ready (ML_WARMUP=0 skips it).
+# Under gunicorn's preload this runs in the master, so forked workers start warm.
+warmup = Warmup.from_env(anomaly_detector, pattern_matcher, threat_intel, correlator, log_normalizer)
+warmup.run()
+
+def wants_compact(media_type, args):
+    """Binary responses, and JSON ones with ?compact=1, send shared result fields once"""
+    return media_type != wire_format.JSON or args.get('compact', '').lower() in ('1', 'true', 'yes')
+
+
+def respond(payload, media_type):
+    if media_type == wire_format.JSON:
+        with INSTRUMENTATION.stage('serialize'):
+            response = jsonify(payload)
+    else:
+        response = Response(wire_format.encode(payload, media_type), mimetype=media_type)
+    response.vary.add('Accept')
+    return response
+
+
+# Endpoint bodies shared by this Flask app and the asyncio server (async_server.py)
+
+def health_payload():
+    return {
+        'status': 'healthy' if warmup.ready else 'unavailable',
+        'ready': warmup.ready,
+        'warmup': warmup.stats(),
         'service': 'BunaSIEM ML Service',
         'timestamp': datetime.now().isoformat(),
-        'models_loaded': True,
+        'models_loaded': anomaly_detector.is_loaded(),
+        'model_version': anomaly_detector.model_info.get('version'),
+        'model_startup_seconds': anomaly_detector.model_info.get('startup_seconds'),
+        'compiled_forest': anomaly_detector.forest is not None,
         'features': [
             'Ethiopian IP pattern analysis',
             'Business hours anomaly detection',
             'Geographic threat mapping',
             'Behavioral anomaly detection'
         ]
-    })
+    }
 
-@app.route('/predict/anomaly', methods=['POST'])
-def predict_anomaly():
-    """Predict if a security log is anomalous with Ethiopian context"""
-    try:
-        data = request.get_json()
 
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
+def predict_result(data, compact=False):
+    """Combined detector, pattern and threat intel result for one log"""
+    if isinstance(data, dict):
+        data = normalize_logs([data])[0]
 
+    if coalescer is not None and isinstance(data, dict):
+        # Scored together with concurrent requests
+        ml_result, pattern_result = coalescer.submit(data)
+    elif result_cache is not None and isinstance(data, dict):
+        ml_result, pattern_result = result_cache.score([data])[0]
+    else:
         # Analyze with ML model
         ml_result = anomaly_detector.predict(data)
 
         # Analyze with pattern matcher for Ethiopian context
         pattern_result = pattern_matcher.detect_ethiopian_patterns([data])
 
-        # Combine results
-        combined_result = {
-            'is_anomaly': ml_result['is_anomaly'] or pattern_result['suspicious'],
-            'confidence': max(ml_result['confidence'], pattern_result['confidence']),
-            'ml_result': ml_result,
-            'pattern_result': pattern_result,
-            'ethiopian_context': True,
-            'analysis_timestamp': datetime.now().isoformat()
-        }
+    # Match against threat intelligence indicators
+    intel_matches = threat_intel.match_batch([data])[0]
+    intel_confidence = max((CONFIDENCE_SCORES.get(m['confidence_level'], 0.0) for m in intel_matches), default=0.0)
+
+    # Multi-step sequences this log completes, together with earlier requests
+    incidents = correlator.observe_many([data])[0] if correlator is not None and isinstance(data, dict) else []
+
+    # Combine results
+    combined_result = {
+        'is_anomaly': ml_result['is_anomaly'] or pattern_result['suspicious'] or bool(intel_matches) or bool(incidents),
+        'confidence': max(ml_result['confidence'], pattern_result['confidence'], intel_confidence),
+        'ml_result': ml_result,
+        'pattern_result': pattern_result,
+        'threat_intel_matches': intel_matches,
+        'ethiopian_context': True,
+        'analysis_timestamp': datetime.now().isoformat()
+    }
+    if correlator is not None:
+        combined_result['incidents'] = incidents
+    if compact:
+        combined_result['ml_result'] = anomaly_detector.compact_result(ml_result)
+        combined_result['ml_metadata'] = anomaly_detector.shared_result_fields()
+    return combined_result
+
+
+def analyze_result(logs, compact=False):
+    """(summary, per-log ml results) for a batch of logs"""
+    logs = normalize_logs(logs)
+
+    # Analyze with both systems
+    ml_results = anomaly_detector.predict_batch(logs, compact=compact)
+
+    pattern_result = pattern_matcher.detect_ethiopian_patterns(logs)
+    intel_matches = [
+        {'log_index': i, 'matches': matches}
+        for i, matches in enumerate(threat_intel.match_batch(logs)) if matches
+    ]
+    incidents = [
+        dict(incident, log_index=i)
+        for i, found in enumerate(correlator.observe_many(logs)) for incident in found
+    ] if correlator is not None else []
+
+    # Calculate overall threat level; a completed attack sequence counts at its rule's severity
+    anomaly_count = sum(1 for r in ml_results if r['is_anomaly'])
+    threat_level = 'critical' if anomaly_count > 5 else 'high' if anomaly_count > 2 else 'medium' if anomaly_count > 0 else 'low'
+    threat_level = escalate(threat_level, [incident['severity'] for incident in incidents])
 
-        return jsonify(combined_result)
+    summary = {
+        'total_logs_analyzed': len(logs),
+        'anomalies_detected': anomaly_count,
+        'threat_level': threat_level,
+        'ethiopian_patterns_found': pattern_result['patterns_detected'],
+        'pattern_analysis': pattern_result,
+        'threat_intel_matches': intel_matches,
+        'threat_intel_version': threat_intel.snapshot.version
+    }
+    if correlator is not None:
+        summary['incidents'] = incidents
+    if compact:
+        summary['ml_metadata'] = anomaly_detector.shared_result_fields()
+    return summary, ml_results
+
+
+def stats_payload(component):
+    if component is None:
+        return {'enabled': False}
+    return dict(component.stats(), enabled=True)
+
+
+def metrics_text():
+    """Prometheus exposition of the stage timers and component histograms"""
+    histograms = []
+    if coalescer is not None:
+        histograms.append(('bunasiem_coalescer_batch_size', 'Logs per coalesced scoring call', coalescer.batch_size))
+        histograms.append(('bunasiem_coalescer_queue_depth', 'Queued requests when a batch starts', coalescer.queue_depth))
+    return INSTRUMENTATION.render(histograms)
+
+
+def threats_payload():
+    return {
+        'threat_intelligence': pattern_matcher.get_ethiopian_threat_intelligence(),
+        'indicator_store': threat_intel.stats(),
+        'last_updated': datetime.now().isoformat(),
+        'source': 'BunaSIEM Ethiopian Threat Feed'
+    }
+
+
+@app.before_request
+def start_request_timer():
+    g.request_timing = INSTRUMENTATION.start_request()
+
+@app.teardown_request
+def finish_request_timer(exc):
+    timing = g.pop('request_timing', None)
+    if timing is not None:
+        # Route templates, not raw paths, keep the label set bounded
+        INSTRUMENTATION.finish_request(timing, request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    payload = health_payload()
+    return jsonify(payload), 200 if payload['ready'] else 503
+
+@app.route('/predict/anomaly', methods=['POST'])
+def predict_anomaly():
+    """Predict if a security log is anomalous with Ethiopian context"""
+    try:
+        try:
+            data = wire_format.decode_body(request)
+        except wire_format.UnsupportedFormat as e:
+            return jsonify({'error': str(e)}), 415
+        except wire_format.InvalidBody as e:
+            return jsonify({'error': str(e)}), 400
+        media_type = wire_format.negotiate(request.accept_mimetypes)
+
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Log must be an object'}), 400
+
+        return respond(predict_result(data, wants_compact(media_type, request.args)), media_type)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -69,48 +256,95 @@ def predict_anomaly():
 def analyze_batch():
     """Analyze multiple logs for Ethiopian security patterns"""
     try:
-        data = request.get_json()
-        logs = data.get('logs', [])
+        try:
+            data = wire_format.decode_body(request, columnar=True)
+        except wire_format.UnsupportedFormat as e:
+            return jsonify({'error': str(e)}), 415
+        except wire_format.InvalidBody as e:
+            return jsonify({'error': str(e)}), 400
+        media_type = wire_format.negotiate(request.accept_mimetypes, columnar=True)
+        logs = data.get('logs', []) if isinstance(data, dict) else []
 
         if not logs:
             return jsonify({'error': 'No logs provided'}), 400
 
-        # Analyze with both systems
-        ml_results = []
-        pattern_results = []
+        summary, ml_results = analyze_result(logs, wants_compact(media_type, request.args))
+        if media_type == wire_format.ARROW:
+            # One row per log; the summary travels in the schema metadata
+            response = Response(wire_format.ml_results_table(ml_results, summary), mimetype=media_type)
+            response.vary.add('Accept')
+            return response
+        return respond(dict(summary, ml_results=ml_results), media_type)
 
-        for log in logs:
-            ml_result = anomaly_detector.predict(log)
-            ml_results.append(ml_result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        pattern_result = pattern_matcher.detect_ethiopian_patterns(logs)
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """Score an NDJSON (optionally gzip) upload chunk by chunk, streaming NDJSON results"""
+    try:
+        chunk_size = int(request.args.get('chunk_size', STREAM_CHUNK_SIZE))
+    except ValueError:
+        return jsonify({'error': 'chunk_size must be an integer'}), 400
+    chunk_size = max(1, min(chunk_size, STREAM_MAX_CHUNK_SIZE))
 
-        # Calculate overall threat level
-        anomaly_count = sum(1 for r in ml_results if r['is_anomaly'])
-        threat_level = 'critical' if anomaly_count > 5 else 'high' if anomaly_count > 2 else 'medium' if anomaly_count > 0 else 'low'
+    encoding = request.headers.get('Content-Encoding', '').lower()
+    compressed = True if encoding == 'gzip' else None
 
-        return jsonify({
-            'total_logs_analyzed': len(logs),
-            'anomalies_detected': anomaly_count,
-            'threat_level': threat_level,
-            'ethiopian_patterns_found': pattern_result['patterns_detected'],
-            'ml_results': ml_results,
-            'pattern_analysis': pattern_result
-        })
+    def generate():
+        try:
+            yield from stream_scorer.score_ndjson(request.stream, chunk_size, compressed)
+        except Exception as e:
+            # Headers are already sent; report the failure as the last line
+            yield (json.dumps({'error': str(e)}) + '\n').encode()
 
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/coalescer/stats', methods=['GET'])
+def coalescer_stats():
+    """Batch size and queue depth histograms for the request coalescer"""
+    return jsonify(stats_payload(coalescer))
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit rate, evictions and invalidations of the result cache"""
+    return jsonify(stats_payload(result_cache))
+
+@app.route('/behavior/stats', methods=['GET'])
+def behavior_stats():
+    """Key counts, evictions and memory of the per-IP/user sliding windows"""
+    return jsonify(stats_payload(anomaly_detector.behavior_windows))
+
+@app.route('/correlation/stats', methods=['GET'])
+def correlation_stats():
+    """Tracked keys, incidents and evictions per sequence rule"""
+    return jsonify(stats_payload(correlator))
+
+@app.route('/normalizer/stats', methods=['GET'])
+def normalizer_stats():
+    """Records seen per detected log source"""
+    return jsonify(stats_payload(log_normalizer))
+
+@app.route('/scoring/stats', methods=['GET'])
+def scoring_stats():
+    """Worker count and usage of the parallel scoring pool"""
+    return jsonify(stats_payload(anomaly_detector.parallel_scorer))
+
+@app.route('/rules/stats', methods=['GET'])
+def rules_stats():
+    """Version, rule counts and compiled node counts of the detection rules"""
+    return jsonify(stats_payload(rule_store))
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage and per-endpoint latency histograms in Prometheus text format"""
+    return Response(metrics_text(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.route('/threats/ethiopian', methods=['GET'])
 def get_ethiopian_threats():
     """Get current Ethiopian threat intelligence"""
     try:
-        threats = pattern_matcher.get_ethiopian_threat_intelligence()
-        return jsonify({
-            'threat_intelligence': threats,
-            'last_updated': datetime.now().isoformat(),
-            'source': 'BunaSIEM Ethiopian Threat Feed'
-        })
+        return jsonify(threats_payload())
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -0,0 +1,443 @@
+"""
+BunaSIEM ML Service - asyncio server
+The endpoints of app.py on aiohttp. Bodies are read and responses written on
+the event loop, while decoding, scoring and encoding run in an executor pool.
+At most ML_ASYNC_MAX_IN_FLIGHT scoring requests are admitted at a time and
+the rest get 429, so /health keeps answering when the service is saturated.
+
+Each process worker has its own models, caches and windows. Their stats come
+back with every job and the stats endpoints sum them; correlation and
+behavior windows, whose state a pool would split, need the thread executor
+or a single process worker.
+
+Run with: python async_server.py
+"""
+
+import asyncio
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+
+from aiohttp import web
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+import app as service
+from models import wire_format
+from models.instrumentation import INSTRUMENTATION, PROMETHEUS_CONTENT_TYPE
+from models.stream_scoring import GZIP_MAGIC, encode_line
+
+NDJSON = 'application/x-ndjson'
+
+
+class InFlightLimit:
+    """Admission counter for scoring requests; only used from the event loop"""
+
+    def __init__(self, limit, retry_after=1):
+        self.limit = limit
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.peak = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def acquire(self):
+        if self.in_flight >= self.limit:
+            self.rejected += 1
+            return False
+        self.in_flight += 1
+        self.admitted += 1
+        self.peak = max(self.peak, self.in_flight)
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.limit,
+            'peak_in_flight': self.peak,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
+
+
+class GzipInflater:
+    """Incremental gzip decoder for request bodies, including multi-member files"""
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(wbits=31)
+
+    def feed(self, data):
+        out = []
+        while data:
+            out.append(self._decompressor.decompress(data))
+            if not self._decompressor.eof:
+                break
+            # Next member of a concatenated gzip file
+            data = self._decompressor.unused_data
+            self._decompressor = zlib.decompressobj(wbits=31)
+        return b''.join(out)
+
+    def flush(self):
+        return self._decompressor.flush()
+
+
+def make_executor(kind, workers):
+    """Spawned process pool, each worker loading the models, or a thread pool sharing this process's.
+
+    Scoring threads hold the GIL for much of a batch, which delays the event
+    loop, so processes are the default.
+    """
+    if kind == 'thread':
+        return ThreadPoolExecutor(workers, thread_name_prefix='scoring')
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _accept(header):
+    return parse_accept_header(header, MIMEAccept)
+
+
+def _error(status, message):
+    return status, wire_format.encode({'error': message}, wire_format.JSON), wire_format.JSON
+
+
+# Executor jobs: plain arguments in, (status, body, content type) out, so they
+# also run in a process pool
+
+def _warm_up():
+    # Importing app in a fresh worker already ran its warm-up
+    return service.warmup.ready
+
+
+def _worker_stats():
+    return {path: service.stats_payload(component()) for path, (component, _) in WORKER_STATS.items()}
+
+
+def _instrumented(endpoint, drain, job, *args):
+    """Run a job under the slow-request profiler; a process worker also returns the stage timings it
+    recorded and the stats of its components"""
+    profiler = INSTRUMENTATION.profiler
+    token = profiler.start() if profiler is not None else None
+    start = perf_counter()
+    try:
+        result = job(*args)
+    finally:
+        if token is not None:
+            profiler.finish(token, endpoint, perf_counter() - start)
+    if not drain:
+        return result, {}, None
+    return result, INSTRUMENTATION.drain(), (os.getpid(), _worker_stats())
+
+
+def _predict_job(body, content_type, accept, args):
+    try:
+        try:
+            data = wire_format.decode_bytes(body, content_type)
+        except wire_format.UnsupportedFormat as e:
+            return _error(415, str(e))
+        except wire_format.InvalidBody as e:
+            return _error(400, str(e))
+        media_type = wire_format.negotiate(_accept(accept))
+
+        if not data:
+            return _error(400, 'No data provided')
+        if not isinstance(data, dict):
+            return _error(400, 'Log must be an object')
+
+        result = service.predict_result(data, service.wants_compact(media_type, args))
+        return 200, wire_format.encode(result, media_type), media_type
+
+    except Exception as e:
+        return _error(500, str(e))
+
+
+def _analyze_job(body, content_type, accept, args):
+    try:
+        try:
+            data = wire_format.decode_bytes(body, content_type, columnar=True)
+        except wire_format.UnsupportedFormat as e:
+            return _error(415, str(e))
+        except wire_format.InvalidBody as e:
+            return _error(400, str(e))
+        media_type = wire_format.negotiate(_accept(accept), columnar=True)
+        logs = data.get('logs', []) if isinstance(data, dict) else []
+
+        if not logs:
+            return _error(400, 'No logs provided')
+
+        summary, ml_results = service.analyze_result(logs, service.wants_compact(media_type, args))
+        if media_type == wire_format.ARROW:
+            return 200, wire_format.ml_results_table(ml_results, summary), media_type
+        return 200, wire_format.encode(dict(summary, ml_results=ml_results), media_type), media_type
+
+    except Exception as e:
+        return _error(500, str(e))
+
+
+def _stream_job(lines, start):
+    return service.stream_scorer.encode_lines(lines, start)
+
+
+@web.middleware
+async def request_timer(request, handler):
+    # The executor job, not the event loop, is what the profiler samples
+    timing = INSTRUMENTATION.start_request(profile=False)
+    try:
+        return await handler(request)
+    finally:
+        resource = request.match_info.route.resource
+        INSTRUMENTATION.finish_request(timing, resource.canonical if resource is not None else 'unmatched')
+
+
+def limited(handler):
+    """Admit the request under the in-flight limit or answer 429 before reading its body"""
+    async def admit(request):
+        limit = request.app['limit']
+        if not limit.acquire():
+            return web.json_response(
+                {'error': 'Too many requests in flight', 'max_in_flight': limit.limit},
+                status=429, headers={'Retry-After': str(limit.retry_after)})
+        try:
+            return await handler(request)
+        finally:
+            limit.release()
+    return admit
+
+
+async def run_job(server, endpoint, job, *args):
+    result, stages, stats = await asyncio.get_running_loop().run_in_executor(
+        server['executor'], _instrumented, endpoint, server['executor_kind'] == 'process', job, *args)
+    INSTRUMENTATION.merge(stages)
+    if stats is not None:
+        pid, payloads = stats
+        server['worker_stats'][pid] = payloads
+    return result
+
+
+async def job_response(request, job):
+    body = await request.read()
+    status, payload, media_type = await run_job(
+        request.app, request.path, job, body, request.content_type, request.headers.get('Accept', ''), dict(request.query))
+    response = web.Response(body=payload, status=status, content_type=media_type)
+    if status == 200:
+        response.headers['Vary'] = 'Accept'
+    return response
+
+
+def server_info(server):
+    return dict(server['limit'].stats(), executor=server['executor_kind'], workers=server['workers'],
+                workers_ready=server['workers_ready'])
+
+
+async def health_check(request):
+    # Answered on the event loop, never queued behind scoring
+    payload = dict(service.health_payload(), server=server_info(request.app))
+    if request.app['workers_ready'] < request.app['workers']:
+        payload.update(status='unavailable', ready=False)
+    return web.json_response(payload, status=200 if payload['ready'] else 503)
+
+
+@limited
+async def predict_anomaly(request):
+    """Predict if a security log is anomalous with Ethiopian context"""
+    return await job_response(request, _predict_job)
+
+
+@limited
+async def analyze_batch(request):
+    """Analyze multiple logs for Ethiopian security patterns"""
+    return await job_response(request, _analyze_job)
+
+
+@limited
+async def analyze_stream(request):
+    """Score an NDJSON (optionally gzip) upload chunk by chunk, streaming NDJSON results"""
+    try:
+        chunk_size = int(request.query.get('chunk_size', service.STREAM_CHUNK_SIZE))
+    except ValueError:
+        return web.json_response({'error': 'chunk_size must be an integer'}, status=400)
+    chunk_size = max(1, min(chunk_size, service.STREAM_MAX_CHUNK_SIZE))
+    # aiohttp has already undone any Content-Encoding; a gzip file sent as is is sniffed below
+    compressed = None
+
+    response = web.StreamResponse(headers={'Content-Type': NDJSON})
+    await response.prepare(request)
+
+    scorer = service.stream_scorer
+    summary = scorer.new_summary()
+    line_number = 1
+
+    async def score(lines):
+        nonlocal line_number
+        body, part = await run_job(request.app, request.path, _stream_job, lines, line_number)
+        scorer.merge_summary(summary, part)
+        line_number += len(lines)
+        await response.write(body)
+
+    try:
+        inflater = None
+        head = pending = b''
+        lines = []
+        async for data in request.content.iter_any():
+            if compressed is None:
+                # Sniff the gzip magic bytes like open_ndjson()
+                head += data
+                if len(head) < 2:
+                    continue
+                compressed = head[:2] == GZIP_MAGIC
+                data = head
+            if compressed and inflater is None:
+                inflater = GzipInflater()
+            if inflater is not None:
+                data = inflater.feed(data)
+            *complete, pending = (pending + data).split(b'\n')
+            lines.extend(complete)
+            while len(lines) >= chunk_size:
+                await score(lines[:chunk_size])
+                del lines[:chunk_size]
+
+        if compressed is None:
+            pending = head
+        if inflater is not None:
+            pending += inflater.flush()
+        lines.append(pending)
+        for offset in range(0, len(lines), chunk_size):
+            await score(lines[offset:offset + chunk_size])
+        await response.write(encode_line(scorer.finish_summary(summary)))
+    except Exception as e:
+        # Headers are already sent; report the failure as the last line
+        await response.write(encode_line({'error': str(e)}))
+    await response.write_eof()
+    return response
+
+
+# Components each process worker has its own copy of, with the counters summed across workers
+WORKER_STATS = {
+    '/coalescer/stats': (lambda: service.coalescer, ('queued',)),
+    '/cache/stats': (lambda: service.result_cache,
+                     ('size', 'hits', 'misses', 'evictions', 'expirations', 'invalidations')),
+    '/behavior/stats': (lambda: service.anomaly_detector.behavior_windows,
+                        ('ip_keys', 'user_keys', 'evictions', 'memory_bytes')),
+    '/correlation/stats': (lambda: service.correlator, ('keys', 'incidents', 'memory_bytes')),
+    '/normalizer/stats': (lambda: service.log_normalizer, ('sources',)),
+    '/scoring/stats': (lambda: service.anomaly_detector.parallel_scorer, ('batches', 'rows')),
+}
+
+
+def _total(values):
+    if values and isinstance(values[0], dict):
+        return {key: _total([value.get(key, 0) for value in values]) for key in values[0]}
+    return sum(values)
+
+
+def pool_stats(worker_stats, path):
+    """One component's stats in every process worker, as of that worker's last job, and their totals"""
+    _, counters = WORKER_STATS[path]
+    workers = [dict(payloads[path], pid=pid) for pid, payloads in sorted(worker_stats.items())]
+    if not any(worker['enabled'] for worker in workers):
+        return {'enabled': False}
+    payload = {'enabled': True, 'workers': workers}
+    for key in counters:
+        payload[key] = _total([worker[key] for worker in workers if key in worker])
+    if 'hits' in payload:
+        lookups = payload['hits'] + payload['misses']
+        payload['hit_rate'] = payload['hits'] / lookups if lookups else 0.0
+    return payload
+
+
+def stats_handler(path):
+    component, _ = WORKER_STATS[path]
+
+    async def stats(request):
+        if request.app['executor_kind'] == 'process':
+            return web.json_response(pool_stats(request.app['worker_stats'], path))
+        return web.json_response(service.stats_payload(component()))
+    return stats
+
+
+async def rules_stats(request):
+    """Every process loads the same rule files, so this server's store stands for the workers'"""
+    return web.json_response(service.stats_payload(service.rule_store))
+
+
+async def server_stats(request):
+    """In-flight limit and executor of this server"""
+    return web.json_response(server_info(request.app))
+
+
+async def metrics(request):
+    """Per-stage and per-endpoint latency histograms in Prometheus text format"""
+    response = web.Response(text=service.metrics_text())
+    response.headers['Content-Type'] = PROMETHEUS_CONTENT_TYPE
+    return response
+
+
+async def get_ethiopian_threats(request):
+    """Get current Ethiopian threat intelligence"""
+    try:
+        return web.json_response(service.threats_payload())
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+
+
+async def warm_executor(server):
+    # Start every worker (and, for processes, load and warm up the models) before traffic arrives
+    ready = await asyncio.gather(*(run_job(server, 'warm_up', _warm_up) for _ in range(server['workers'])))
+    server['workers_ready'] = sum(ready)
+
+
+async def shutdown(server):
+    server['executor'].shutdown(wait=False, cancel_futures=True)
+    service.threat_intel.stop_watcher()
+    service.rule_store.stop_watcher()
+    if service.anomaly_detector.parallel_scorer is not None:
+        service.anomaly_detector.parallel_scorer.close()
+
+
+def make_app():
+    workers = int(os.getenv('ML_ASYNC_WORKERS', os.cpu_count() or 1))
+    kind = os.getenv('ML_ASYNC_EXECUTOR', 'process').lower()
+    max_body = int(float(os.getenv('ML_ASYNC_MAX_BODY_MB', 100)) * 1024 * 1024)
+
+    server = web.Application(client_max_size=max_body, middlewares=[request_timer])
+    server['workers'] = workers
+    server['executor_kind'] = 'thread' if kind == 'thread' else 'process'
+    if server['executor_kind'] == 'process' and workers > 1:
+        # Consecutive events of one IP or user would land on different workers and never meet
+        stateful = [name for name, component in (('ML_CORRELATION', service.correlator),
+                                                 ('ML_BEHAVIOR_WINDOWS', service.anomaly_detector.behavior_windows))
+                    if component is not None]
+        if stateful:
+            raise ValueError(f"{' and '.join(stateful)} cannot run on {workers} process workers, which would split "
+                             f"their state; set ML_ASYNC_EXECUTOR=thread or ML_ASYNC_WORKERS=1")
+    server['executor'] = make_executor(server['executor_kind'], workers)
+    server['workers_ready'] = 0
+    server['worker_stats'] = {}
+    server['limit'] = InFlightLimit(int(os.getenv('ML_ASYNC_MAX_IN_FLIGHT', 4 * workers)),
+                                    int(os.getenv('ML_ASYNC_RETRY_AFTER', 1)))
+    server.on_startup.append(warm_executor)
+    server.on_cleanup.append(shutdown)
+
+    server.router.add_get('/health', health_check)
+    server.router.add_post('/predict/anomaly', predict_anomaly)
+    server.router.add_post('/analyze/batch', analyze_batch)
+    server.router.add_post('/analyze/stream', analyze_stream)
+    for path in WORKER_STATS:
+        server.router.add_get(path, stats_handler(path))
+    server.router.add_get('/rules/stats', rules_stats)
+    server.router.add_get('/server/stats', server_stats)
+    server.router.add_get('/metrics', metrics)
+    server.router.add_get('/threats/ethiopian', get_ethiopian_threats)
+    return server
+
+
+if __name__ == '__main__':
+    port = int(os.getenv('ML_SERVICE_PORT', 5000))
+    server = make_app()
+    print(f"Starting BunaSIEM ML Service (asyncio, {server['workers']} {server['executor_kind']} workers, "
+          f"max {server['limit'].limit} in flight) on port {port}")
+    web.run_app(server, host='0.0.0.0', port=port, print=None)
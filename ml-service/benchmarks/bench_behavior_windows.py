@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Behavioral Windows Benchmark
+Measures sliding-window ingest throughput over many distinct IPs and users
+"""
+
+import argparse
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.behavior_windows import BehaviorWindows
+
+
+def make_events(n_events, n_keys, rate, seed=0):
+    """Synthetic logs spread over n_keys IPs and n_keys // 4 users, arriving at ``rate`` per second"""
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 15, 8, 0, 0)
+    events = []
+    for i in range(n_events):
+        key = rng.randrange(n_keys)
+        events.append({
+            'event_time': (start + timedelta(seconds=i / rate)).isoformat(),
+            'source_ip': f"196.{key // 65536 % 256}.{key // 256 % 256}.{key % 256}",
+            'username': f"user{key // 4}@bunasiem.et",
+            'failed_attempts': rng.choice((0, 0, 0, 1, 3)),
+        })
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark per-IP/user sliding windows')
+    parser.add_argument('--events', type=int, default=2000000)
+    parser.add_argument('--keys', type=int, default=1000000, help='distinct source IPs')
+    parser.add_argument('--max-keys', type=int, default=1000000)
+    parser.add_argument('--rate', type=float, default=50000, help='simulated events per second of event time')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    print("BunaSIEM Behavioral Windows Benchmark")
+    events = make_events(args.events, args.keys, args.rate)
+    windows = BehaviorWindows(max_keys=args.max_keys)
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    for offset in range(0, len(events), args.batch_size):
+        windows.observe_many(events[offset:offset + args.batch_size])
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    stats = windows.stats()
+    print(f"{args.events} events over {args.keys} IPs: {args.events / elapsed:,.0f} events/s")
+    print(f"keys held: {stats['ip_keys']} IPs, {stats['user_keys']} users, {stats['evictions']} evictions")
+    print(f"window slabs {stats['memory_bytes'] / 2**20:.1f} MB, "
+          f"peak RSS growth {(rss_after - rss_before) / 1024:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
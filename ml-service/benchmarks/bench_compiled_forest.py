@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Compiled Forest Benchmark
+Compares sklearn's decision_function with the packed-array forest
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.anomaly_detector import DEFAULT_MODEL_PATH
+from models.compiled_forest import CompiledForest
+
+
+def timeit(fn, X, repeat):
+    fn(X)  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(X)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compiled IsolationForest inference')
+    parser.add_argument('--model', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--sizes', default='1,64,10000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    forest = CompiledForest.from_model(model)
+    rng = np.random.default_rng(0)
+
+    print("BunaSIEM Compiled Forest Benchmark")
+    print(f"{forest.n_trees} trees, {len(forest.feature)} nodes, depth {forest.max_depth}")
+    print(f"{'batch':>7} {'sklearn':>12} {'compiled':>12} {'speedup':>8} {'max err':>9}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        X = rng.normal(5, 10, (size, forest.n_features))
+        repeat = max(3, args.repeat if size < 1000 else args.repeat // 4)
+        sklearn_s = timeit(model.decision_function, X, repeat)
+        compiled_s = timeit(forest.decision_function, X, repeat)
+        error = forest.max_abs_error(model, X)
+        print(f"{size:>7} {sklearn_s * 1e3:>10.3f}ms {compiled_s * 1e3:>10.3f}ms "
+              f"{sklearn_s / compiled_s:>7.1f}x {error:>9.1e}")
+
+
+if __name__ == '__main__':
+    main()
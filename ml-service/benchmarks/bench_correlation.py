@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Sequence Correlation Benchmark
+Events per second through SequenceCorrelator.observe_many with the default
+sequence rules, on the benchmark corpus with brute-force and exfiltration
+sequences mixed in, and with every event opening state for a new address to
+show memory staying at ML_CORRELATION_MAX_KEYS rows.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus
+from models.log_normalizer import LogNormalizer
+from models.pattern_matcher import PatternMatcher
+from models.sequence_correlation import SequenceCorrelator
+
+START = datetime(2025, 1, 15, 18, 0)
+
+
+def attack_logs(n, seed=0):
+    """``n`` logs of interleaved brute-force and exfiltration sequences, one entity each"""
+    rng = random.Random(seed)
+    logs = []
+    for i in range(n // 5):
+        at = START + timedelta(seconds=i)
+        if i % 2:
+            ip = f"196.188.{i // 256 % 256}.{i % 256}"
+            for step in range(3):
+                logs.append({'event_time': (at + timedelta(seconds=step * 30)).isoformat(), 'event_type': 'FailedLogin',
+                             'source_ip': ip, 'failed_attempts': rng.randint(3, 6)})
+            logs.append({'event_time': (at + timedelta(seconds=120)).isoformat(), 'event_type': 'ConsoleLogin',
+                         'source_ip': ip})
+        else:
+            user = f"user{i}@ethiotelecom.et"
+            logs.append({'event_time': (at + timedelta(hours=3)).isoformat(), 'event_type': 'UserLogin', 'username': user})
+            logs.append({'event_time': (at + timedelta(hours=4)).isoformat(), 'event_type': 'DataTransfer',
+                         'username': user, 'bytes_transferred': 2 * 10 ** 9})
+        logs.append({'event_time': at.isoformat(), 'event_type': 'NetworkAccess', 'source_ip': '10.10.1.1'})
+    return logs
+
+
+def unique_entities(n, offset=0):
+    """Failed logins from ``n`` distinct addresses: each one opens a partial match"""
+    return [{'event_time': (START + timedelta(milliseconds=i)).isoformat(), 'event_type': 'FailedLogin',
+             'source_ip': f"10.{(offset + i) >> 16 & 255}.{(offset + i) >> 8 & 255}.{(offset + i) & 255}",
+             'username': f"u{offset + i}", 'failed_attempts': 1}
+            for i in range(n)]
+
+
+def run(correlator, batches):
+    events = incidents = 0
+    start = time.perf_counter()
+    for logs in batches:
+        incidents += sum(len(found) for found in correlator.observe_many(logs))
+        events += len(logs)
+    return events, incidents, time.perf_counter() - start
+
+
+def report(label, correlator, events, incidents, seconds):
+    stats = correlator.stats()
+    print(f"{label:>22} {events:>10,} {events / seconds:>12,.0f} {incidents:>10,} {stats['keys']:>9,} "
+          f"{stats['memory_bytes'] / 2 ** 20:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark multi-step sequence correlation throughput')
+    parser.add_argument('--corpus', default='100k', help="corpus size: 1k, 100k, 10m or a log count")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--entities', default='2m', help='distinct addresses for the key-bound case')
+    parser.add_argument('--max-keys', type=int, default=200000)
+    args = parser.parse_args()
+
+    matcher = PatternMatcher()
+    normalizer = LogNormalizer()
+    n = corpus.parse_size(args.corpus)
+    batches = [normalizer.normalize(batch) for batch in corpus.iter_batches(n, args.batch_size)]
+    attacks = attack_logs(len(batches) * args.batch_size // 10)
+    # One tenth attack traffic in every batch
+    share = max(1, len(attacks) // max(len(batches), 1))
+    mixed = [batch + attacks[i * share:(i + 1) * share] for i, batch in enumerate(batches)]
+
+    print("BunaSIEM Sequence Correlation Benchmark")
+    print(f"{'case':>22} {'events':>10} {'events/s':>12} {'incidents':>10} {'keys':>9} {'MiB':>8}")
+    correlator = SequenceCorrelator(matcher, max_keys=args.max_keys)
+    report('corpus + attacks', correlator, *run(correlator, mixed))
+
+    entities = corpus.parse_size(args.entities)
+    correlator = SequenceCorrelator(matcher, max_keys=args.max_keys)
+    batches = (unique_entities(min(args.batch_size, entities - offset), offset)
+               for offset in range(0, entities, args.batch_size))
+    report(f"{entities:,} entities", correlator, *run(correlator, batches))
+    stats = correlator.stats()['sequences']
+    print(f"evicted: {sum(s['evictions'] for s in stats.values()):,}, "
+          f"expired: {sum(s['expired'] for s in stats.values()):,}")
+
+
+if __name__ == '__main__':
+    main()
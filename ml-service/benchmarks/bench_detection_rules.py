@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Detection Rule Benchmark
+Times PatternMatcher.rule_flags on one batch as the pattern rule count grows, with
+the rules compiled together (shared sub-expressions, indexed equality/IN and
+ip_range tests) and with every rule compiled on its own.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus
+from models.detection_rules import DEFAULT_RULES_PATH, DetectionRuleStore, RuleSet
+from models.log_normalizer import LogNormalizer
+from models.pattern_matcher import PatternMatcher
+
+CITIES = ['Addis Ababa', 'Dire Dawa', 'Adama', 'Hawassa', 'Mekele', 'Bahir Dar', 'Gondar', 'Jimma', 'Nairobi', 'Dubai']
+EVENT_TYPES = ['ConsoleLogin', 'SignIn', 'CreateBucket', 'DeleteBucket', 'CreateStack', 'UpdateStack', 'FailedLogin',
+               'NetworkAccess', 'ModifyDBInstance', 'DeleteSecurityGroup', 'AssumeRole', 'PutObject']
+
+
+def synthetic_rules(count, seed=0):
+    """``count`` pattern rules of the shapes tuning usually adds: selections on
+    event type, city or address block, each narrowed by a threshold or a time window"""
+    rng = random.Random(seed)
+    rules = []
+    for i in range(count):
+        events = ', '.join(f"'{e}'" for e in rng.sample(EVENT_TYPES, rng.randint(1, 3)))
+        shape = i % 5
+        if shape == 0:
+            condition = f"event_type IN ({events}) AND bytes_transferred > {rng.randint(1, 20) * 1000000}"
+        elif shape == 1:
+            condition = f"city = '{rng.choice(CITIES)}' AND failed_attempts >= {rng.randint(1, 8)}"
+        elif shape == 2:
+            condition = (f"country_code != 'ET' AND event_type IN ({events}) AND "
+                         f"(time_of_day < '0{rng.randint(5, 8)}:30' OR time_of_day > '{rng.randint(17, 21)}:00')")
+        elif shape == 3:
+            condition = f"ip_range = '196.188.{rng.randint(0, 255)}.0/24' AND event_type IN ({events})"
+        else:
+            condition = f"ethiopian_ip AND event_type = '{rng.choice(EVENT_TYPES)}' AND NOT business_hours"
+        rules.append({'name': f"synthetic_{i}", 'description': f"Synthetic rule {i}",
+                      'severity': rng.choice(['low', 'medium', 'high']), 'rule_content': {'condition': condition}})
+    return rules
+
+
+class _FixedRules:
+    """Store stand-in serving one prebuilt RuleSet"""
+
+    def __init__(self, ruleset):
+        self.snapshot = ruleset
+
+
+def separate_flags(matcher, rulesets, logs):
+    """rule_flags with each rule in its own RuleSet: nothing shared between rules"""
+    results = []
+    for ruleset in rulesets:
+        matcher.rules = _FixedRules(ruleset)
+        results.append(matcher.rule_flags(logs))
+    return results
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark compiled detection rules against the rule count')
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--rule-counts', default='10,100,300,1000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logs = LogNormalizer().normalize(list(corpus.generate(args.batch_size, seed=7)))
+    store = DetectionRuleStore(DEFAULT_RULES_PATH)
+    default_rules = store.snapshot
+    baseline = [record for path in store.rule_files() for record in store.read_rules(path)]
+
+    print("BunaSIEM Detection Rule Benchmark")
+    print(f"{args.batch_size:,} logs; default rule set: {len(default_rules.rules['patterns'])} pattern rules")
+    print(f"{'pattern rules':>14} {'nodes':>7} {'compiled ms':>12} {'separate ms':>12} {'vs default':>11} {'compile ms':>11}")
+
+    matcher = PatternMatcher(rules=_FixedRules(default_rules))
+    default_seconds = best_of(lambda: matcher.rule_flags(logs), args.repeat)
+    print(f"{len(default_rules.rules['patterns']):>14} {default_rules.stats()['nodes']:>7} "
+          f"{default_seconds * 1000:>12.1f} {'':>12} {1:>10.2f}x {'':>11}")
+
+    for count in [int(c) for c in args.rule_counts.split(',')]:
+        records = baseline + synthetic_rules(count)
+        start = time.perf_counter()
+        ruleset = RuleSet(records)
+        compile_seconds = time.perf_counter() - start
+        matcher.rules = _FixedRules(ruleset)
+        compiled = best_of(lambda: matcher.rule_flags(logs), args.repeat)
+        singles = [RuleSet([record]) for record in records
+                   if record['rule_content'].get('target', 'patterns') == 'patterns']
+        separate = best_of(lambda: separate_flags(matcher, singles, logs), 1)
+        total = len(ruleset.rules['patterns'])
+        print(f"{total:>14} {ruleset.stats()['nodes']:>7} {compiled * 1000:>12.1f} {separate * 1000:>12.1f} "
+              f"{compiled / default_seconds:>10.2f}x {compile_seconds * 1000:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
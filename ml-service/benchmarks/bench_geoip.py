@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM GeoIP Benchmark
+Build and open time of the range file, batch and hot-IP lookup throughput
+against a bisect over parsed addresses, and the private memory a worker
+process adds when it maps the file
+"""
+
+import argparse
+import bisect
+import ipaddress
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from models.geoip import GeoIPResolver, build_geoip
+
+CITIES = [('ET', 'Addis Ababa', 'Addis Ababa'), ('ET', 'Oromia', 'Adama'), ('ET', 'Sidama', 'Hawassa'),
+          ('ET', 'Dire Dawa', 'Dire Dawa'), ('ET', 'Tigray', 'Mekele'), ('KE', 'Nairobi', 'Nairobi'),
+          ('US', 'Virginia', 'Ashburn'), ('DE', 'Hesse', 'Frankfurt')]
+
+# Maps the file and reports how much its resident memory grows, private and file-backed, while it resolves the queries
+WORKER_CHILD = """
+import sys
+sys.path.insert(0, {root!r})
+from models.geoip import GeoIPResolver
+def status(field):
+    with open('/proc/self/status') as f:
+        return next(int(line.split()[1]) for line in f if line.startswith(field + ':')) / 1024
+with open({queries!r}) as f:
+    queries = f.read().split()
+resolver = GeoIPResolver({path!r})
+resolver.lookup_many(queries[:10])
+private, mapped = status('RssAnon'), status('RssFile')
+for _ in range(3):
+    resolver.lookup_many(queries)
+print(status('RssAnon') - private, status('RssFile') - mapped)
+"""
+
+
+def write_csv(path, n_v4, n_v6, seed=0):
+    """Disjoint random ranges; returns the IPv4 and IPv6 (start, end, location) tables"""
+    rng = random.Random(seed)
+    tables = {4: [], 6: []}
+    with open(path, 'w') as f:
+        f.write('start_ip,end_ip,country_code,region,city\n')
+        for version, n, bits, address in ((4, n_v4, 32, ipaddress.IPv4Address), (6, n_v6, 128, ipaddress.IPv6Address)):
+            step = (1 << bits) // (n + 1)
+            for i in range(n):
+                start = i * step + rng.randrange(step // 2)
+                end = start + rng.randrange(step // 2)
+                location = CITIES[rng.randrange(len(CITIES))]
+                tables[version].append((start, end, location))
+                f.write(f"{address(start)},{address(end)},{','.join(location)}\n")
+    return tables
+
+
+def make_queries(tables, n, seed=1):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        version = 4 if rng.random() < 0.9 else 6
+        start, end, _ = tables[version][rng.randrange(len(tables[version]))]
+        value = rng.choice([start, end, end + 1, rng.randrange(1 << (32 if version == 4 else 128))])
+        value %= 1 << (32 if version == 4 else 128)
+        queries.append(str(ipaddress.IPv4Address(value) if version == 4 else ipaddress.IPv6Address(value)))
+    return queries
+
+
+class BisectResolver:
+    """Baseline: ranges in Python lists, one ipaddress parse and bisect per query"""
+
+    def __init__(self, tables):
+        self.tables = {version: sorted(table) for version, table in tables.items()}
+        self.starts = {version: [r[0] for r in table] for version, table in self.tables.items()}
+
+    def lookup(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        value = int(address)
+        i = bisect.bisect_right(self.starts[address.version], value) - 1
+        table = self.tables[address.version]
+        return table[i][2] if i >= 0 and value <= table[i][1] else None
+
+
+def best(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the memory-mapped GeoIP resolver')
+    parser.add_argument('--ipv4-ranges', type=int, default=500000)
+    parser.add_argument('--ipv6-ranges', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=100000)
+    parser.add_argument('--hot-ips', type=int, default=1000, help='distinct addresses in the hot-IP run')
+    parser.add_argument('--workers', type=int, default=4, help='processes mapping the file at once')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-geoip-')
+    csv_path = os.path.join(workdir, 'geoip.csv')
+    db_path = os.path.join(workdir, 'geoip.bin')
+    tables = write_csv(csv_path, args.ipv4_ranges, args.ipv6_ranges)
+    queries = make_queries(tables, args.queries)
+
+    print("BunaSIEM GeoIP Benchmark")
+    start = time.perf_counter()
+    summary = build_geoip(csv_path, db_path)
+    print(f"build: {time.perf_counter() - start:.2f}s, {summary['ipv4_ranges']:,} IPv4 + "
+          f"{summary['ipv6_ranges']:,} IPv6 ranges, {summary['bytes'] / 2 ** 20:.1f} MB "
+          f"(CSV {os.path.getsize(csv_path) / 2 ** 20:.1f} MB)")
+    print(f"open: {best(lambda: GeoIPResolver(db_path), args.repeat) * 1e3:.3f} ms")
+
+    resolver = GeoIPResolver(db_path)
+    baseline = BisectResolver(tables)
+    expected = [baseline.lookup(ip) for ip in queries]
+    got = [resolver.location(i) if i >= 0 else None for i in resolver.lookup_many(queries).tolist()]
+    assert got == expected, 'resolver disagrees with the bisect baseline'
+
+    rows = [
+        ('bisect per IP', lambda: [baseline.lookup(ip) for ip in queries]),
+        ('lookup_many', lambda: resolver.lookup_many(queries)),
+        ('locate_many, cold LRU', lambda: GeoIPResolver(db_path, cache_size=len(queries)).locate_many(queries)),
+    ]
+    hot = queries[:args.hot_ips] * (len(queries) // args.hot_ips)
+    warm = GeoIPResolver(db_path, cache_size=args.hot_ips)
+    warm.locate_many(hot)
+    rows.append((f'locate_many, {args.hot_ips} hot IPs', lambda: warm.locate_many(hot)))
+    logs = [{'source_ip': ip, 'event_type': 'ConsoleLogin'} for ip in hot]
+    rows.append(('enrich, hot IPs', lambda: warm.enrich(logs)))
+    for label, fn in rows:
+        print(f"{label:>28}: {len(queries) / best(fn, args.repeat):>12,.0f} IPs/s")
+
+    queries_path = os.path.join(workdir, 'queries.txt')
+    with open(queries_path, 'w') as f:
+        f.write('\n'.join(queries))
+    code = WORKER_CHILD.format(root=ROOT, path=db_path, queries=queries_path)
+    children = [subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, text=True)
+                for _ in range(args.workers)]
+    for i, child in enumerate(children):
+        private, file_backed = map(float, child.communicate()[0].split())
+        print(f"worker {i}: +{private:.1f} MB private, +{file_backed:.1f} MB file-backed (shared page cache) "
+              f"over {len(queries):,} lookups")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Instrumentation Overhead Benchmark
+Times /predict/anomaly and /analyze/batch through the Flask app with metrics off, on, and on with the profiler.
+
+Wall-clock differences of a few percent are within run-to-run noise, so the
+overhead is also computed directly: timed calls per request x the cost of one
+timed call, and the profiler's per-sample cost x its sampling rate.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_wire_format import make_logs
+
+CONFIGS = [
+    ('metrics off', {'ML_METRICS': '0'}),
+    ('metrics on', {'ML_METRICS': '1'}),
+    # Threshold above any request here: samples every request, writes nothing
+    ('metrics + profiler', {'ML_METRICS': '1', 'ML_PROFILE_SLOW_MS': '60000'}),
+]
+
+
+def timer_cost(n_calls=200000):
+    """Seconds a ``timed`` wrapper adds to one call"""
+    from models.instrumentation import Instrumentation, timed
+    import models.instrumentation as instrumentation
+
+    def noop():
+        return None
+
+    enabled = instrumentation.INSTRUMENTATION
+    instrumentation.INSTRUMENTATION = Instrumentation(enabled=True)
+    try:
+        wrapped = timed('parse')(noop)
+    finally:
+        instrumentation.INSTRUMENTATION = enabled
+    costs = []
+    for fn in (noop, wrapped):
+        best = float('inf')
+        for _ in range(5):
+            start = time.perf_counter()
+            for _ in range(n_calls):
+                fn()
+            best = min(best, (time.perf_counter() - start) / n_calls)
+        costs.append(best)
+    return costs[1] - costs[0]
+
+
+def sample_cost(depth=60, n_samples=2000):
+    """Seconds the profiler spends on one stack sample of a ``depth``-frame stack"""
+    from models.instrumentation import _fold
+
+    def recurse(n):
+        if n:
+            return recurse(n - 1)
+        frame = sys._getframe()
+        start = time.perf_counter()
+        for _ in range(n_samples):
+            _fold(frame)
+        return (time.perf_counter() - start) / n_samples
+    return recurse(depth)
+
+
+def measure(args):
+    """Best seconds per request and timed calls per request for each endpoint, in this process's configuration"""
+    import app as service
+    from models.instrumentation import INSTRUMENTATION
+    client = service.app.test_client()
+    single = make_logs(1, seed=1)[0]
+    batch = {'logs': make_logs(args.batch_size, seed=2)}
+    cases = {
+        '/predict/anomaly': (lambda: client.post('/predict/anomaly', json=single), args.requests),
+        '/analyze/batch': (lambda: client.post('/analyze/batch', json=batch), max(1, args.requests // 50)),
+    }
+    results = {}
+    for name, (call, n_requests) in cases.items():
+        before = sum(histogram.count for histogram in INSTRUMENTATION.stages.values())
+        call()
+        # Stage observations plus the request histogram
+        observations = sum(histogram.count for histogram in INSTRUMENTATION.stages.values()) - before + 1
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for _ in range(n_requests):
+                call()
+            best = min(best, (time.perf_counter() - start) / n_requests)
+        results[name] = {'seconds': best, 'observations': observations}
+    results['timer_cost'] = timer_cost()
+    results['sample_cost'] = sample_cost()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cost of stage timers and the slow-request profiler')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--rounds', type=int, default=3, help='alternating runs of every configuration')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args)))
+        return
+
+    print("BunaSIEM Instrumentation Overhead Benchmark")
+    best = {}
+    with tempfile.TemporaryDirectory() as profile_dir:
+        for _ in range(args.rounds):
+            for label, overrides in CONFIGS:
+                env = {k: v for k, v in os.environ.items() if k not in ('ML_METRICS', 'ML_PROFILE_SLOW_MS')}
+                env.update(overrides, ML_PROFILE_DIR=profile_dir)
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child',
+                                         '--requests', str(args.requests), '--batch-size', str(args.batch_size),
+                                         '--repeat', str(args.repeat)],
+                                        env=env, capture_output=True, text=True, check=True).stdout
+                results = json.loads(output.strip().splitlines()[-1])
+                costs = {key: results.pop(key) for key in ('timer_cost', 'sample_cost')}
+                for endpoint, result in results.items():
+                    key = (label, endpoint)
+                    if key not in best or result['seconds'] < best[key]['seconds']:
+                        best[key] = result
+                for key, cost in costs.items():
+                    best[key] = min(best.get(key, float('inf')), cost)
+
+    print(f"{'configuration':>20} {'endpoint':>18} {'ms/request':>11} {'wall-clock':>11}")
+    for label, _ in CONFIGS:
+        for endpoint in ('/predict/anomaly', '/analyze/batch'):
+            seconds = best[(label, endpoint)]['seconds']
+            baseline = best[(CONFIGS[0][0], endpoint)]['seconds']
+            print(f"{label:>20} {endpoint:>18} {seconds * 1000:>11.3f} {(seconds / baseline - 1) * 100:>10.2f}%")
+
+    interval = float(os.getenv('ML_PROFILE_INTERVAL_MS', 5)) / 1000.0
+    print(f"\ntimed call: {best['timer_cost'] * 1e6:.2f} us, stack sample: {best['sample_cost'] * 1e6:.1f} us "
+          f"every {interval * 1000:g} ms while a request runs")
+    print(f"{'endpoint':>18} {'timed calls':>12} {'metrics':>9} {'profiler':>9}")
+    for endpoint in ('/predict/anomaly', '/analyze/batch'):
+        result = best[(CONFIGS[1][0], endpoint)]
+        metrics_share = result['observations'] * best['timer_cost'] / best[(CONFIGS[0][0], endpoint)]['seconds']
+        profiler_share = best['sample_cost'] / interval
+        print(f"{endpoint:>18} {result['observations']:>12} {metrics_share * 100:>8.3f}% {profiler_share * 100:>8.3f}%")
+
+
+if __name__ == '__main__':
+    main()
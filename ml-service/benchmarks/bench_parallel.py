@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Parallel Scaling Benchmark
+Measures tree fitting (n_jobs) and batch scoring (process pool) speedup per core count
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.feature_schema import DETECTOR_FEATURES
+from models.model_registry import ModelRegistry
+from models.parallel_scoring import ParallelScorer
+
+
+def fit_seconds(X, n_estimators, max_samples, n_jobs):
+    model = IsolationForest(n_estimators=n_estimators, max_samples=max_samples,
+                            contamination=0.1, random_state=42, n_jobs=n_jobs)
+    start = time.perf_counter()
+    model.fit(X)
+    return time.perf_counter() - start, model
+
+
+def score_seconds(registry, version, model, X, cores, repeat):
+    if cores == 1:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            scores = model.decision_function(X)
+        return (time.perf_counter() - start) / repeat, scores
+
+    scorer = ParallelScorer(registry, version, cores, min_rows=0)
+    try:
+        scorer.decision_function(X[:cores])  # spawn and load the workers outside the timing
+        start = time.perf_counter()
+        for _ in range(repeat):
+            scores = scorer.decision_function(X)
+        return (time.perf_counter() - start) / repeat, scores
+    finally:
+        scorer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel training and scoring')
+    parser.add_argument('--cores', default='1,4,16,32', help='comma-separated core counts')
+    parser.add_argument('--train-rows', type=int, default=200000)
+    parser.add_argument('--score-rows', type=int, default=1000000)
+    parser.add_argument('--n-estimators', type=int, default=200)
+    parser.add_argument('--max-samples', default='4096', help="rows per tree, or 'auto'")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    cores = [int(c) for c in args.cores.split(',')]
+    max_samples = args.max_samples if args.max_samples == 'auto' else int(args.max_samples)
+    available = os.cpu_count() or 1
+    rng = np.random.default_rng(0)
+    X_train = rng.normal(0, 20, (args.train_rows, len(DETECTOR_FEATURES)))
+    X_score = rng.normal(0, 20, (args.score_rows, len(DETECTOR_FEATURES)))
+
+    print("BunaSIEM Parallel Scaling Benchmark")
+    print(f"{available} CPUs available; {args.n_estimators} trees, max_samples={args.max_samples}, "
+          f"fit on {args.train_rows} rows, score {args.score_rows} rows")
+    if max(cores) > available:
+        print(f"note: core counts above {available} are oversubscribed and will not scale")
+
+    registry = ModelRegistry(tempfile.mkdtemp(prefix='bench-parallel-'))
+    _, model = fit_seconds(X_train, args.n_estimators, max_samples, 1)
+    version = registry.save(model, extra={'source': 'benchmarks/bench_parallel.py'}, make_current=False)['version']
+    model, _ = registry.load(version)
+
+    print(f"{'cores':>5} {'fit s':>8} {'speedup':>8} {'eff':>6} {'score s':>8} {'rows/s':>12} {'speedup':>8} {'eff':>6}")
+    base_fit = base_score = reference = None
+    for n in cores:
+        fit_time, _ = fit_seconds(X_train, args.n_estimators, max_samples, n)
+        score_time, scores = score_seconds(registry, version, model, X_score, n, args.repeat)
+        if reference is None:
+            reference = scores
+        elif not np.array_equal(scores, reference):
+            print(f"warning: scores with {n} cores differ from the first run")
+        base_fit = base_fit or fit_time
+        base_score = base_score or score_time
+        fit_speedup = base_fit / fit_time
+        score_speedup = base_score / score_time
+        print(f"{n:>5} {fit_time:>8.2f} {fit_speedup:>7.2f}x {fit_speedup / n:>6.0%} "
+              f"{score_time:>8.2f} {args.score_rows / score_time:>12,.0f} {score_speedup:>7.2f}x {score_speedup / n:>6.0%}")
+
+
+if __name__ == '__main__':
+    main()
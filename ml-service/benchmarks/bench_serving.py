@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Serving Benchmark
+Load-tests the ML service under the Flask dev server and the pre-fork server
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+ML_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SAMPLE_LOG = {
+    'event_time': '2025-01-15T02:15:00+03:00',
+    'event_type': 'FailedLogin',
+    'source_ip': '196.188.34.100',
+    'country_code': 'ET',
+    'city': 'Dire Dawa',
+    'failed_attempts': 8,
+    'bytes_transferred': 128,
+}
+
+SERVERS = {
+    'dev': [sys.executable, 'app.py'],
+    'prefork': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+}
+
+
+def start_server(mode, port, env_overrides):
+    env = dict(os.environ, ML_SERVICE_PORT=str(port), NODE_ENV='production', **env_overrides)
+    process = subprocess.Popen(SERVERS[mode], cwd=ML_SERVICE_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{mode} server did not become healthy on port {port}")
+
+
+def run_load(port, path, body, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+    payload = json.dumps(body).encode()
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                connection.request('POST', path, payload, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except OSError:
+                ok = False
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            if ok:
+                local.append(time.perf_counter() - start)
+            else:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'rps': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1e3 if latencies else None,
+        'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1e3 if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the BunaSIEM ML service')
+    parser.add_argument('--modes', default='dev,prefork')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--workers', default=None, help='ML_WORKERS for the pre-fork server')
+    parser.add_argument('--threads', default=None, help='ML_THREADS for the pre-fork server')
+    parser.add_argument('--coalesce-ms', default=None, help='ML_COALESCE_MAX_WAIT_MS (enables micro-batching)')
+    args = parser.parse_args()
+
+    env = {'THREAT_INTEL_RELOAD_SECONDS': '0'}
+    if args.workers:
+        env['ML_WORKERS'] = args.workers
+    if args.threads:
+        env['ML_THREADS'] = args.threads
+    if args.coalesce_ms:
+        env['ML_COALESCE_MAX_WAIT_MS'] = args.coalesce_ms
+
+    scenarios = [
+        ('/predict/anomaly', SAMPLE_LOG),
+        ('/analyze/batch', {'logs': [SAMPLE_LOG] * args.batch_size}),
+    ]
+
+    print("BunaSIEM Serving Benchmark")
+    print(f"concurrency={args.concurrency} duration={args.duration}s")
+    for mode in args.modes.split(','):
+        process = start_server(mode, args.port, env)
+        try:
+            for path, body in scenarios:
+                result = run_load(args.port, path, body, args.concurrency, args.duration)
+                print(f"{mode:>8} {path:<18} {result['rps']:8.1f} req/s  "
+                      f"p50 {result['p50_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms  "
+                      f"errors {result['errors']}")
+        finally:
+            process.terminate()
+            process.wait(timeout=60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Startup Benchmark
+Cold-start cost of the one-off prediction CLI and of the service, each run in
+fresh interpreters: process wall time, import time, time to a ready model, and
+the first and second requests, with and without the startup warm-up
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from models.anomaly_detector import DEFAULT_MODEL_PATH
+from models.model_registry import ModelRegistry
+
+LOG = {'event_time': '2025-01-15T02:10:00Z', 'source_ip': '203.0.113.7', 'event_type': 'FailedLogin',
+       'failed_attempts': 6, 'city': 'Unknown', 'country_code': 'US'}
+
+RESULT_MARKER = 'STARTUP_RESULT '
+
+# What scripts/predict.py does
+CLI_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from models.anomaly_detector import AnomalyDetector
+imported = time.perf_counter()
+detector = AnomalyDetector(strict=True)
+ready = time.perf_counter()
+detector.predict({log!r})
+first = time.perf_counter()
+detector.predict({log!r})
+second = time.perf_counter()
+print({marker!r} + json.dumps({{
+    'import': imported - start, 'ready': ready - imported, 'warmup': 0.0,
+    'first': first - ready, 'second': second - first,
+    'sklearn': 'sklearn' in sys.modules, 'pandas': 'pandas' in sys.modules}}))
+"""
+
+# Importing app loads the models and runs the warm-up; then one single-log and one batch request, twice
+SERVICE_CHILD = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+ready = time.perf_counter()
+client = app.app.test_client()
+batch = {{'logs': [dict({log!r}, source_ip='196.188.1.%d' % i) for i in range({batch})]}}
+def requests():
+    began = time.perf_counter()
+    assert client.post('/predict/anomaly', json={log!r}).status_code == 200
+    assert client.post('/analyze/batch', json=batch).status_code == 200
+    return time.perf_counter() - began
+first = requests()
+second = requests()
+print({marker!r} + json.dumps({{
+    'import': ready - start, 'ready': app.anomaly_detector.model_info['startup_seconds'],
+    'warmup': app.warmup.seconds or 0.0, 'first': first, 'second': second,
+    'sklearn': 'sklearn' in sys.modules, 'pandas': 'pandas' in sys.modules}}))
+"""
+
+
+def run_child(code, env):
+    """Timings a child reports, plus the wall time of the whole process"""
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, cwd=ROOT)
+    wall = time.perf_counter() - start
+    lines = [line for line in out.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+    if out.returncode != 0 or not lines:
+        raise RuntimeError(f"startup child failed:\n{out.stdout[-2000:]}{out.stderr[-2000:]}")
+    return dict(json.loads(lines[-1][len(RESULT_MARKER):]), wall=wall)
+
+
+def median_of(runs):
+    merged = {key: statistics.median(run[key] for run in runs) for key in runs[0] if not isinstance(runs[0][key], bool)}
+    merged.update({key: runs[0][key] for key in runs[0] if isinstance(runs[0][key], bool)})
+    return merged
+
+
+def import_profile(env, top):
+    """The ``top`` slowest imports (cumulative) of ``import app``, from python -X importtime"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], env=env,
+                         capture_output=True, text=True, cwd=ROOT)
+    rows = []
+    for line in out.stderr.splitlines():
+        parts = line.split('|')
+        if line.startswith('import time:') and len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cold start of the prediction CLI and the service')
+    parser.add_argument('--model', default=os.getenv('MODEL_PATH', DEFAULT_MODEL_PATH),
+                        help='model pickle registered into a scratch registry')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per case; medians are reported')
+    parser.add_argument('--batch', type=int, default=5000,
+                        help='logs in the /analyze/batch request; above ML_COMPILED_FOREST_MAX_ROWS it needs sklearn')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='also list the N slowest imports of app.py')
+    args = parser.parse_args()
+
+    import joblib
+    registry = ModelRegistry(tempfile.mkdtemp(prefix='bench-startup-'))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        model = joblib.load(args.model)
+    registry.save(model, extra={'source': 'benchmarks/bench_startup.py'})
+    empty_registry = tempfile.mkdtemp(prefix='bench-startup-empty-')
+
+    base = dict(os.environ, MODEL_REGISTRY_DIR=registry.root, MODEL_PATH=args.model, PYTHONWARNINGS='ignore')
+    cases = [
+        ('cli, registry forest', CLI_CHILD, {}),
+        ('cli, legacy pickle', CLI_CHILD, {'MODEL_REGISTRY_DIR': empty_registry}),
+        ('service, no warm-up', SERVICE_CHILD, {'ML_WARMUP': '0'}),
+        ('service, warm-up', SERVICE_CHILD, {'ML_WARMUP': '1'}),
+    ]
+
+    print("BunaSIEM Startup Benchmark")
+    print(f"median of {args.repeat} fresh interpreters; service requests are one /predict/anomaly "
+          f"and one /analyze/batch of {args.batch} logs")
+    print(f"{'case':>22} {'wall s':>8} {'import s':>9} {'model s':>8} {'warm-up s':>10} {'1st req s':>10} "
+          f"{'2nd req s':>10} {'sklearn':>8} {'pandas':>7}")
+    for label, template, env in cases:
+        code = template.format(root=ROOT, log=LOG, marker=RESULT_MARKER, batch=args.batch)
+        result = median_of([run_child(code, dict(base, **env)) for _ in range(args.repeat)])
+        print(f"{label:>22} {result['wall']:>8.3f} {result['import']:>9.3f} {result['ready']:>8.3f} "
+              f"{result['warmup']:>10.3f} {result['first']:>10.4f} {result['second']:>10.4f} "
+              f"{'loaded' if result['sklearn'] else '-':>8} {'loaded' if result['pandas'] else '-':>7}")
+
+    if args.importtime:
+        print("\nslowest imports of app.py (cumulative, ML_WARMUP=0):")
+        for micros, name in import_profile(dict(base, ML_WARMUP='0'), args.importtime):
+            print(f"{micros / 1e6:>8.3f}s {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Threat Intel Benchmark
+Memory per indicator and lookup latency for the indicator store
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.threat_intel import ThreatIntelSnapshot
+
+
+def generate_indicators(n, seed=42):
+    """Synthetic feed: 70% IPs, 20% domains, 10% hashes"""
+    rnd = random.Random(seed)
+    records = []
+    for i in range(n):
+        kind = rnd.random()
+        if kind < 0.7:
+            value = f"{rnd.randint(1, 223)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}"
+            indicator_type = 'ip_address'
+        elif kind < 0.9:
+            value = f"host{i}.bad-{rnd.randint(0, 99999)}.et"
+            indicator_type = 'domain'
+        else:
+            value = '%064x' % rnd.getrandbits(256)
+            indicator_type = 'hash'
+        records.append({
+            'indicator_type': indicator_type,
+            'indicator_value': value,
+            'threat_type': rnd.choice(['phishing', 'brute_force', 'malware', 'data_exfiltration']),
+            'confidence_level': rnd.choice(['low', 'medium', 'high']),
+            'is_ethiopian_origin': rnd.random() < 0.3,
+        })
+    return records
+
+
+def measure_memory(records):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    snapshot = ThreatIntelSnapshot(records)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return snapshot, (after - before) / max(len(snapshot), 1)
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def measure_lookups(snapshot, records, n_lookups, seed=7):
+    rnd = random.Random(seed)
+    hits = [r for r in rnd.sample(records, min(n_lookups // 2, len(records))) if r['indicator_type'] == 'ip_address']
+    logs = [{'source_ip': r['indicator_value']} for r in hits]
+    logs += [{'source_ip': f"203.0.{rnd.randint(0, 255)}.{rnd.randint(0, 255)}"} for _ in range(n_lookups - len(logs))]
+    rnd.shuffle(logs)
+
+    latencies = []
+    for log in logs:
+        start = time.perf_counter()
+        snapshot.match(log)
+        latencies.append(time.perf_counter() - start)
+    return {
+        'lookups': len(logs),
+        'p50_us': percentile(latencies, 0.50) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+        'lookups_per_sec': len(logs) / sum(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the threat intel indicator store')
+    parser.add_argument('--sizes', default='100000,1000000', help='comma separated indicator counts')
+    parser.add_argument('--lookups', type=int, default=200000)
+    args = parser.parse_args()
+
+    print("BunaSIEM Threat Intel Benchmark")
+    for size in [int(s) for s in args.sizes.split(',')]:
+        records = generate_indicators(size)
+        _, bytes_per_indicator = measure_memory(records)
+        start = time.perf_counter()
+        snapshot = ThreatIntelSnapshot(records)
+        build_seconds = time.perf_counter() - start
+        lookups = measure_lookups(snapshot, records, args.lookups)
+        print(f"{size:>10} indicators | {bytes_per_indicator:6.1f} B/indicator | build {build_seconds:6.2f}s | "
+              f"p50 {lookups['p50_us']:5.2f}us p99 {lookups['p99_us']:5.2f}us | "
+              f"{lookups['lookups_per_sec']:,.0f} lookups/s")
+
+
+if __name__ == '__main__':
+    main()
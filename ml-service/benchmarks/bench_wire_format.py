@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Wire Format Benchmark
+Compares payload size and encode/decode time of JSON, compact JSON, MessagePack and Arrow batch responses
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.anomaly_detector import AnomalyDetector
+from models import wire_format
+
+
+def make_logs(n_logs, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'event_time': f"2025-01-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        'source_ip': f"196.188.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+        'failed_attempts': rng.choice((0, 0, 1, 6)),
+        'request_count': rng.randint(1, 40),
+        'bytes_transferred': rng.randint(0, 2 * 10 ** 7),
+        'country_code': 'ET',
+        'city': rng.choice(('Addis Ababa', 'Adama', 'Gondar')),
+    } for _ in range(n_logs)]
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ML response wire formats')
+    parser.add_argument('--logs', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    detector = AnomalyDetector()
+    logs = make_logs(args.logs)
+    verbose = {'total_logs_analyzed': len(logs), 'ml_results': detector.predict_batch(logs)}
+    summary = {'total_logs_analyzed': len(logs), 'ml_metadata': detector.shared_result_fields()}
+    compact_results = detector.predict_batch(logs, compact=True)
+    compact = dict(summary, ml_results=compact_results)
+
+    cases = [
+        ('json', lambda: json.dumps(verbose).encode(), json.loads),
+        ('json compact', lambda: wire_format.encode(compact, wire_format.JSON), json.loads),
+    ]
+    if wire_format.MSGPACK in wire_format.available_formats():
+        import msgpack
+        cases.append(('msgpack compact', lambda: wire_format.encode(compact, wire_format.MSGPACK),
+                      lambda body: msgpack.unpackb(body, raw=False)))
+    if wire_format.ARROW in wire_format.available_formats(columnar=True):
+        import pyarrow.ipc
+        cases.append(('arrow', lambda: wire_format.ml_results_table(compact_results, summary),
+                      lambda body: pyarrow.ipc.open_stream(body).read_all()))
+
+    print("BunaSIEM Wire Format Benchmark")
+    print(f"{args.logs} logs per /analyze/batch response")
+    print(f"{'format':>16} {'bytes':>12} {'bytes/log':>10} {'encode ms':>10} {'decode ms':>10}")
+    for name, encode, decode in cases:
+        encode_seconds, body = timed(encode, args.repeat)
+        decode_seconds, _ = timed(lambda: decode(body), args.repeat)
+        print(f"{name:>16} {len(body):>12,} {len(body) / args.logs:>10.1f} "
+              f"{encode_seconds * 1000:>10.1f} {decode_seconds * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+BunaSIEM Benchmark Corpus
+Synthetic logs from scripts/generate_logs.py, cached as gzip NDJSON so large corpora never sit in memory
+"""
+
+import gzip
+import importlib.util
+import json
+import os
+import random
+import tempfile
+
+GENERATE_LOGS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scripts', 'generate_logs.py')
+CORPUS_DIR = os.getenv('ML_BENCH_CORPUS_DIR', os.path.join(tempfile.gettempdir(), 'bunasiem-bench-corpus'))
+
+# Named corpus sizes of the suite
+SIZES = {'1k': 1000, '100k': 100000, '10m': 10000000}
+
+
+def parse_size(text):
+    """Log count for '1k', '100k', '10M' or a plain integer"""
+    text = text.strip().lower()
+    if text in SIZES:
+        return SIZES[text]
+    for suffix, factor in (('k', 1000), ('m', 1000000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+
+def size_label(n):
+    for label, count in SIZES.items():
+        if count == n:
+            return label
+    return str(n)
+
+
+def load_generators():
+    """The CloudTrail, Azure Monitor and Ethio Telecom generators of scripts/generate_logs.py"""
+    spec = importlib.util.spec_from_file_location('generate_logs', GENERATE_LOGS)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return {
+        'aws_cloudtrail': module.generate_aws_log,
+        'azure_monitor': module.generate_azure_log,
+        'ethio_telecom': module.generate_ethio_telecom_log,
+    }
+
+
+def generate(n, seed=0):
+    """``n`` native-format logs, the three sources in random order"""
+    generators = list(load_generators().values())
+    # The generators draw from the module-level random state
+    random.seed(seed)
+    for _ in range(n):
+        yield random.choice(generators)()
+
+
+def corpus_path(n, seed=0):
+    """Path of the cached corpus of ``n`` logs, writing it first if needed"""
+    path = os.path.join(CORPUS_DIR, f"corpus-{n}-{seed}.ndjson.gz")
+    if os.path.exists(path):
+        return path
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    partial = path + '.partial'
+    print(f"Generating {n:,} logs into {path}")
+    # Low compression level: the 10M corpus is written once but read by every case
+    with gzip.open(partial, 'wt', compresslevel=1) as f:
+        for log in generate(n, seed):
+            f.write(json.dumps(log) + '\n')
+    os.replace(partial, path)
+    return path
+
+
+def iter_batches(n, batch_size, seed=0):
+    """The corpus of ``n`` logs as lists of at most ``batch_size`` logs, read from disk"""
+    batch = []
+    with gzip.open(corpus_path(n, seed), 'rt') as f:
+        for line in f:
+            batch.append(json.loads(line))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Benchmark Suite
+Single-log latency, batch throughput, memory high-water mark and cold start of the
+ML components and endpoints on 1k / 100k / 10M-log synthetic corpora, compared
+against a stored baseline.
+
+    python benchmarks/run_suite.py --sizes 1k,100k --save-baseline   # record a baseline
+    python benchmarks/run_suite.py --sizes 1k,100k                   # exit 1 on a regression
+
+Comparing without a baseline for every case exits 2; baselines are per machine,
+so record one on the base commit first. Every case runs in a fresh process, so
+cold start includes the imports and model loading it triggers and the memory
+figures belong to that case alone, net of the corpus held in memory.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import corpus
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'baseline.json')
+
+# metric -> (better direction, absolute change always treated as noise)
+METRICS = {
+    'cold_start_s': ('lower', 0.05),
+    'latency_p50_ms': ('lower', 0.02),
+    'latency_p99_ms': ('lower', 0.1),
+    'throughput_logs_per_s': ('higher', 0.0),
+    'peak_rss_mb': ('lower', 5.0),
+    'rss_growth_mb': ('lower', 5.0),
+}
+
+
+class Case:
+    """A component or endpoint under test.
+
+    ``setup`` is part of the measured cold start; ``prepare_*`` build inputs
+    outside the timed region. ``single`` / ``batch`` are None when a case has
+    no such path.
+    """
+
+    flat = True  # components get normalized logs, endpoints normalize their own
+    single = None
+    batch = None
+
+    def setup(self):
+        pass
+
+    def prepare_single(self, log):
+        return log
+
+    def prepare_batch(self, logs):
+        return logs
+
+
+class DetectorCase(Case):
+    def setup(self):
+        from models.anomaly_detector import AnomalyDetector
+        self.detector = AnomalyDetector()
+
+    def single(self, log):
+        return self.detector.predict(log)
+
+    def batch(self, logs):
+        return self.detector.predict_batch(logs)
+
+
+class PatternMatcherCase(Case):
+    def setup(self):
+        from models.pattern_matcher import PatternMatcher
+        self.matcher = PatternMatcher()
+
+    def prepare_single(self, log):
+        return [log]
+
+    def single(self, logs):
+        return self.matcher.detect_ethiopian_patterns(logs)
+
+    def batch(self, logs):
+        return self.matcher.detect_ethiopian_patterns(logs)
+
+
+class CorrelationCase(Case):
+    def setup(self):
+        from models.pattern_matcher import PatternMatcher
+        from models.sequence_correlation import SequenceCorrelator
+        self.correlator = SequenceCorrelator(PatternMatcher())
+
+    def prepare_single(self, log):
+        return [log]
+
+    def single(self, logs):
+        return self.correlator.observe_many(logs)
+
+    def batch(self, logs):
+        return self.correlator.observe_many(logs)
+
+
+class FeatureEngineerCase(Case):
+    def setup(self):
+        from scripts.feature_engineer import EthiopianFeatureEngineer
+        self.engineer = EthiopianFeatureEngineer()
+
+    def single(self, log):
+        return self.engineer.extract_features(log)
+
+    def batch(self, logs):
+        return self.engineer.extract_features_batch(logs)
+
+
+class NormalizerCase(Case):
+    flat = False
+
+    def setup(self):
+        from models.log_normalizer import LogNormalizer
+        self.normalizer = LogNormalizer()
+
+    def single(self, log):
+        return self.normalizer.normalize_one(log)
+
+    def batch(self, logs):
+        return self.normalizer.normalize(logs)
+
+
+class ThreatIntelCase(Case):
+    def setup(self):
+        from models.threat_intel import ThreatIntelStore
+        self.store = ThreatIntelStore()
+
+    def prepare_single(self, log):
+        return [log]
+
+    def single(self, logs):
+        return self.store.match_batch(logs)
+
+    def batch(self, logs):
+        return self.store.match_batch(logs)
+
+
+class EndpointCase(Case):
+    """An endpoint of app.py through the Flask test client (no network)"""
+
+    flat = False
+    path = None
+
+    def setup(self):
+        import app as service
+        self.client = service.app.test_client()
+
+    def post(self, body, content_type='application/json'):
+        response = self.client.post(self.path, data=body, content_type=content_type)
+        response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError(f"{self.path} answered {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response
+
+
+class PredictEndpointCase(EndpointCase):
+    path = '/predict/anomaly'
+
+    def prepare_single(self, log):
+        return json.dumps(log).encode()
+
+    def single(self, body):
+        return self.post(body)
+
+
+class BatchEndpointCase(EndpointCase):
+    path = '/analyze/batch'
+
+    def prepare_single(self, log):
+        return self.prepare_batch([log])
+
+    def prepare_batch(self, logs):
+        return json.dumps({'logs': logs}).encode()
+
+    def single(self, body):
+        return self.post(body)
+
+    def batch(self, body):
+        return self.post(body)
+
+
+class StreamEndpointCase(EndpointCase):
+    path = '/analyze/stream'
+
+    def prepare_single(self, log):
+        return self.prepare_batch([log])
+
+    def prepare_batch(self, logs):
+        return ''.join(json.dumps(log) + '\n' for log in logs).encode()
+
+    def single(self, body):
+        return self.post(body, 'application/x-ndjson')
+
+    def batch(self, body):
+        return self.post(body, 'application/x-ndjson')
+
+
+CASES = {
+    'detector': DetectorCase,
+    'pattern_matcher': PatternMatcherCase,
+    'correlation': CorrelationCase,
+    'feature_engineer': FeatureEngineerCase,
+    'normalizer': NormalizerCase,
+    'threat_intel': ThreatIntelCase,
+    '/predict/anomaly': PredictEndpointCase,
+    '/analyze/batch': BatchEndpointCase,
+    '/analyze/stream': StreamEndpointCase,
+}
+
+
+def _status_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb():
+    return _status_mb('VmRSS') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def peak_rss_mb():
+    return _status_mb('VmHWM') or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def reset_peak_rss():
+    """Restart the kernel's RSS high-water mark (Linux); elsewhere the peak covers the whole process"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def run_case(name, n, args):
+    """Measurements of one case on the corpus of ``n`` logs"""
+    case = CASES[name]()
+    # Setup is timed before the corpus or the normalizer is touched, so none of their imports count for it
+    start = time.perf_counter()
+    case.setup()
+    setup_s = time.perf_counter() - start
+
+    rss_before_corpus = current_rss_mb()
+    normalizer = None
+    if case.flat:
+        from models.log_normalizer import LogNormalizer
+        normalizer = LogNormalizer()
+
+    def logs_of(batch):
+        return normalizer.normalize(batch) if normalizer is not None else batch
+
+    # Corpora that fit are read and prepared up front so only the call is timed
+    in_memory = n <= args.in_memory_max
+    batches = [logs_of(batch) for batch in corpus.iter_batches(n, args.batch_size)] if in_memory else None
+    first = batches[0] if in_memory else logs_of(next(corpus.iter_batches(n, args.batch_size)))
+    samples = [case.prepare_single(log) for log in first[:args.single_samples]]
+    payloads = [case.prepare_batch(batch) for batch in batches] if in_memory and case.batch is not None else None
+    first_call = case.prepare_batch(first[:1]) if case.single is None else samples[0]
+    corpus_mb = max(0.0, current_rss_mb() - rss_before_corpus)
+
+    start = time.perf_counter()
+    if case.single is not None:
+        case.single(first_call)
+    else:
+        case.batch(first_call)
+    result = {'logs': n, 'cold_start_s': setup_s + time.perf_counter() - start}
+
+    if case.single is not None:
+        latencies = []
+        for sample in samples:
+            start = time.perf_counter()
+            case.single(sample)
+            latencies.append(time.perf_counter() - start)
+        result['latency_p50_ms'] = percentile(latencies, 0.5) * 1000
+        result['latency_p99_ms'] = percentile(latencies, 0.99) * 1000
+
+    if case.batch is not None:
+        reset_peak_rss()
+        rss_before = current_rss_mb()
+        elapsed = 0.0
+        if in_memory:
+            for payload in payloads:
+                start = time.perf_counter()
+                case.batch(payload)
+                elapsed += time.perf_counter() - start
+        else:
+            for batch in corpus.iter_batches(n, args.batch_size):
+                payload = case.prepare_batch(logs_of(batch))
+                start = time.perf_counter()
+                case.batch(payload)
+                elapsed += time.perf_counter() - start
+        result['throughput_logs_per_s'] = n / elapsed
+        result['rss_growth_mb'] = max(0.0, peak_rss_mb() - rss_before)
+    result['peak_rss_mb'] = max(0.0, peak_rss_mb() - corpus_mb)
+    result['corpus_mb'] = corpus_mb
+    return result
+
+
+def run_child(name, n, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name, '--child-size', str(n),
+               '--batch-size', str(args.batch_size), '--single-samples', str(args.single_samples),
+               '--in-memory-max', str(args.in_memory_max)]
+    output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+    # The service prints while it starts; the result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def best_of(runs):
+    """Per metric, the best value over repeated runs of one case"""
+    best = dict(runs[0])
+    for run in runs[1:]:
+        for metric, (direction, _) in METRICS.items():
+            if metric in run:
+                pick = min if direction == 'lower' else max
+                best[metric] = pick(best[metric], run[metric])
+    return best
+
+
+def compare(results, baseline, threshold, metric_thresholds=None):
+    """(case key, metric, baseline, current) for every metric worse than its threshold allows"""
+    metric_thresholds = metric_thresholds or {}
+    regressions = []
+    for key, metrics in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        for metric, (direction, noise) in METRICS.items():
+            current, previous = metrics.get(metric), base.get(metric)
+            if current is None or previous is None:
+                continue
+            worse_by = current - previous if direction == 'lower' else previous - current
+            if worse_by > max(metric_thresholds.get(metric, threshold) * abs(previous), noise):
+                regressions.append((key, metric, previous, current))
+    return regressions
+
+
+def print_results(results, baseline):
+    print(f"\n{'case':>30} {'metric':>22} {'current':>14} {'baseline':>14} {'change':>9}")
+    for key, metrics in results.items():
+        for metric in METRICS:
+            if metric not in metrics:
+                continue
+            previous = baseline.get(key, {}).get(metric)
+            change = f"{(metrics[metric] / previous - 1) * 100:+8.1f}%" if previous else f"{'-':>9}"
+            previous = f"{previous:>14,.3f}" if previous is not None else f"{'-':>14}"
+            print(f"{key:>30} {metric:>22} {metrics[metric]:>14,.3f} {previous} {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the ML service benchmark suite and check it against a baseline')
+    parser.add_argument('--sizes', default='1k,100k', help='comma-separated corpus sizes, e.g. 1k,100k,10M')
+    parser.add_argument('--cases', default=','.join(CASES), help='comma-separated subset of: ' + ', '.join(CASES))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--single-samples', type=int, default=500, help='logs timed one at a time per case')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh-process runs per case; the best value of each metric counts')
+    parser.add_argument('--in-memory-max', type=int, default=200000,
+                        help='larger corpora are streamed from disk batch by batch')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--threshold', type=float, default=float(os.getenv('ML_BENCH_THRESHOLD', 0.15)),
+                        help='relative regression that fails the run (0.15 = 15%%)')
+    parser.add_argument('--metric-threshold', action='append', default=[], metavar='METRIC=FRACTION',
+                        help='per-metric threshold, e.g. cold_start_s=0.5 (repeatable)')
+    parser.add_argument('--save-baseline', action='store_true', help='record these results as the baseline')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--child-size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(args.child, args.child_size, args)))
+        return 0
+
+    names = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+    sizes = [corpus.parse_size(size) for size in args.sizes.split(',')]
+    metric_thresholds = {}
+    for item in args.metric_threshold:
+        metric, _, value = item.partition('=')
+        if metric not in METRICS or not value:
+            parser.error(f"--metric-threshold expects METRIC=FRACTION with METRIC one of: {', '.join(METRICS)}")
+        metric_thresholds[metric] = float(value)
+
+    print("BunaSIEM Benchmark Suite")
+    results = {}
+    for n in sizes:
+        corpus.corpus_path(n)
+        for name in names:
+            key = f"{name}@{corpus.size_label(n)}"
+            print(f"  {key} ...", flush=True)
+            results[key] = best_of([run_child(name, n, args) for _ in range(max(1, args.repeat))])
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    baseline = stored.get('results', {})
+    print_results(results, baseline)
+
+    meta = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'batch_size': args.batch_size,
+        'repeat': args.repeat,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump({'meta': meta, 'results': dict(baseline, **results)}, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    missing = [key for key in results if not baseline.get(key)]
+    if missing:
+        print(f"\nNo baseline for {', '.join(missing)} in {args.baseline}; "
+              f"run with --save-baseline on the base commit to record one")
+        return 2
+    regressions = compare(results, baseline, args.threshold, metric_thresholds)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond the threshold:")
+        for key, metric, previous, current in regressions:
+            limit = metric_thresholds.get(metric, args.threshold)
+            print(f"  {key} {metric}: {previous:,.3f} -> {current:,.3f} (limit {limit:.0%})")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+"""
+BunaSIEM ML Service - production server configuration
+Run with: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('ML_SERVICE_PORT', 5000)}"
+
+# Pre-fork model: app.py (and the models it loads) is imported once in the
+# master, then workers are forked and share those pages copy-on-write
+preload_app = True
+# The master must never start the parallel scoring pool during its warm-up:
+# its manager thread would not survive fork(). post_fork warms it per worker.
+os.environ['ML_WARMUP_SCORING_POOL'] = '0'
+workers = int(os.getenv('ML_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('ML_THREADS', 4))
+
+timeout = int(os.getenv('ML_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('ML_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.getenv('ML_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.getenv('ML_ACCESS_LOG', None)
+errorlog = '-'
+
+
+def when_ready(server):
+    # Move everything loaded so far into the permanent generation so the
+    # collector never writes to (and un-shares) those pages in the workers
+    gc.freeze()
+    server.log.info(f"BunaSIEM ML Service ready: {workers} workers x {threads} threads")
+
+
+def post_fork(server, worker):
+    from app import anomaly_detector, warmup
+    if warmup.enabled and not warmup.scoring_pool:
+        anomaly_detector.warm_up_scoring_pool()
+
+
+def worker_exit(server, worker):
+    from app import anomaly_detector, threat_intel
+    threat_intel.stop_watcher()
+    if anomaly_detector.parallel_scorer is not None:
+        anomaly_detector.parallel_scorer.close()
@@ -1,33 +1,206 @@
-import pandas as pd
 import numpy as np
-from sklearn.ensemble import IsolationForest
-from sklearn.preprocessing import StandardScaler
-import joblib
 import os
-from datetime import datetime
+import threading
+import time
+from models.feature_schema import DETECTOR_FEATURES, DETECTOR_COMMON_CITIES
+from models.feature_extractor import ColumnarFeatureExtractor, event_time_features
+from models.ethiopian_calendar import now_eat
+from models.ip_ranges import ethiopian_ip_index
+from models.model_registry import ModelRegistry, ModelRegistryError
+from models.compiled_forest import compile_model
+from models.behavior_windows import BehaviorWindows, apply_behavior, behavior_features
+from models.parallel_scoring import ParallelScorer, n_jobs_from_env
+from models.detection_rules import RuleInputs, detection_rules
+from models.instrumentation import INSTRUMENTATION, timed
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anomaly_model.pkl')
+
+
+def _probe_rows():
+    """Fixed feature rows the compiled forest must score exactly like sklearn"""
+    return np.random.default_rng(0).normal(0, 20, (256, len(DETECTOR_FEATURES)))
+
 
 class AnomalyDetector:
-    def __init__(self):
-        self.model = None
-        self.scaler = StandardScaler()
-        self.model_path = 'models/anomaly_model.pkl'
+    def __init__(self, strict=None, registry=None, behavior_windows=None, version=None, rules=None):
+        # The sklearn model; with an exported forest it is only unpickled (and
+        # scikit-learn imported) once a batch needs it, see the model property
+        self._model = None
+        self._deferred_version = None
+        self._model_lock = threading.Lock()
+        self._model_generation = 0
+        self.model_info = {}
+        self.feature_extractor = ColumnarFeatureExtractor()
+        self.ethiopian_ip_index = ethiopian_ip_index()
+        # High-risk overrides are the "detector" rules of the detection rule files
+        self.rules = rules if rules is not None else detection_rules()
+        self.model_path = os.getenv('MODEL_PATH', DEFAULT_MODEL_PATH)
+        self.registry = registry or ModelRegistry()
+        # Registry version to load; None follows CURRENT
+        self.requested_version = version
+        # Strict mode refuses to train a replacement model inside a serving process
+        if strict is None:
+            strict = os.getenv('MODEL_STRICT', '').lower() in ('1', 'true', 'yes')
+        self.strict = strict
+        # Score with the packed-array forest unless ML_COMPILED_FOREST=0
+        self.forest = None
+        self.use_compiled_forest = os.getenv('ML_COMPILED_FOREST', '1').lower() not in ('0', 'false', 'no')
+        # sklearn's C tree walk wins on large batches; both give identical scores
+        self.compiled_max_rows = int(os.getenv('ML_COMPILED_FOREST_MAX_ROWS', 2048))
+        # Optional per-IP/user sliding windows (ML_BEHAVIOR_WINDOWS=1)
+        self.behavior_windows = behavior_windows if behavior_windows is not None else BehaviorWindows.from_env()
+
+        start = time.perf_counter()
         self.load_or_train_model()
+        if self.use_compiled_forest and self.forest is None:
+            self.compile_forest()
+        # Optional process pool for very large batches (ML_SCORING_WORKERS > 1)
+        self.parallel_scorer = ParallelScorer.from_env(self.registry, self.model_info.get('version'))
+        self.model_info['startup_seconds'] = time.perf_counter() - start
+        print(f"Anomaly detector ready in {self.model_info['startup_seconds']:.3f}s "
+              f"(model version {self.model_info.get('version')})")
     
+    @property
+    def model(self):
+        if self._deferred_version is not None:
+            self._load_deferred_model()
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        self._deferred_version = None
+        self._model_generation += 1
+
+    def is_loaded(self):
+        """Whether a model (or the forest standing in for it) is ready to score"""
+        return self._model is not None or self._deferred_version is not None
+
     def load_or_train_model(self):
-        """Load existing model or train a new one with Ethiopian context"""
+        """Load the current registry artifact, then the legacy pickle, and train only as a last resort"""
+        try:
+            if self.use_compiled_forest and self.load_deferred(self.requested_version):
+                return
+            self.model, self.model_info = self.registry.load(self.requested_version)
+            print(f"Anomaly detection model {self.model_info['version']} loaded from registry")
+            return
+        except Exception as e:
+            print(f" Registry model unavailable: {e}")
+        
         if os.path.exists(self.model_path):
             try:
-                self.model = joblib.load(self.model_path)
+                import joblib
+                start = time.perf_counter()
+                self.model = joblib.load(self.model_path, mmap_mode='r')
+                self.model_info = {
+                    'version': 'legacy',
+                    'path': self.model_path,
+                    'load_seconds': time.perf_counter() - start,
+                }
                 print("Anomaly detection model loaded successfully")
+                return
             except Exception as e:
-                print(f" Failed to load model: {e}. Training new one")
-                self.train_model()
-        else:
-            print("Training new anomaly detection model with Ethiopian patterns")
-            self.train_model()
+                print(f" Failed to load model: {e}")
+        
+        if self.strict:
+            raise ModelRegistryError(
+                f"No loadable model in {self.registry.root} or {self.model_path}; strict mode refuses to train"
+            )
+        print("Training new anomaly detection model with Ethiopian patterns")
+        self.train_model()
     
+    def load_deferred(self, version=None):
+        """Score with a registry version's exported forest and leave its sklearn model on disk.
+
+        Small batches never need the sklearn model, so a one-off prediction
+        skips importing scikit-learn. The model is loaded, and the forest
+        checked against it, the first time anything asks for ``model``.
+        Returns False when the version has no exported forest.
+        """
+        metadata = self.registry.resolve(version)
+        try:
+            forest = self.registry.load_forest(metadata['version'])
+        except Exception as e:
+            print(f" Exported forest for {metadata['version']} unreadable: {e}")
+            return False
+        if forest is None:
+            return False
+        self.forest = forest
+        self.model_info = dict(metadata, compiled_forest={'compiled': True, 'source': 'artifact', 'verified': False})
+        self._model = None
+        self._deferred_version = metadata['version']
+        self._model_generation += 1
+        print(f"Anomaly detection model {metadata['version']} forest loaded from registry (sklearn model deferred)")
+        return True
+
+    def _load_deferred_model(self):
+        with self._model_lock:
+            version = self._deferred_version
+            if version is None:
+                return
+            model, metadata = self.registry.load(version)
+            info = self.model_info['compiled_forest']
+            error = self.forest.max_abs_error(model, _probe_rows()) if self.forest is not None else None
+            if error is not None and error > 1e-9:
+                print(f" Exported forest for {version} disagrees with its model by {error:.3g}; scoring with sklearn")
+                self.forest = None
+                self._model_generation += 1
+                info.update(compiled=False, reason=f"scores differ from sklearn by {error:.3g}")
+            info.update(verified=True, max_abs_error=error)
+            self.model_info['load_seconds'] = metadata['load_seconds']
+            self._model = model
+            self._deferred_version = None
+
+    def compile_forest(self):
+        """Use the exported (or freshly compiled) forest if it reproduces sklearn's scores"""
+        probe = _probe_rows()
+        forest = None
+        version = self.model_info.get('version')
+        if version and version != 'legacy':
+            try:
+                forest = self.registry.load_forest(version)
+            except Exception as e:
+                print(f" Exported forest for {version} unreadable: {e}")
+        if forest is not None and forest.max_abs_error(self.model, probe) <= 1e-9:
+            self.forest, info = forest, {'compiled': True, 'source': 'artifact'}
+        else:
+            self.forest, info = compile_model(self.model, probe)
+        self.model_info['compiled_forest'] = info
+        if self.forest is None:
+            print(f" Compiled forest disabled: {info.get('reason')}")
+
+    @timed('inference')
+    def decision_function(self, X):
+        """Anomaly scores (negative = anomalous) from the compiled forest or sklearn"""
+        if self.forest is not None and len(X) <= self.compiled_max_rows:
+            X = np.asarray(X, dtype=np.float32)
+            # Missing values follow sklearn's own handling
+            if np.isfinite(X).all():
+                return self.forest.decision_function(X)
+        if self.parallel_scorer is not None and self.parallel_scorer.accepts(len(X), self.model_info.get('version')):
+            return self.parallel_scorer.decision_function(X)
+        return self.model.decision_function(X)
+
+    def warm_up(self, scoring_pool=True):
+        """Pay the first-call costs before traffic does: the deferred sklearn model,
+        sklearn's own first decision_function and (with ``scoring_pool``) the
+        parallel scoring workers"""
+        X = np.zeros((2, len(DETECTOR_FEATURES)))
+        self.model.decision_function(X)
+        if self.forest is not None:
+            self.forest.decision_function(X)
+        if scoring_pool:
+            self.warm_up_scoring_pool()
+
+    def warm_up_scoring_pool(self):
+        """Start the parallel scoring workers of this process now rather than on the first large batch"""
+        if self.parallel_scorer is not None:
+            self.parallel_scorer.warm_up(np.zeros((2, len(DETECTOR_FEATURES))))
+
     def train_model(self):
         """Train Isolation Forest model on Ethiopian security patterns"""
+        from sklearn.ensemble import IsolationForest
+
         np.random.seed(42)
         n_samples = 2000
         
@@ -35,30 +208,32 @@ class AnomalyDetector:
         # Ethiopian business hours: 8:30 AM - 5:30 PM
         # Common locations: Addis Ababa, Dire Dawa, Adama, Hawassa, Mekele
         
-        normal_data = np.column_stack([
-            np.random.normal(13, 3, n_samples),  # hour_of_day (peak around 1 PM)
-            np.random.binomial(1, 0.2, n_samples),  # is_weekend (20% weekend activity)
-            np.random.poisson(0.5, n_samples),  # failed_attempts (mostly 0-1)
-            np.random.normal(3, 1.5, n_samples),  # source_ip_diversity
-            np.random.normal(8, 4, n_samples),  # request_frequency
-            np.random.binomial(1, 0.85, n_samples),  # is_ethiopian_ip (85% Ethiopian IPs)
-            np.random.binomial(1, 0.05, n_samples),   # unusual_location (5% unusual)
-            np.random.binomial(1, 0.7, n_samples),   # is_business_hours (70% during business)
-            np.random.exponential(1, n_samples),     # request_size
-        ])
+        normal_columns = {
+            'hour_of_day': np.random.normal(13, 3, n_samples),  # Peak around 1 PM
+            'is_weekend': np.random.binomial(1, 0.2, n_samples),  # 20% weekend activity
+            'failed_attempts': np.random.poisson(0.5, n_samples),  # Mostly 0-1
+            'source_ip_diversity': np.random.normal(3, 1.5, n_samples),
+            'request_frequency': np.random.normal(8, 4, n_samples),
+            'is_ethiopian_ip': np.random.binomial(1, 0.85, n_samples),  # 85% Ethiopian IPs
+            'unusual_location': np.random.binomial(1, 0.05, n_samples),  # 5% unusual
+            'is_business_hours': np.random.binomial(1, 0.7, n_samples),  # 70% during business
+            'request_size': np.random.exponential(1, n_samples),
+        }
+        normal_data = np.column_stack([normal_columns[name] for name in DETECTOR_FEATURES])
         
         # Add some Ethiopian-specific anomalies for training
-        anomalous_data = np.column_stack([
-            np.random.uniform(0, 6, 200),  # Very early hours
-            np.random.binomial(1, 0.8, 200),  # Mostly weekends
-            np.random.poisson(5, 200),  # High failed attempts
-            np.random.normal(15, 5, 200),  # High IP diversity
-            np.random.normal(50, 20, 200),  # High request frequency
-            np.random.binomial(1, 0.1, 200),  # Mostly non-Ethiopian IPs
-            np.random.binomial(1, 0.9, 200),  # Mostly unusual locations
-            np.random.binomial(1, 0.1, 200),  # Rarely business hours
-            np.random.exponential(10, 200),   # Large request sizes
-        ])
+        anomalous_columns = {
+            'hour_of_day': np.random.uniform(0, 6, 200),  # Very early hours
+            'is_weekend': np.random.binomial(1, 0.8, 200),  # Mostly weekends
+            'failed_attempts': np.random.poisson(5, 200),  # High failed attempts
+            'source_ip_diversity': np.random.normal(15, 5, 200),  # High IP diversity
+            'request_frequency': np.random.normal(50, 20, 200),  # High request frequency
+            'is_ethiopian_ip': np.random.binomial(1, 0.1, 200),  # Mostly non-Ethiopian IPs
+            'unusual_location': np.random.binomial(1, 0.9, 200),  # Mostly unusual locations
+            'is_business_hours': np.random.binomial(1, 0.1, 200),  # Rarely business hours
+            'request_size': np.random.exponential(10, 200),   # Large request sizes
+        }
+        anomalous_data = np.column_stack([anomalous_columns[name] for name in DETECTOR_FEATURES])
         
         # Combine data
         X_train = np.vstack([normal_data, anomalous_data])
@@ -68,27 +243,32 @@ class AnomalyDetector:
             contamination=0.1,  # 10% anomalies expected
             random_state=42,
             n_estimators=100,
-            max_samples='auto'
+            max_samples='auto',
+            n_jobs=n_jobs_from_env()
         )
         
         self.model.fit(X_train)
         
-        # Save model
-        os.makedirs('models', exist_ok=True)
-        joblib.dump(self.model, self.model_path)
-        print(" Model trained and saved successfully with Ethiopian patterns")
+        # Save model as a new registry version
+        self.model_info = self.registry.save(self.model, X_train, extra={'source': 'AnomalyDetector.train_model'})
+        print(f" Model trained and saved as version {self.model_info['version']} with Ethiopian patterns")
     
-    def predict(self, log_data):
+    def predict(self, log_data, behavior=None):
         """Predict if features represent an anomaly in Ethiopian context"""
         try:
-            features = self.extract_features(log_data)
+            if behavior is None and self.behavior_windows is not None:
+                behavior = self.behavior_windows.observe(log_data)
+            elif isinstance(behavior, Exception):
+                # observe_many could not record this log
+                raise behavior
+            features = self.extract_features(log_data, behavior)
             feature_array = np.array([list(features.values())])
             
-            # Predict anomaly (-1 for anomaly, 1 for normal)
-            prediction = self.model.predict(feature_array)[0]
-            confidence = abs(self.model.decision_function(feature_array)[0])
+            # Negative scores are anomalies (sklearn's predict() == -1)
+            score = self.decision_function(feature_array)[0]
+            confidence = abs(score)
             
-            is_anomaly = prediction == -1
+            is_anomaly = score < 0
             
             # Enhance with Ethiopian business rules
             ethiopian_context = self.enhance_with_ethiopian_rules(log_data, features)
@@ -112,53 +292,143 @@ class AnomalyDetector:
                 'error': str(e)
             }
     
-    def extract_features(self, log_data):
+    def predict_batch(self, logs, behaviors=None, compact=False):
+        """Predict anomalies for many logs with a single model pass.
+
+        ``behaviors`` are windowed values the caller already observed for
+        these logs; otherwise the behavior windows (if enabled) record them here.
+        ``compact`` leaves out the fields shared_result_fields() returns.
+        """
+        results = [None] * len(logs)
+        batch = self.feature_extractor.extract(logs)
+        if behaviors is None and self.behavior_windows is not None:
+            behaviors = self.behavior_windows.observe_many(logs)
+        if behaviors is not None:
+            batch = apply_behavior(batch, logs, behaviors)
+            failed = [i for i, behavior in enumerate(behaviors) if isinstance(behavior, Exception)]
+            if failed:
+                # Scored through predict() below, which reports the error for that log alone
+                batch.valid = batch.valid.copy()
+                batch.valid[failed] = False
+        else:
+            behaviors = [None] * len(logs)
+
+        valid = batch.valid
+        ethiopian_ip = np.zeros(len(logs), dtype=bool)
+        valid_index = np.flatnonzero(valid)
+        with INSTRUMENTATION.stage('rules'):
+            ethiopian_ip[valid_index] = self.ethiopian_ip_index.contains_many(
+                logs[i].get('source_ip', '') for i in valid_index
+            )
+
+        # Odd rows go through predict() so errors and fallbacks match exactly
+        for i in np.flatnonzero(~valid):
+            results[i] = self.predict(logs[i], behaviors[i])
+            if compact:
+                results[i] = self.compact_result(results[i])
+
+        row_index = np.flatnonzero(valid)
+        if not len(row_index):
+            return results
+
+        # One decision_function call; predict() labels scores < 0 as -1
+        scores = self.decision_function(batch.matrix[row_index])
+        is_anomaly = scores < 0
+        confidence = np.abs(scores)
+
+        columns = {name: column[row_index] for name, column in batch.columns.items()}
+        rule_hits = self.ethiopian_rule_masks(columns, ethiopian_ip[row_index], [logs[i] for i in row_index])
+        reasons_by_rule = [reason for reason, _ in rule_hits]
+        hits = np.column_stack([mask for _, mask in rule_hits]) if rule_hits else np.zeros((len(row_index), 0), dtype=bool)
+        high_risk = hits.any(axis=1)
+        is_anomaly |= high_risk
+        confidence = np.where(high_risk, np.maximum(confidence, 0.8), confidence)
+
+        for j, i in enumerate(row_index):
+            reasons = [reasons_by_rule[k] for k in np.flatnonzero(hits[j])] if high_risk[j] else []
+            if compact:
+                results[i] = {
+                    'is_anomaly': bool(is_anomaly[j]),
+                    'confidence': float(confidence[j]),
+                    'ethiopian_context': {'high_risk': bool(high_risk[j]), 'reasons': reasons},
+                }
+                continue
+            results[i] = {
+                'is_anomaly': bool(is_anomaly[j]),
+                'confidence': float(confidence[j]),
+                'features_used': list(DETECTOR_FEATURES),
+                'ethiopian_context': self._ethiopian_context(bool(high_risk[j]), reasons),
+                'model_type': 'Isolation Forest with Ethiopian Rules'
+            }
+
+        return results
+
+    @timed('features')
+    def extract_features(self, log_data, behavior=None):
         """Extract features from log data for Ethiopian ML analysis"""
-        event_time = log_data.get('event_time', datetime.now().isoformat())
-        try:
-            hour = pd.to_datetime(event_time).hour
-            is_weekend = 1 if pd.to_datetime(event_time).dayofweek >= 5 else 0
-        except:
-            hour = 12
-            is_weekend = 0
+        times = event_time_features(log_data.get('event_time', now_eat()))
         
         features = {
-            'hour_of_day': hour,
-            'is_weekend': is_weekend,
+            'hour_of_day': times['hour'],
+            'is_weekend': 1 if times['is_weekend'] else 0,
             'failed_attempts': log_data.get('failed_attempts', 0),
             'source_ip_diversity': len(set(log_data.get('source_ips', []))),
             'request_frequency': log_data.get('request_count', 1),
             'is_ethiopian_ip': 1 if log_data.get('country_code') == 'ET' else 0,
-            'unusual_location': 1 if log_data.get('city') not in ['Addis Ababa', 'Dire Dawa', 'Adama', 'Hawassa', 'Mekele'] else 0,
-            'is_business_hours': 1 if 8 <= hour <= 17 else 0,
+            'unusual_location': 1 if log_data.get('city') not in DETECTOR_COMMON_CITIES else 0,
+            'is_business_hours': 1 if times['is_business_hours'] else 0,
             'request_size': log_data.get('bytes_transferred', 0) / 1024.0,  # KB
         }
-        return features
+        if behavior is not None:
+            features.update(behavior_features(log_data, features, behavior))
+        # Model input order comes from the shared schema
+        return {name: features[name] for name in DETECTOR_FEATURES}
     
+    def shared_result_fields(self):
+        """Result fields that are the same for every log; compact responses send them once"""
+        return {
+            'features_used': list(DETECTOR_FEATURES),
+            'model_type': 'Isolation Forest with Ethiopian Rules',
+            'ethiopian_business_hours': '8:30 AM - 5:30 PM',
+            'common_locations': list(DETECTOR_COMMON_CITIES),
+        }
+
+    def compact_result(self, result):
+        """A predict() result without the shared_result_fields() entries"""
+        compact = {key: value for key, value in result.items() if key not in ('features_used', 'model_type')}
+        context = result.get('ethiopian_context')
+        if context is not None:
+            compact['ethiopian_context'] = {'high_risk': context['high_risk'], 'reasons': context['reasons']}
+        return compact
+
+    def model_version(self):
+        """Identity of the model currently scoring; changes on reload or retrain"""
+        return (self.model_info.get('version'), self._model_generation)
+
+    @timed('rules')
     def enhance_with_ethiopian_rules(self, log_data, features):
         """Enhance ML prediction with Ethiopian-specific business rules"""
-        high_risk = False
-        reasons = []
-        
-        # Ethiopian business hours: 8:30 AM - 5:30 PM
-        if features['hour_of_day'] < 6 or features['hour_of_day'] > 22:
-            high_risk = True
-            reasons.append("Activity outside typical Ethiopian hours (6 AM - 10 PM)")
-        
-        # Ethiopian IP ranges: 196.188.x.x, 197.156.x.x
-        source_ip = log_data.get('source_ip', '')
-        if source_ip.startswith('196.188.') and features['failed_attempts'] > 3:
-            high_risk = True
-            reasons.append("Multiple failures from Ethiopian IP range")
-        
-        # Unusual data transfer sizes for Ethiopian context
-        if features['request_size'] > 10000:  # 10MB+ unusual for typical Ethiopian traffic
-            high_risk = True
-            reasons.append("Unusually large data transfer for Ethiopian context")
-        
+        ethiopian_ip = np.array([self.ethiopian_ip_index.contains(log_data.get('source_ip', ''))])
+        rule_hits = self._rule_hits({name: [value] for name, value in features.items()}, ethiopian_ip, [log_data])
+        reasons = [reason for reason, mask in rule_hits if mask[0]]
+        return self._ethiopian_context(bool(reasons), reasons)
+
+    @timed('rules')
+    def ethiopian_rule_masks(self, columns, ethiopian_ip, logs):
+        """Vectorized form of enhance_with_ethiopian_rules over feature columns"""
+        return self._rule_hits(columns, ethiopian_ip, logs)
+
+    def _rule_hits(self, columns, ethiopian_ip, logs):
+        """(reason, mask) for each detector rule, in rule order"""
+        derived = dict(columns, hour=columns['hour_of_day'], ethiopian_ip=ethiopian_ip,
+                       business_hours=lambda: inputs.numbers('is_business_hours') == 1)
+        inputs = RuleInputs(len(ethiopian_ip), lambda name: [log.get(name) for log in logs], derived)
+        return [(rule.message, mask) for rule, mask in self.rules.snapshot.evaluate('detector', inputs)]
+
+    def _ethiopian_context(self, high_risk, reasons):
         return {
             'high_risk': high_risk,
             'reasons': reasons,
             'ethiopian_business_hours': '8:30 AM - 5:30 PM',
-            'common_locations': ['Addis Ababa', 'Dire Dawa', 'Adama', 'Hawassa', 'Mekele']
+            'common_locations': list(DETECTOR_COMMON_CITIES)
         }
@@ -0,0 +1,262 @@
+"""
+BunaSIEM Behavioral Windows
+Sliding-window event and failure counts per source IP and per user
+"""
+
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from models.ethiopian_calendar import epoch_seconds, parse_eat_one
+from models.feature_extractor import FeatureBatch
+from models.instrumentation import timed
+from models.log_normalizer import FAILURE_EVENT_TYPES
+
+# (name, span seconds, bucket seconds); each window is a ring of span // bucket buckets
+WINDOWS = [
+    ('1m', 60, 10),
+    ('5m', 300, 60),
+    ('1h', 3600, 300),
+]
+
+DEFAULT_MAX_KEYS = 200000
+DEFAULT_MAX_IPS_PER_USER = 32
+
+def event_timestamp(event_time, default=None):
+    """Epoch seconds for an ISO 8601 event_time (taken as East Africa Time
+    when it has no offset); ``default`` (now) when it cannot be read"""
+    if type(event_time) is str:
+        day, time_us, parsed = parse_eat_one(event_time)
+        if parsed and np.isfinite(day) and np.isfinite(time_us):
+            return epoch_seconds(day, time_us)
+    return time.time() if default is None else default
+
+
+def behavior_features(log, features, behavior):
+    """Windowed values that replace the caller-supplied behavioural features.
+
+    Fields the caller precomputed (request_count, source_ips) still win;
+    failed_attempts takes the larger of the event's own count and the window's.
+    """
+    updates = {}
+    if isinstance(features['failed_attempts'], (int, float)):
+        updates['failed_attempts'] = max(features['failed_attempts'], behavior['failed_attempts'])
+    if 'request_count' not in log:
+        updates['request_frequency'] = behavior['request_frequency']
+    if 'source_ips' not in log:
+        updates['source_ip_diversity'] = behavior['source_ip_diversity']
+    return updates
+
+
+def apply_behavior(batch, logs, behaviors):
+    """FeatureBatch with behavior_features applied to every valid row.
+
+    Rows whose observation failed (see BehaviorWindows.observe_many) keep
+    their own values here; the detector turns them into per-log errors.
+    """
+    columns = {name: column.copy() for name, column in batch.columns.items()}
+    for i in np.flatnonzero(batch.valid):
+        if type(behaviors[i]) is not dict:
+            continue
+        for name, value in behavior_features(logs[i], batch.row(i), behaviors[i]).items():
+            columns[name][i] = value
+    return FeatureBatch(columns, batch.valid)
+
+
+class SlidingWindowCounter:
+    """Event and failure counts per key over every window in WINDOWS.
+
+    All keys share one int64 slab (ticks of far-off event times overflow int32); each key owns a fixed-width row of
+    ``[tick, total events, total failures, events..., failures...]`` per
+    window. Buckets are cleared lazily (and taken off the totals) when a key's
+    clock moves forward, and the least recently seen key is evicted, its row
+    reused, once ``max_keys`` is reached.
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, windows=WINDOWS, on_evict=None):
+        self.max_keys = max_keys
+        self.on_evict = on_evict
+        self.windows = [(name, bucket, span // bucket) for name, span, bucket in windows]
+        self.layout = []
+        offset = 0
+        for name, bucket, n_buckets in self.windows:
+            self.layout.append((offset, bucket, n_buckets))
+            offset += 3 + 2 * n_buckets
+        self.row_width = offset
+        self.rows = OrderedDict()
+        self.slab = array('q')
+        self.evictions = 0
+
+    def _row(self, key):
+        """Slab offset for key, marking it most recently used"""
+        rows = self.rows
+        base = rows.get(key)
+        if base is not None:
+            rows.move_to_end(key)
+            return base, False
+        if len(rows) >= self.max_keys:
+            evicted, base = rows.popitem(last=False)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+            self.slab[base:base + self.row_width] = array('q', bytes(8 * self.row_width))
+        else:
+            base = len(self.slab)
+            self.slab.extend(array('q', bytes(8 * self.row_width)))
+        rows[key] = base
+        return base, True
+
+    def add(self, key, timestamp, failures=0):
+        """Record one event and return (events, failures) per window, this event included"""
+        base, new = self._row(key)
+        slab = self.slab
+        counts = []
+        for offset, bucket, n in self.layout:
+            start = base + offset
+            tick = int(timestamp // bucket)
+            slot = start + 3 + tick % n
+            if new:
+                slab[start] = tick
+                slab[start + 1] = slab[slot] = 1
+                slab[start + 2] = slab[slot + n] = failures
+                counts.append((1, failures))
+                continue
+
+            last = slab[start]
+            if tick > last:
+                # Clear the buckets the clock skipped over
+                if tick - last >= n:
+                    slab[start + 1:start + 3 + 2 * n] = array('q', bytes(8 * (2 + 2 * n)))
+                else:
+                    for t in range(last + 1, tick + 1):
+                        cleared = start + 3 + t % n
+                        slab[start + 1] -= slab[cleared]
+                        slab[start + 2] -= slab[cleared + n]
+                        slab[cleared] = slab[cleared + n] = 0
+                slab[start] = last = tick
+            if tick > last - n:
+                slab[slot] += 1
+                slab[start + 1] += 1
+                if failures:
+                    slab[slot + n] += failures
+                    slab[start + 2] += failures
+            counts.append((slab[start + 1], slab[start + 2]))
+        return counts
+
+    def __len__(self):
+        return len(self.rows)
+
+    def memory_bytes(self):
+        return self.slab.itemsize * len(self.slab)
+
+
+class BehaviorWindows:
+    """Windowed per-IP and per-user behaviour, turned into detector features.
+
+    State lives in this process only; behind a pre-fork server each worker
+    sees the share of traffic routed to it.
+    """
+
+    # Window each feature reads
+    FREQUENCY_WINDOW = '1m'
+    FAILURE_WINDOW = '1h'
+    DIVERSITY_SECONDS = 3600
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, max_ips_per_user=DEFAULT_MAX_IPS_PER_USER):
+        self.by_ip = SlidingWindowCounter(max_keys)
+        # username -> {source_ip: last seen}, dropped when by_user evicts the user
+        self.user_ips = {}
+        self.by_user = SlidingWindowCounter(max_keys, on_evict=lambda username: self.user_ips.pop(username, None))
+        self.max_ips_per_user = max_ips_per_user
+        self._index = {name: i for i, (name, _, _) in enumerate(self.by_ip.windows)}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Windows configured by ML_BEHAVIOR_*, or None when they are switched off"""
+        if os.getenv('ML_BEHAVIOR_WINDOWS', '').lower() not in ('1', 'true', 'yes'):
+            return None
+        return cls(max_keys=int(os.getenv('ML_BEHAVIOR_MAX_KEYS', DEFAULT_MAX_KEYS)))
+
+    @timed('features')
+    def observe(self, log, now=None):
+        """Record one log and return its windowed feature values"""
+        with self._lock:
+            return self._observe(log, now)
+
+    @timed('features')
+    def observe_many(self, logs):
+        """Windowed feature values per log: None for non-dict logs, and the
+        exception for a log that could not be recorded, so one bad row does
+        not fail the batch"""
+        now = time.time()
+        results = []
+        with self._lock:
+            for log in logs:
+                if not isinstance(log, dict):
+                    results.append(None)
+                    continue
+                try:
+                    results.append(self._observe(log, now))
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    def _observe(self, log, now):
+        timestamp = event_timestamp(log.get('event_time'), now)
+        failures = log.get('failed_attempts')
+        if failures is None:
+            event_type = log.get('event_type')
+            failures = 1 if type(event_type) is str and event_type in FAILURE_EVENT_TYPES else 0
+        else:
+            failures = int(failures) if type(failures) in (int, float) and failures > 0 else 0
+
+        frequency_index = self._index[self.FREQUENCY_WINDOW]
+        failure_index = self._index[self.FAILURE_WINDOW]
+        request_frequency = 0
+        failed_attempts = failures
+
+        source_ip = log.get('source_ip')
+        if source_ip and type(source_ip) is str:
+            counts = self.by_ip.add(source_ip, timestamp, failures)
+            request_frequency = counts[frequency_index][0]
+            failed_attempts = max(failed_attempts, counts[failure_index][1])
+
+        source_ip_diversity = 0
+        username = log.get('username')
+        if username and type(username) is str:
+            counts = self.by_user.add(username, timestamp, failures)
+            request_frequency = max(request_frequency, counts[frequency_index][0])
+            failed_attempts = max(failed_attempts, counts[failure_index][1])
+            source_ip_diversity = self._user_ip_diversity(username, source_ip, timestamp)
+
+        return {
+            'request_frequency': request_frequency,
+            'failed_attempts': failed_attempts,
+            'source_ip_diversity': source_ip_diversity,
+        }
+
+    def _user_ip_diversity(self, username, source_ip, timestamp):
+        seen = self.user_ips.setdefault(username, {})
+        if source_ip and type(source_ip) is str:
+            seen.pop(source_ip, None)
+            seen[source_ip] = timestamp
+            if len(seen) > self.max_ips_per_user:
+                del seen[next(iter(seen))]
+        cutoff = timestamp - self.DIVERSITY_SECONDS
+        return sum(1 for last_seen in seen.values() if last_seen > cutoff)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'windows': [name for name, _, _ in WINDOWS],
+                'ip_keys': len(self.by_ip),
+                'user_keys': len(self.by_user),
+                'max_keys': self.by_ip.max_keys,
+                'evictions': self.by_ip.evictions + self.by_user.evictions,
+                'memory_bytes': self.by_ip.memory_bytes() + self.by_user.memory_bytes(),
+            }
@@ -0,0 +1,312 @@
+"""
+BunaSIEM Bulk Rescoring
+Rescores log archives file by file in worker processes, resuming from a checkpoint
+"""
+
+import json
+import os
+import time
+from concurrent.futures import as_completed
+from itertools import islice
+
+from models.anomaly_detector import AnomalyDetector
+from models.behavior_windows import BehaviorWindows
+from models.log_normalizer import LogNormalizer
+from models.log_sources import LOG_SUFFIXES, find_log_files, iter_file_records
+from models.model_registry import ModelRegistry
+from models.parallel_scoring import spawn_pool
+from models.pattern_matcher import PatternMatcher
+from models.stream_scoring import StreamScorer
+from models.threat_intel import ThreatIntelStore
+
+CHECKPOINT_FILE = '_checkpoint.json'
+OUTPUT_FORMATS = ('ndjson', 'parquet')
+
+# One flat row per input record, the same for both output formats
+OUTPUT_COLUMNS = [
+    ('source_file', 'string'),
+    ('record', 'int64'),
+    ('event_time', 'string'),
+    ('source_ip', 'string'),
+    ('event_type', 'string'),
+    ('is_anomaly', 'bool'),
+    ('confidence', 'float64'),
+    ('ml_anomaly', 'bool'),
+    ('ml_confidence', 'float64'),
+    ('ml_reasons', 'list<string>'),
+    ('patterns', 'list<string>'),
+    ('threat_types', 'list<string>'),
+    ('error', 'string'),
+    ('model_version', 'string'),
+    ('rule_version', 'string'),
+]
+
+
+def output_name(relative_path, output_format):
+    """Output file name for an input path: the log suffix (and .gz) becomes .ndjson/.parquet"""
+    name = relative_path[:-3] if relative_path.endswith('.gz') else relative_path
+    for suffix in LOG_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return f"{name}.scored.{output_format}"
+
+
+def plan_inputs(paths):
+    """(input file, path relative to its root) for every log file under ``paths``"""
+    planned = {}
+    for root in paths:
+        for path in find_log_files([root]):
+            relative = os.path.relpath(path, root) if os.path.isdir(root) else os.path.basename(path)
+            if relative in planned.values():
+                raise ValueError(f"Two inputs map to the same output name: {relative}")
+            planned[os.path.abspath(path)] = relative
+    return list(planned.items())
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+class NdjsonWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(row) + '\n' for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        pa, pq = _require_pyarrow()
+        types = {
+            'string': pa.string(), 'int64': pa.int64(), 'bool': pa.bool_(),
+            'float64': pa.float64(), 'list<string>': pa.list_(pa.string()),
+        }
+        self.pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in OUTPUT_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write(self, rows):
+        if rows:
+            self.writer.write_table(self.pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'ndjson': NdjsonWriter, 'parquet': ParquetWriter}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)") from e
+    return pyarrow, pyarrow.parquet
+
+
+class FileRescorer:
+    """Scores whole files with one pinned model version and the current rules"""
+
+    def __init__(self, registry_root, version, behavior_windows=False):
+        self.detector = AnomalyDetector(strict=True, registry=ModelRegistry(registry_root), version=version)
+        self.pattern_matcher = PatternMatcher()
+        self.normalizer = LogNormalizer.from_env()
+        self.scorer = StreamScorer(self.detector, self.pattern_matcher, ThreatIntelStore())
+        self.behavior_windows = behavior_windows
+        self.model_version = self.detector.model_info.get('version')
+        self.rule_version = self.pattern_matcher.rule_version()
+
+    def rescore(self, path, output_path, output_format, chunk_size):
+        """Write the scored rows of one file; the output appears only once it is complete"""
+        if self.behavior_windows:
+            # Windows start empty for every file, so results do not depend on scheduling
+            self.detector.behavior_windows = BehaviorWindows()
+        start = time.perf_counter()
+        counts = {'rows': 0, 'anomalies': 0, 'errors': 0}
+        partial = output_path + '.partial'
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        writer = WRITERS[output_format](partial)
+        try:
+            records = iter_file_records(path)
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                rows = self._score_rows(path, counts['rows'], chunk)
+                writer.write(rows)
+                counts['rows'] += len(rows)
+                counts['anomalies'] += sum(1 for row in rows if row['is_anomaly'])
+                counts['errors'] += sum(1 for row in rows if row['error'] is not None)
+        except BaseException:
+            writer.close()
+            os.remove(partial)
+            raise
+        writer.close()
+        os.replace(partial, output_path)
+        return dict(counts, seconds=time.perf_counter() - start)
+
+    def _score_rows(self, path, first_index, chunk):
+        if self.normalizer is not None:
+            chunk = self.normalizer.normalize(chunk)
+        logs = [record for record in chunk if isinstance(record, dict)]
+        results = iter(self.scorer.score_chunk(logs)) if logs else iter(())
+        rows = []
+        for index, record in enumerate(chunk, first_index):
+            row = {
+                'source_file': path, 'record': index,
+                'event_time': None, 'source_ip': None, 'event_type': None,
+                'is_anomaly': None, 'confidence': None, 'ml_anomaly': None, 'ml_confidence': None,
+                'ml_reasons': [], 'patterns': [], 'threat_types': [], 'error': None,
+                'model_version': self.model_version, 'rule_version': self.rule_version,
+            }
+            if not isinstance(record, dict):
+                row['error'] = 'Record is not a JSON object'
+                rows.append(row)
+                continue
+            result = next(results)
+            ml_result = result['ml_result']
+            row.update(
+                event_time=_text(record.get('event_time')),
+                source_ip=_text(record.get('source_ip')),
+                event_type=_text(record.get('event_type')),
+                is_anomaly=result['is_anomaly'],
+                confidence=float(result['confidence']),
+                ml_anomaly=bool(ml_result['is_anomaly']),
+                ml_confidence=float(ml_result['confidence']),
+                ml_reasons=list(ml_result.get('ethiopian_context', {}).get('reasons', [])),
+                patterns=[name for name, hit in result['pattern_flags'].items() if hit],
+                threat_types=[match['threat_type'] for match in result['threat_intel_matches']],
+                error=ml_result.get('error'),
+            )
+            rows.append(row)
+        return rows
+
+
+class Checkpoint:
+    """Completed inputs of one output directory, rewritten atomically after each file.
+
+    An entry only counts while the input file (size, mtime), the model and rule
+    versions and the output format are unchanged and its output file exists.
+    """
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.files = json.load(f).get('files', {})
+
+    def is_done(self, source, signature, output_path):
+        entry = self.files.get(source)
+        return entry is not None and entry['signature'] == signature and os.path.exists(output_path)
+
+    def record(self, source, signature, output_path, result):
+        self.files[source] = dict(result, signature=signature, output=output_path)
+        partial = self.path + '.partial'
+        with open(partial, 'w') as f:
+            json.dump({'files': self.files}, f, indent=1)
+        os.replace(partial, self.path)
+
+
+_worker = None
+
+
+def _init_worker(registry_root, version, behavior_windows):
+    global _worker
+    # Workers score one file at a time on a single core
+    os.environ['ML_SCORING_WORKERS'] = '0'
+    os.environ['ML_BEHAVIOR_WINDOWS'] = '0'
+    _worker = FileRescorer(registry_root, version, behavior_windows)
+
+
+def _rescore_file(path, output_path, output_format, chunk_size):
+    return _worker.rescore(path, output_path, output_format, chunk_size)
+
+
+class BulkRescorer:
+    """Rescores every log file under some paths into ``output_dir``, one file per task"""
+
+    def __init__(self, output_dir, registry=None, version=None, workers=1, chunk_size=10000,
+                 output_format='ndjson', behavior_windows=False):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {OUTPUT_FORMATS}")
+        if output_format == 'parquet':
+            _require_pyarrow()
+        self.output_dir = output_dir
+        self.registry = registry or ModelRegistry()
+        self.version = version or self.registry.current_version()
+        if self.version is None:
+            raise ValueError(f"No model versions in {self.registry.root}")
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.output_format = output_format
+        self.behavior_windows = behavior_windows
+        self.rule_version = PatternMatcher().rule_version()
+        self.threat_intel = ThreatIntelStore().snapshot.fingerprint
+        normalizer = LogNormalizer.from_env()
+        self.normalized = normalizer is not None
+        self.geoip = normalizer.geoip.fingerprint() if self.normalized and normalizer.geoip is not None else None
+
+    def signature(self, path):
+        stat = os.stat(path)
+        signature = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'model_version': self.version,
+            'rule_version': self.rule_version,
+            'threat_intel': self.threat_intel,
+            'format': self.output_format,
+            'behavior_windows': self.behavior_windows,
+            'normalized': self.normalized,
+        }
+        # Only present with GeoIP on, so existing checkpoints stay valid without it
+        if self.geoip is not None:
+            signature['geoip'] = self.geoip
+        return signature
+
+    def run(self, paths):
+        """Rescore pending files and return totals over the whole run"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        checkpoint = Checkpoint(self.output_dir)
+        pending = []
+        skipped = 0
+        for path, relative in plan_inputs(paths):
+            output_path = os.path.join(self.output_dir, output_name(relative, self.output_format))
+            signature = self.signature(path)
+            if checkpoint.is_done(path, signature, output_path):
+                skipped += 1
+            else:
+                pending.append((path, output_path, signature))
+        print(f"Rescoring {len(pending)} files with model {self.version} ({skipped} already done)")
+
+        totals = {'files': 0, 'skipped': skipped, 'failed': 0, 'rows': 0, 'anomalies': 0, 'errors': 0}
+        start = time.perf_counter()
+        with spawn_pool(self.workers, _init_worker, (self.registry.root, self.version, self.behavior_windows)) as pool:
+            futures = {
+                pool.submit(_rescore_file, path, output_path, self.output_format, self.chunk_size):
+                    (path, output_path, signature)
+                for path, output_path, signature in pending
+            }
+            for future in as_completed(futures):
+                path, output_path, signature = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Left out of the checkpoint, so the next run retries it
+                    totals['failed'] += 1
+                    print(f"  {path}: failed: {e}")
+                    continue
+                checkpoint.record(path, signature, output_path, result)
+                totals['files'] += 1
+                for key in ('rows', 'anomalies', 'errors'):
+                    totals[key] += result[key]
+                print(f"  {path}: {result['rows']} logs, {result['anomalies']} anomalies "
+                      f"in {result['seconds']:.1f}s ({totals['files']}/{len(pending)})")
+        totals['seconds'] = time.perf_counter() - start
+        return totals
@@ -0,0 +1,101 @@
+"""
+BunaSIEM Request Coalescer
+Micro-batches concurrent single-log requests into one scoring call
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from models.metrics import Histogram
+
+SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+
+class RequestCoalescer:
+    """Collects items for up to ``max_wait_ms`` or ``max_batch_size`` items,
+    scores them with one ``score_batch(items)`` call and hands each caller
+    its own result.
+
+    The batching thread is started lazily and restarted if the process was
+    forked, so it is safe to create the coalescer before pre-fork workers
+    are spawned.
+    """
+
+    def __init__(self, score_batch, max_wait_ms=2.0, max_batch_size=64):
+        self.score_batch = score_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.batch_size = Histogram(SIZE_BUCKETS)
+        self.queue_depth = Histogram(SIZE_BUCKETS)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, score_batch):
+        """Coalescer configured by ML_COALESCE_*, or None when it is switched off"""
+        max_wait_ms = float(os.getenv('ML_COALESCE_MAX_WAIT_MS', 0))
+        if max_wait_ms <= 0:
+            return None
+        return cls(score_batch, max_wait_ms=max_wait_ms,
+                   max_batch_size=int(os.getenv('ML_COALESCE_MAX_BATCH', 64)))
+
+    def submit(self, item, timeout=None):
+        """Score one item as part of the next batch and return its result"""
+        self._ensure_running()
+        future = Future()
+        self._queue.put((item, future))
+        return future.result(timeout)
+
+    def _ensure_running(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='request-coalescer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            self.queue_depth.observe(pending.qsize() + 1)
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batch_size.observe(len(batch))
+
+            try:
+                results = self.score_batch([item for item, _ in batch])
+            except Exception:
+                # One bad item must not fail its neighbours: retry them one by one
+                for item, future in batch:
+                    try:
+                        future.set_result(self.score_batch([item])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'max_wait_ms': self.max_wait * 1000.0,
+            'max_batch_size': self.max_batch_size,
+            'queued': self._queue.qsize(),
+            'batch_size': self.batch_size.snapshot(),
+            'queue_depth': self.queue_depth.snapshot(),
+        }
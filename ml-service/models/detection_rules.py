@@ -0,0 +1,721 @@
+"""
+BunaSIEM Detection Rules
+Declarative rules in the detection_rules table shape, compiled into vectorized predicates
+"""
+
+import csv
+import glob
+import hashlib
+import ipaddress
+import json
+import operator
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from models.feature_extractor import numeric_column
+from models.feature_schema import DETECTOR_FEATURES
+from models.ip_ranges import IPRangeIndex
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'detection_rules')
+
+# Rule sets: per-log pattern flags, the detector's high-risk overrides, and
+# multi-step sequences tracked per entity by the correlator
+TARGETS = ('patterns', 'detector', 'sequences')
+
+# Fields each rule set computes per batch instead of reading them from the log;
+# they shadow log fields of the same name
+DERIVED_FIELDS = {
+    'patterns': ('time_of_day', 'hour', 'business_hours', 'weekend', 'holiday', 'ethiopian_ip'),
+    'detector': tuple(DETECTOR_FEATURES) + ('hour', 'business_hours', 'ethiopian_ip'),
+    'sequences': ('time_of_day', 'hour', 'business_hours', 'weekend', 'holiday', 'ethiopian_ip'),
+}
+
+# Pseudo-field tested against CIDR blocks: ip_range = '196.188.0.0/16' matches on source_ip
+IP_RANGE_FIELD = 'ip_range'
+
+# Confidence weight of a pattern rule hit, unless its rule_content sets "weight"
+SEVERITY_WEIGHTS = {'low': 0.3, 'medium': 0.4, 'high': 0.5, 'critical': 0.6}
+
+# Fields a sequence can follow, and the time bound of a step that sets none
+SEQUENCE_KEYS = ('source_ip', 'username')
+DEFAULT_STEP_SECONDS = 3600
+
+Rule = namedtuple('Rule', 'name target severity weight message condition node')
+Sequence = namedtuple('Sequence', 'name severity message key steps signature')
+Step = namedtuple('Step', 'condition node min_count count_field within')
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<number>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+  | (?P<op><=|>=|!=|<>|==|=|<|>|[(),\[\]])
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)
+)""", re.VERBOSE)
+_KEYWORDS = {'AND', 'OR', 'NOT', 'IN', 'TRUE', 'FALSE'}
+_TIME_LITERAL = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}(?:\.\d+)?))?')
+
+_ORDERING = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+_EQUALITY = {'=': False, '==': False, '!=': True, '<>': True}
+
+# Evaluation order inside AND/OR: table lookups first, then thresholds, CIDR searches and compound nodes
+_COST = {'in': 0, 'truthy': 0, 'cmp': 1, 'cidr': 2, 'not': 3, 'and': 3, 'or': 3}
+
+
+class RuleError(ValueError):
+    """A rule that cannot be parsed or compiled"""
+
+
+def tokenize(text):
+    """(kind, value) tokens of a condition"""
+    tokens = []
+    text = text.rstrip()
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise RuleError(f"Unexpected {text[position:].strip()[:20]!r} at offset {position} in {text!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            value = value[1:-1].replace(value[0] * 2, value[0])
+        elif kind == 'number':
+            value = float(value) if any(c in value for c in '.eE') else int(value)
+        elif kind == 'word' and value.upper() in _KEYWORDS:
+            kind, value = 'keyword', value.upper()
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    """Recursive descent over the condition grammar:
+
+        expr    := and (OR and)*
+        and     := not (AND not)*
+        not     := NOT not | '(' expr ')' | field [NOT] IN list | field op literal | field
+        list    := '(' literal (',' literal)* ')'  (or square brackets)
+        op      := = == != <> < <= > >=
+        literal := number | 'string' | "string" | TRUE | FALSE
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.position = 0
+
+    def parse(self):
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise self.error('Unexpected')
+        return node
+
+    def error(self, message):
+        token = self.tokens[self.position][1] if self.position < len(self.tokens) else 'end of condition'
+        return RuleError(f"{message} {token!r} in {self.text!r}")
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def accept(self, kind, value):
+        if self.peek() == (kind, value):
+            self.position += 1
+            return True
+        return False
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept('keyword', 'OR'):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.accept('keyword', 'AND'):
+            terms.append(self.parse_not())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    def parse_not(self):
+        if self.accept('keyword', 'NOT'):
+            return ('not', self.parse_not())
+        if self.accept('op', '('):
+            node = self.parse_or()
+            if not self.accept('op', ')'):
+                raise self.error('Expected ) before')
+            return node
+        kind, field = self.peek()
+        if kind != 'word':
+            raise self.error('Expected a field name before')
+        self.position += 1
+        negate = self.accept('keyword', 'NOT')
+        if self.accept('keyword', 'IN'):
+            node = ('in', field, self.parse_list())
+            return ('not', node) if negate else node
+        if negate:
+            raise self.error('Expected IN before')
+        kind, op = self.peek()
+        if kind == 'op' and (op in _ORDERING or op in _EQUALITY):
+            self.position += 1
+            return ('cmp', field, op, self.parse_literal())
+        return ('truthy', field)
+
+    def parse_list(self):
+        if self.accept('op', '('):
+            close = ')'
+        elif self.accept('op', '['):
+            close = ']'
+        else:
+            raise self.error('Expected a list before')
+        values = [self.parse_literal()]
+        while self.accept('op', ','):
+            values.append(self.parse_literal())
+        if not self.accept('op', close):
+            raise self.error(f"Expected {close} before")
+        return values
+
+    def parse_literal(self):
+        kind, value = self.peek()
+        if kind in ('number', 'string'):
+            self.position += 1
+            return value
+        if kind == 'keyword' and value in ('TRUE', 'FALSE'):
+            self.position += 1
+            return value == 'TRUE'
+        raise self.error('Expected a number, string, TRUE or FALSE before')
+
+
+def parse_condition(text):
+    """Syntax tree of a condition string"""
+    if not isinstance(text, str) or not text.strip():
+        raise RuleError('A rule needs a non-empty "condition" string')
+    return _Parser(text).parse()
+
+
+def _threshold(value, text):
+    if isinstance(value, str):
+        match = _TIME_LITERAL.fullmatch(value)
+        if match is None:
+            raise RuleError(f"Ordering comparisons need a number or an HH:MM[:SS] time, not {value!r} in {text!r}")
+        hours, minutes, seconds = match.groups()
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds or 0)
+    return float(value)
+
+
+def _parse_bool(value, default):
+    if isinstance(value, bool):
+        return value
+    if value is None or value == '':
+        return default
+    return str(value).strip().lower() in ('t', 'true', '1', 'yes')
+
+
+def _parse_array(value):
+    """List from a JSON array or a Postgres array literal such as {"ET"} or {ET,KE}"""
+    if value is None or isinstance(value, (list, tuple)):
+        return list(value) if value else None
+    text = str(value).strip()
+    if not text:
+        return None
+    if text.startswith('['):
+        return json.loads(text)
+    items = [item.strip().strip('"') for item in text.strip('{}').split(',')]
+    return [item for item in items if item] or None
+
+
+def _object_array(values):
+    array = np.empty(len(values), dtype=object)
+    array[:] = list(values)
+    return array
+
+
+def _factorize(values):
+    """(codes, uniques) with code -1 for missing and unhashable values"""
+    import pandas as pd
+
+    try:
+        return pd.factorize(values)
+    except TypeError:
+        codes = np.full(len(values), -1, dtype=np.intp)
+        seen = {}
+        for i, value in enumerate(values):
+            try:
+                codes[i] = seen.setdefault(value, len(seen))
+            except TypeError:
+                pass
+        return codes, list(seen)
+
+
+class RuleInputs:
+    """Columns one batch of logs offers the rules.
+
+    ``fields(name)`` reads a log field as a sequence with one value per log.
+    ``derived`` maps the names the caller computes to arrays, or to functions
+    called on first use. Every column is built at most once per batch.
+    """
+
+    def __init__(self, size, fields, derived=None):
+        self.size = size
+        self._fields = fields
+        self._derived = derived or {}
+        self._values = {}
+        self._numbers = {}
+
+    def values(self, name):
+        values = self._values.get(name)
+        if values is None:
+            source = self._derived.get(name)
+            if source is None:
+                values = _object_array(self._fields(name))
+            else:
+                values = np.asarray(source() if callable(source) else source)
+            self._values[name] = values
+        return values
+
+    def numbers(self, name):
+        """float64 view of a column; NaN (never passes a threshold) where a log value is not a number"""
+        numbers = self._numbers.get(name)
+        if numbers is None:
+            values = self.values(name)
+            if values.dtype.kind in 'biuf':
+                numbers = values.astype(np.float64)
+            else:
+                numbers, ok = numeric_column(values.tolist())
+                numbers[~ok] = np.nan
+            self._numbers[name] = numbers
+        return numbers
+
+    def truth(self, name):
+        return self.values(name).astype(bool)
+
+
+def normalize_record(record):
+    """Rule dict in the detection_rules row shape, with defaults filled in; None for rules that do not load"""
+    name = str(record.get('name') or '').strip()
+    if not name:
+        raise RuleError(f"Rule without a name: {record!r}")
+    if not _parse_bool(record.get('is_active'), True):
+        return None
+    rule_type = str(record.get('rule_type') or 'sigma').lower()
+    if rule_type not in ('sigma', 'custom'):
+        print(f"Skipping detection rule {name}: {rule_type} rules are not supported by the ML service")
+        return None
+
+    content = record.get('rule_content') or {}
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except ValueError as e:
+            raise RuleError(f"Rule {name}: rule_content is not JSON: {e}")
+    severity = str(record.get('severity') or 'medium').lower()
+    if severity not in SEVERITY_WEIGHTS:
+        raise RuleError(f"Rule {name}: unknown severity {severity!r}")
+    target = content.get('target', 'patterns')
+    if target not in TARGETS:
+        raise RuleError(f"Rule {name}: target must be one of {', '.join(TARGETS)}, not {target!r}")
+    rule = {
+        'name': name,
+        'target': target,
+        'severity': severity,
+        'weight': float(content.get('weight', SEVERITY_WEIGHTS[severity])),
+        'message': content.get('message') or record.get('description') or name,
+        'condition': content.get('condition'),
+        'event_types': content.get('event_types') or None,
+        'applies_to_regions': _parse_array(record.get('applies_to_regions')),
+        'business_hours_only': _parse_bool(record.get('business_hours_only'), False),
+    }
+    if target == 'sequences':
+        rule.update(_sequence_content(name, content))
+    return rule
+
+
+def _sequence_content(name, content):
+    """The key and steps of a sequence rule's rule_content"""
+    key = content.get('key', 'source_ip')
+    if key not in SEQUENCE_KEYS:
+        raise RuleError(f"Rule {name}: key must be one of {', '.join(SEQUENCE_KEYS)}, not {key!r}")
+    steps = content.get('steps')
+    if not isinstance(steps, list) or not steps:
+        raise RuleError(f"Rule {name}: a sequence needs a non-empty \"steps\" list")
+    default_within = float(content.get('within_seconds', DEFAULT_STEP_SECONDS))
+    normalized = []
+    for step in steps:
+        if isinstance(step, str):
+            step = {'condition': step}
+        try:
+            min_count = int(step.get('min_count', 1))
+            within = float(step.get('within_seconds', default_within))
+        except (TypeError, ValueError) as e:
+            raise RuleError(f"Rule {name}: bad sequence step {step!r}: {e}")
+        if min_count < 1 or within <= 0:
+            raise RuleError(f"Rule {name}: steps need min_count >= 1 and within_seconds > 0")
+        normalized.append({
+            'condition': step.get('condition'),
+            'min_count': min_count,
+            'count_field': step.get('count_field') or None,
+            'within_seconds': within,
+        })
+    return {'key': key, 'steps': normalized}
+
+
+class RuleSet:
+    """Compiled, immutable rules of one version of the rule files.
+
+    Every distinct sub-expression becomes one node, shared by all rules that
+    contain it and evaluated at most once per batch. Equality and IN tests
+    are grouped by field: the column is factorized once, and one lookup
+    table answers all of that field's tests, so adding rules that select on
+    event_type or city costs a table row rather than a pass over the batch.
+    ip_range tests likewise share a single range lookup of source_ip.
+    """
+
+    def __init__(self, records=(), version=0):
+        self.version = version
+        self.loaded_at = time.time()
+        self.rules = {target: [] for target in TARGETS}
+        self._nodes = []
+        self._ids = {}
+        # field -> {value: [column of the field's lookup table]}, and the node ids of those columns
+        self._set_index = {}
+        self._set_nodes = {}
+        self._cidr_index = None
+        self._cidr_table = None
+        self._cidr_nodes = []
+        self.log_fields = {target: set() for target in TARGETS}
+
+        normalized = []
+        for record in records:
+            rule = normalize_record(record)
+            if rule is not None:
+                normalized.append(rule)
+        names = set()
+        for rule in normalized:
+            if rule['name'] in names:
+                raise RuleError(f"Duplicate detection rule name {rule['name']!r}")
+            names.add(rule['name'])
+            self._add_rule(rule)
+
+        self._index_cidrs()
+        self.log_fields = {target: sorted(fields) for target, fields in self.log_fields.items()}
+        # time_of_day thresholds, for result cache keys that must separate logs the rules tell apart
+        self.time_thresholds = sorted({node[1][2] for node in self._nodes
+                                       if node[0] == 'cmp' and node[1][0] == 'time_of_day'})
+        config = json.dumps(normalized, sort_keys=True, default=str)
+        self.fingerprint = hashlib.blake2b(config.encode(), digest_size=8).hexdigest()
+
+    def __len__(self):
+        return sum(len(rules) for rules in self.rules.values())
+
+    def _add_rule(self, rule):
+        if rule['target'] == 'sequences':
+            self._add_sequence(rule)
+            return
+        text = rule['condition']
+        node = self._compile(self._restrict(parse_condition(text), rule), rule['target'], text)
+        self.rules[rule['target']].append(Rule(rule['name'], rule['target'], rule['severity'], rule['weight'],
+                                               rule['message'], text, node))
+
+    def _add_sequence(self, rule):
+        # event_types, regions and business_hours_only narrow every step
+        steps = []
+        for step in rule['steps']:
+            text = step['condition']
+            node = self._compile(self._restrict(parse_condition(text), rule), 'sequences', text)
+            if step['count_field']:
+                self._use_field(step['count_field'], 'sequences')
+            steps.append(Step(text, node, step['min_count'], step['count_field'], step['within_seconds']))
+        self._use_field(rule['key'], 'sequences')
+        signature = json.dumps(rule, sort_keys=True, default=str)
+        self.rules['sequences'].append(Sequence(rule['name'], rule['severity'], rule['message'], rule['key'],
+                                                tuple(steps), signature))
+
+    @staticmethod
+    def _restrict(tree, rule):
+        if rule['event_types']:
+            tree = ('and', [tree, ('in', 'event_type', list(rule['event_types']))])
+        if rule['applies_to_regions']:
+            tree = ('and', [tree, ('in', 'country_code', rule['applies_to_regions'])])
+        if rule['business_hours_only']:
+            tree = ('and', [tree, ('truthy', 'business_hours')])
+        return tree
+
+    def _node(self, kind, payload):
+        key = (kind, payload)
+        node_id = self._ids.get(key)
+        if node_id is None:
+            node_id = self._ids[key] = len(self._nodes)
+            self._nodes.append(key)
+            if kind == 'in':
+                field, values = payload
+                index = self._set_index.setdefault(field, {})
+                column = len(self._set_nodes.setdefault(field, []))
+                self._set_nodes[field].append(node_id)
+                for value in values:
+                    index.setdefault(value, []).append(column)
+        return node_id
+
+    def _index_cidrs(self):
+        # One range index over every block of every ip_range test. A lookup
+        # returns the most specific block holding the address; an address is
+        # in a test's blocks exactly when that block nests inside one of them.
+        self._cidr_nodes = [node_id for node_id, (kind, _) in enumerate(self._nodes) if kind == 'cidr']
+        if not self._cidr_nodes:
+            return
+        blocks = sorted({block for node_id in self._cidr_nodes for block in self._nodes[node_id][1]})
+        self._cidr_index = IPRangeIndex([(block, block) for block in blocks])
+        networks = [ipaddress.ip_network(label) for label in self._cidr_index.labels]
+        # The extra last row is what label -1 (no block, or not an address) selects
+        self._cidr_table = np.zeros((len(networks) + 1, len(self._cidr_nodes)), dtype=bool)
+        for column, node_id in enumerate(self._cidr_nodes):
+            outer = [ipaddress.ip_network(block) for block in self._nodes[node_id][1]]
+            for row, network in enumerate(networks):
+                self._cidr_table[row, column] = any(
+                    network.version == block.version and network.subnet_of(block) for block in outer)
+
+    def _use_field(self, field, target):
+        if field == IP_RANGE_FIELD:
+            field = 'source_ip'
+        if field not in DERIVED_FIELDS[target]:
+            self.log_fields[target].add(field)
+
+    def _compile(self, tree, target, text):
+        kind = tree[0]
+        if kind == 'truthy':
+            self._use_field(tree[1], target)
+            return self._node('truthy', tree[1])
+        if kind == 'in' or (kind == 'cmp' and tree[2] in _EQUALITY):
+            field = tree[1]
+            values = tree[2] if kind == 'in' else [tree[3]]
+            self._use_field(field, target)
+            if field == IP_RANGE_FIELD:
+                try:
+                    blocks = frozenset(str(ipaddress.ip_network(str(value), strict=False)) for value in values)
+                except ValueError as e:
+                    raise RuleError(f"Bad CIDR block in {text!r}: {e}")
+                node = self._node('cidr', blocks)
+            else:
+                node = self._node('in', (field, frozenset(values)))
+            return self._node('not', node) if kind == 'cmp' and _EQUALITY[tree[2]] else node
+        if kind == 'cmp':
+            _, field, op, value = tree
+            if field == IP_RANGE_FIELD:
+                raise RuleError(f"{IP_RANGE_FIELD} only supports = and IN in {text!r}")
+            self._use_field(field, target)
+            return self._node('cmp', (field, op, _threshold(value, text)))
+        if kind == 'not':
+            child = self._compile(tree[1], target, text)
+            # NOT NOT x is x
+            if self._nodes[child][0] == 'not':
+                return self._nodes[child][1]
+            return self._node('not', child)
+        # AND/OR: flatten nested terms of the same kind and drop repeats
+        children = set()
+        for term in tree[1]:
+            child = self._compile(term, target, text)
+            if self._nodes[child][0] == kind:
+                children.update(self._nodes[child][1])
+            else:
+                children.add(child)
+        if len(children) == 1:
+            return children.pop()
+        order = sorted(children, key=lambda node_id: (_COST[self._nodes[node_id][0]], node_id))
+        return self._node(kind, tuple(order))
+
+    def evaluate(self, target, inputs):
+        """(rule, hit mask) for each rule of ``target``, in rule order"""
+        memo = {}
+        return [(rule, self._evaluate(rule.node, inputs, memo)) for rule in self.rules[target]]
+
+    def evaluate_steps(self, inputs):
+        """(sequence, [hit mask per step]) for each sequence rule"""
+        memo = {}
+        return [(sequence, [self._evaluate(step.node, inputs, memo) for step in sequence.steps])
+                for sequence in self.rules['sequences']]
+
+    def _evaluate(self, node_id, inputs, memo):
+        mask = memo.get(node_id)
+        if mask is not None:
+            return mask
+        kind, payload = self._nodes[node_id]
+        if kind == 'in':
+            self._evaluate_sets(payload[0], inputs, memo)
+            return memo[node_id]
+        if kind == 'cmp':
+            field, op, value = payload
+            mask = _ORDERING[op](inputs.numbers(field), value)
+        elif kind == 'truthy':
+            mask = inputs.truth(payload)
+        elif kind == 'cidr':
+            hits = self._cidr_table[self._cidr_index.lookup_many(inputs.values('source_ip'))]
+            for column, cidr_node in enumerate(self._cidr_nodes):
+                memo[cidr_node] = hits[:, column]
+            return memo[node_id]
+        elif kind == 'not':
+            mask = ~self._evaluate(payload, inputs, memo)
+        elif kind == 'and':
+            mask = None
+            for child in payload:
+                child_mask = self._evaluate(child, inputs, memo)
+                mask = child_mask if mask is None else mask & child_mask
+                if not mask.any():
+                    break
+        else:
+            mask = None
+            for child in payload:
+                child_mask = self._evaluate(child, inputs, memo)
+                mask = child_mask if mask is None else mask | child_mask
+                if mask.all():
+                    break
+        memo[node_id] = mask
+        return mask
+
+    def _evaluate_sets(self, field, inputs, memo):
+        index = self._set_index[field]
+        nodes = self._set_nodes[field]
+        codes, uniques = _factorize(inputs.values(field))
+        # The extra last row is what code -1 (missing or unhashable) selects
+        table = np.zeros((len(uniques) + 1, len(nodes)), dtype=bool)
+        for row, value in enumerate(uniques):
+            columns = index.get(value)
+            if columns:
+                table[row, columns] = True
+        hits = table[codes]
+        for column, node_id in enumerate(nodes):
+            memo[node_id] = hits[:, column]
+
+    def time_class(self, seconds):
+        """Where a time of day falls relative to every time_of_day threshold of the rules"""
+        return tuple((seconds > t) - (seconds < t) for t in self.time_thresholds)
+
+    def stats(self):
+        kinds = {}
+        for kind, _ in self._nodes:
+            kinds[kind] = kinds.get(kind, 0) + 1
+        return {
+            'version': self.version,
+            'fingerprint': self.fingerprint,
+            'loaded_at': self.loaded_at,
+            'rules': {target: len(rules) for target, rules in self.rules.items()},
+            'nodes': len(self._nodes),
+            'node_kinds': kinds,
+            'indexed_fields': sorted(self._set_index),
+        }
+
+
+class DetectionRuleStore:
+    """Loads rule files and swaps in newly compiled rule sets without blocking readers.
+
+    Readers take ``self.snapshot`` once per batch. A reload compiles the next
+    RuleSet off to the side and publishes it with one reference assignment;
+    files that fail to parse or compile leave the previous version serving.
+    """
+
+    RULE_PATTERNS = ['*.json', '*.ndjson', '*.jsonl', '*.csv']
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('DETECTION_RULES_PATH', DEFAULT_RULES_PATH)
+        self.snapshot = None
+        self._signature = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watch_interval = None
+        self._stop = threading.Event()
+        self.reload()
+        if self.snapshot is None:
+            # Nothing to keep serving; fail loudly instead of running without rules
+            raise RuleError(f"No usable detection rules at {self.path}")
+
+    def rule_files(self):
+        if os.path.isfile(self.path):
+            return [self.path]
+        files = []
+        for pattern in self.RULE_PATTERNS:
+            files.extend(glob.glob(os.path.join(self.path, pattern)))
+        return sorted(files)
+
+    def _file_signature(self, files):
+        signature = []
+        for path in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def reload(self, force=False):
+        """Recompile the rules if any rule file changed. Returns True if it swapped."""
+        with self._reload_lock:
+            files = self.rule_files()
+            signature = self._file_signature(files)
+            if not force and signature == self._signature:
+                return False
+            version = self.snapshot.version + 1 if self.snapshot is not None else 1
+            try:
+                records = []
+                for path in files:
+                    records.extend(self.read_rules(path))
+                snapshot = RuleSet(records, version=version)
+            except Exception as e:
+                print(f"Detection rule reload failed, keeping version {version - 1}: {e}")
+                # Retry once the files change again, not on every poll
+                self._signature = signature
+                return False
+            self.snapshot = snapshot
+            self._signature = signature
+            print(f"Detection rules version {version} loaded: {len(snapshot)} rules from {len(files)} files")
+            return True
+
+    @staticmethod
+    def read_rules(path):
+        """Rule records from a CSV table export, a JSON array or {"rules": [...]}, or NDJSON"""
+        if path.endswith('.csv'):
+            with open(path, newline='') as f:
+                return list(csv.DictReader(f))
+        with open(path) as f:
+            if path.endswith(('.ndjson', '.jsonl')):
+                return [json.loads(line) for line in f if line.strip()]
+            data = json.load(f)
+        return data.get('rules', []) if isinstance(data, dict) else data
+
+    def start_watcher(self, interval):
+        """Poll the rule files every ``interval`` seconds and reload on change"""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.reload()
+
+        self._watcher = threading.Thread(target=watch, name='detection-rule-watcher', daemon=True)
+        self._watcher.start()
+
+        if self._watch_interval is None and hasattr(os, 'register_at_fork'):
+            # Threads do not survive fork(); pre-fork workers start their own
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+        self._watch_interval = interval
+
+    def _restart_after_fork(self):
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self.start_watcher(self._watch_interval)
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def stats(self):
+        return dict(self.snapshot.stats(), path=self.path, files=len(self._signature or ()))
+
+
+_store = None
+
+
+def detection_rules():
+    """Process-wide rule store shared by the detector and the pattern matcher"""
+    global _store
+    if _store is None:
+        _store = DetectionRuleStore()
+    return _store
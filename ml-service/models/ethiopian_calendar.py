@@ -0,0 +1,353 @@
+"""
+BunaSIEM Ethiopian Calendar
+East Africa Time normalization and precomputed day and minute tables of
+holidays, weekends, business hours and night hours
+"""
+
+import hashlib
+import math
+import os
+import re
+from datetime import date, datetime, time, timedelta, timezone
+
+import numpy as np
+
+# East Africa Time, UTC+3 all year (no daylight saving). Timestamps with an
+# offset or Z are converted to it; timestamps without one are taken as EAT.
+EAT = timezone(timedelta(hours=3), 'EAT')
+EAT_OFFSET_MINUTES = 180
+
+# Years covered by the day table; dates outside it still get a weekday but no holidays
+FIRST_YEAR = 1900
+LAST_YEAR = 2199
+
+BUSINESS_HOURS = (time(8, 30), time(17, 30))
+NIGHT_HOURS = (6, 22)  # night is before 06:00 and from 23:00
+
+# Public holidays on a fixed date of the Ethiopian calendar: (month, day)
+ETHIOPIAN_FIXED_HOLIDAYS = [
+    ('Enkutatash (Ethiopian New Year)', 1, 1),
+    ('Meskel (Finding of the True Cross)', 1, 17),
+    ('Timket (Epiphany)', 5, 11),
+    ('Adwa Victory Day', 6, 23),
+    ("Patriots' Victory Day", 8, 27),
+    ('Downfall of the Derg', 9, 20),
+]
+
+# Public holidays on a fixed Gregorian date: (month, day)
+GREGORIAN_FIXED_HOLIDAYS = [
+    ("International Workers' Day", 5, 1),
+]
+
+# Islamic holidays: (Hijri month, day)
+ISLAMIC_HOLIDAYS = [
+    ('Mawlid (Birth of the Prophet)', 3, 12),
+    ('Eid al-Fitr', 10, 1),
+    ('Eid al-Adha', 12, 10),
+]
+
+_UNIX_EPOCH_JDN = 2440588
+_DAY_NS = 86400 * 10 ** 9
+
+_TZ_SUFFIX = re.compile(r'\s*(?:(Z)|([+-])(\d{2}):?(\d{2}))$')
+
+
+def gregorian_to_jdn(year, month, day):
+    a = (14 - month) // 12
+    y = year + 4800 - a
+    m = month + 12 * a - 3
+    return day + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
+
+
+def julian_to_jdn(year, month, day):
+    a = (14 - month) // 12
+    y = year + 4800 - a
+    m = month + 12 * a - 3
+    return day + (153 * m + 2) // 5 + 365 * y + y // 4 - 32083
+
+
+def ethiopian_to_jdn(year, month, day):
+    """Julian day number of an Ethiopian (Amete Mihret) date; month 13 is Pagume"""
+    return 1724220 + 365 * (year - 1) + year // 4 + 30 * (month - 1) + day
+
+
+def islamic_to_jdn(year, month, day):
+    """Julian day number of a date of the tabular Islamic calendar.
+
+    Observed Eid dates follow the sighting of the moon and can fall a day
+    either side; ML_EXTRA_HOLIDAYS adds the announced date where they differ.
+    """
+    return day + math.ceil(29.5 * (month - 1)) + (year - 1) * 354 + (3 + 11 * year) // 30 + 1948439
+
+
+def orthodox_easter(year):
+    """Fasika: Easter of the Julian calendar (Meeus), as a Gregorian date"""
+    a, b, c = year % 4, year % 7, year % 19
+    d = (19 * c + 15) % 30
+    e = (2 * a + 4 * b - d + 34) % 7
+    month, day = divmod(d + e + 114, 31)
+    return _jdn_date(julian_to_jdn(year, month, day + 1))
+
+
+def _jdn_date(jdn):
+    return date(1970, 1, 1) + timedelta(days=jdn - _UNIX_EPOCH_JDN)
+
+
+def ethiopian_holidays(year):
+    """(date, name) of the public holidays in a Gregorian year, sorted"""
+    found = []
+    # Genna falls on Julian 25 December, which is 7 January until 2100
+    found.append((_jdn_date(julian_to_jdn(year - 1, 12, 25)), 'Genna (Ethiopian Christmas)'))
+    # An Ethiopian year starts in September: the Gregorian year spans two of them
+    for ethiopian_year in (year - 8, year - 7):
+        for name, month, day in ETHIOPIAN_FIXED_HOLIDAYS:
+            found.append((_jdn_date(ethiopian_to_jdn(ethiopian_year, month, day)), name))
+    for name, month, day in GREGORIAN_FIXED_HOLIDAYS:
+        found.append((date(year, month, day), name))
+    easter = orthodox_easter(year)
+    found.append((easter - timedelta(days=2), 'Siklet (Ethiopian Good Friday)'))
+    found.append((easter, 'Fasika (Ethiopian Easter)'))
+    # Hijri years are about 11 days shorter; up to two of each feast fall in a Gregorian year
+    first_hijri = (year - 622) * 33 // 32
+    for hijri_year in range(first_hijri - 1, first_hijri + 3):
+        for name, month, day in ISLAMIC_HOLIDAYS:
+            found.append((_jdn_date(islamic_to_jdn(hijri_year, month, day)), name))
+    return sorted((day, name) for day, name in found if day.year == year)
+
+
+def _minutes(sign, hours, minutes):
+    offset = int(hours) * 60 + int(minutes)
+    return -offset if sign == '-' else offset
+
+
+def _split_offset(value):
+    """(text without the UTC offset, offset in minutes), EAT for naive text"""
+    # Cheap checks for the common 'Z' and '+03:00' endings before the regex scan
+    if value[-1:] == 'Z' and value[-2:-1].isdigit():
+        return value[:-1], 0
+    if value[-6:-5] in ('+', '-') and value[-3:-2] == ':' and value[-5:-3].isdigit() and value[-2:].isdigit():
+        return value[:-6], _minutes(value[-6], value[-5:-3], value[-2:])
+    match = _TZ_SUFFIX.search(value)
+    if match is None:
+        return value, EAT_OFFSET_MINUTES
+    zulu, sign, hours, minutes = match.groups()
+    return value[:match.start()], 0 if zulu else _minutes(sign, hours, minutes)
+
+
+def _parse_single(value):
+    """(EAT day, EAT time of day in microseconds, parsed) for a value the ISO 8601 fast path cannot read.
+
+    NaT reads as (nan, nan, True): a value pandas accepts as missing time.
+    """
+    import pandas as pd
+
+    try:
+        dt = pd.to_datetime(value)
+        if pd.isna(dt):
+            return np.nan, np.nan, True
+        if dt.tzinfo is not None:
+            dt = dt.tz_convert(EAT).tz_localize(None)
+        local_ns = dt.value
+    except Exception:
+        return np.nan, np.nan, False
+    day, rest = divmod(local_ns, _DAY_NS)
+    return day, rest / 1000.0, True
+
+
+def parse_eat(values):
+    """EAT day number (days since 1970-01-01) and time of day for event_time values, in one vectorized pass.
+
+    Returns float64 ``day`` and ``time_us`` (microseconds since EAT midnight),
+    both NaN for NaT, and ``parsed``, False where the value is not a time.
+    """
+    import pandas as pd
+
+    values = list(values)
+    n = len(values)
+    day = np.full(n, np.nan)
+    time_us = np.full(n, np.nan)
+    parsed = np.ones(n, dtype=bool)
+
+    string_index = [i for i, v in enumerate(values) if type(v) is str]
+    fast_ok = np.zeros(n, dtype=bool)
+    if string_index:
+        split = [_split_offset(values[i]) for i in string_index]
+        times = pd.to_datetime(pd.Series([text for text, _ in split], dtype=object), format='ISO8601', errors='coerce')
+        ok = times.notna().to_numpy()
+        index = np.asarray(string_index)[ok]
+        offsets = np.fromiter((offset for _, offset in split), dtype=np.int64, count=len(split))[ok]
+        # Wall-clock nanoseconds at the stated offset, moved to EAT
+        local_ns = times[ok].to_numpy().astype('datetime64[ns]').astype(np.int64) + \
+            (EAT_OFFSET_MINUTES - offsets) * 60 * 10 ** 9
+        days, rest = np.divmod(local_ns, _DAY_NS)
+        day[index] = days
+        time_us[index] = rest / 1000.0
+        fast_ok[index] = True
+
+    for i in np.flatnonzero(~fast_ok):
+        day[i], time_us[i], parsed[i] = _parse_single(values[i])
+    return {'day': day, 'time_us': time_us, 'parsed': parsed}
+
+
+def parse_eat_one(value):
+    """parse_eat of a single value, without building arrays"""
+    if type(value) is str:
+        text, offset = _split_offset(value)
+        try:
+            dt = datetime.fromisoformat(text)
+        except ValueError:
+            dt = None
+        if dt is not None and dt.tzinfo is None:
+            dt -= timedelta(minutes=offset - EAT_OFFSET_MINUTES)
+            day = (dt.date() - date(1970, 1, 1)).days
+            time_us = ((dt.hour * 60 + dt.minute) * 60 + dt.second) * 1e6 + dt.microsecond
+            return day, time_us, True
+    return _parse_single(value)
+
+
+class EthiopianCalendar:
+    """Dense lookup tables for the time features of EAT timestamps.
+
+    One row per day from FIRST_YEAR to LAST_YEAR holds the weekday and the
+    weekend and holiday flags; one row per minute of the day holds the hour
+    and the business-hours and night-hours flags. A batch's features are two
+    array indexes once its timestamps are parsed.
+    """
+
+    def __init__(self, first_year=FIRST_YEAR, last_year=LAST_YEAR, extra_holidays=(),
+                 business_hours=BUSINESS_HOURS, night_hours=NIGHT_HOURS):
+        self.first_year = first_year
+        self.last_year = last_year
+        self.business_hours = business_hours
+        self.night_hours = night_hours
+        self.first_day = (date(first_year, 1, 1) - date(1970, 1, 1)).days
+        n_days = (date(last_year, 12, 31) - date(first_year, 1, 1)).days + 1
+
+        days = np.arange(self.first_day, self.first_day + n_days)
+        # 1970-01-01 was a Thursday; Monday is 0 as in datetime.weekday()
+        self.day_of_week = ((days + 3) % 7).astype(np.int8)
+        self.is_weekend = self.day_of_week >= 5
+        self.is_holiday = np.zeros(n_days, dtype=bool)
+        self.holiday_names = {}
+        for year in range(first_year, last_year + 1):
+            for day, name in ethiopian_holidays(year):
+                self._add_holiday(day, name)
+        for day in extra_holidays:
+            self._add_holiday(day, 'Announced holiday')
+
+        minutes = np.arange(1440)
+        self.hour = (minutes // 60).astype(np.int8)
+        start, end = (t.hour * 60 + t.minute for t in business_hours)
+        self.is_business_hours = (minutes >= start) & (minutes <= end)
+        self.is_night_hours = (self.hour < night_hours[0]) | (self.hour > night_hours[1])
+
+    @classmethod
+    def from_env(cls):
+        """Calendar with the YYYY-MM-DD dates of ML_EXTRA_HOLIDAYS added"""
+        extra = [date.fromisoformat(item.strip()) for item in os.getenv('ML_EXTRA_HOLIDAYS', '').split(',')
+                 if item.strip()]
+        return cls(extra_holidays=extra)
+
+    def _add_holiday(self, day, name):
+        row = (day - date(1970, 1, 1)).days - self.first_day
+        if 0 <= row < len(self.is_holiday):
+            self.is_holiday[row] = True
+            self.holiday_names.setdefault(day, []).append(name)
+
+    def holidays(self, year):
+        """(date, names) of the holidays in one year of the table"""
+        return sorted((day, names) for day, names in self.holiday_names.items() if day.year == year)
+
+    def lookup(self, day, time_us, parsed=None):
+        """Time features of EAT (day, time of day) arrays as parse_eat returns them.
+
+        ``hour`` and ``day_of_week`` are float64 and NaN where the time is
+        missing; the flags are False there.
+        """
+        n = len(day)
+        known = np.isfinite(day) & np.isfinite(time_us)
+        days = np.where(known, day, 0).astype(np.int64)
+        minute = np.where(known, time_us // 60e6, 0).astype(np.int64)
+        row = days - self.first_day
+        in_table = known & (row >= 0) & (row < len(self.is_holiday))
+        row = np.where(in_table, row, 0)
+
+        hour = np.where(known, self.hour[minute], np.nan)
+        day_of_week = np.where(known, (days + 3) % 7, np.nan)
+        return {
+            'day': day,
+            'time_us': time_us,
+            'parsed': parsed if parsed is not None else np.ones(n, dtype=bool),
+            'date': np.where(known, days, np.iinfo(np.int64).min).astype('datetime64[D]'),
+            'hour': hour,
+            'day_of_week': day_of_week,
+            'is_weekend': known & (day_of_week >= 5),
+            'is_holiday': in_table & self.is_holiday[row],
+            'is_business_hours': known & self.is_business_hours[minute],
+            'is_night_hours': known & self.is_night_hours[minute],
+        }
+
+    def features(self, values):
+        """Time features of event_time values (see lookup)"""
+        times = parse_eat(values)
+        return self.lookup(times['day'], times['time_us'], times['parsed'])
+
+    def features_datetimes(self, column):
+        """Time features of a pandas datetime64 column; tz-aware columns are converted to EAT"""
+        if column.dt.tz is not None:
+            column = column.dt.tz_convert(EAT).dt.tz_localize(None)
+        missing = column.isna().to_numpy()
+        local_ns = column.to_numpy().astype('datetime64[ns]').astype(np.int64)
+        days, rest = np.divmod(local_ns, _DAY_NS)
+        day = np.where(missing, np.nan, days.astype(np.float64))
+        time_us = np.where(missing, np.nan, rest / 1000.0)
+        return self.lookup(day, time_us)
+
+    def features_one(self, value):
+        """Time features of a single event_time as a dict of Python scalars, or None if it is not a time"""
+        day, time_us, parsed = parse_eat_one(value)
+        if not parsed:
+            return None
+        if not (np.isfinite(day) and np.isfinite(time_us)):
+            return {'day': np.nan, 'time_us': np.nan, 'hour': np.nan, 'day_of_week': np.nan,
+                    'is_weekend': False, 'is_holiday': False, 'is_business_hours': False, 'is_night_hours': False}
+        day = int(day)
+        minute = int(time_us // 60e6)
+        row = day - self.first_day
+        day_of_week = (day + 3) % 7
+        return {
+            'day': day,
+            'time_us': time_us,
+            'hour': int(self.hour[minute]),
+            'day_of_week': day_of_week,
+            'is_weekend': day_of_week >= 5,
+            'is_holiday': bool(0 <= row < len(self.is_holiday) and self.is_holiday[row]),
+            'is_business_hours': bool(self.is_business_hours[minute]),
+            'is_night_hours': bool(self.is_night_hours[minute]),
+        }
+
+    def fingerprint(self):
+        """Short hash of the table contents; changes with the holidays or the hour ranges"""
+        config = repr((self.first_year, self.last_year, self.business_hours, self.night_hours)).encode()
+        return hashlib.blake2b(config + self.is_holiday.tobytes(), digest_size=8).hexdigest()
+
+
+def epoch_seconds(day, time_us):
+    """UTC epoch seconds of an EAT (day, time of day)"""
+    return day * 86400.0 + time_us / 1e6 - EAT_OFFSET_MINUTES * 60
+
+
+def now_eat():
+    """The current time as an ISO 8601 string in EAT, the default for logs without event_time"""
+    return datetime.now(EAT).isoformat()
+
+
+_calendar = None
+
+
+def ethiopian_calendar():
+    """Process-wide calendar shared by the feature extractors and the pattern matcher"""
+    global _calendar
+    if _calendar is None:
+        _calendar = EthiopianCalendar.from_env()
+    return _calendar
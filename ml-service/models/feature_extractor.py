@@ -0,0 +1,220 @@
+"""
+BunaSIEM Columnar Feature Extraction
+Builds detector feature matrices for whole batches of logs at once
+"""
+
+import sys
+
+import numpy as np
+
+from models.ethiopian_calendar import ethiopian_calendar, now_eat
+from models.feature_schema import DETECTOR_FEATURES, DETECTOR_COMMON_CITIES
+from models.instrumentation import timed
+
+_NUMERIC_TYPES = (int, float, np.integer, np.floating)
+_FAST_TYPES = {int, float, bool}
+
+# What the extractors use for an event_time that is not a time: noon on a Monday
+UNREADABLE_TIME = {
+    'hour': 12,
+    'day_of_week': 0,
+    'is_weekend': False,
+    'is_holiday': False,
+    'is_business_hours': True,
+    'is_night_hours': False,
+}
+
+
+def is_dataframe(value):
+    """isinstance(value, pandas.DataFrame) without importing pandas: nothing is one before pandas is loaded"""
+    pandas = sys.modules.get('pandas')
+    return pandas is not None and isinstance(value, pandas.DataFrame)
+
+
+def event_time_features(event_time):
+    """EAT hour, weekday and calendar flags of one event_time, as the per-log extractors see it"""
+    features = ethiopian_calendar().features_one(event_time)
+    return UNREADABLE_TIME if features is None else features
+
+
+def parse_event_times(values):
+    """Parse event_time values in one vectorized pass, in East Africa Time.
+
+    Returns the arrays of EthiopianCalendar.lookup: float64 ``hour`` and
+    ``day_of_week`` (NaN for NaT), the EAT calendar ``date`` as
+    datetime64[D], the EAT ``time_us`` (microseconds since midnight, NaN for
+    NaT), the weekend, holiday, business-hours and night-hours flags, and
+    ``parsed``, which is False where the value is not a time. Those rows
+    read as UNREADABLE_TIME, except ``time_us``, which stays NaN.
+    """
+    times = ethiopian_calendar().features(values)
+    failed = ~times['parsed']
+    if failed.any():
+        for name, value in UNREADABLE_TIME.items():
+            times[name][failed] = value
+    return times
+
+
+def numeric_column(values):
+    """float64 column plus a mask of the entries that were real numbers"""
+    if all(type(v) in _FAST_TYPES for v in values):
+        try:
+            return np.array(values, dtype=np.float64), np.ones(len(values), dtype=bool)
+        except OverflowError:
+            pass
+    column = np.zeros(len(values), dtype=np.float64)
+    ok = np.zeros(len(values), dtype=bool)
+    for i, v in enumerate(values):
+        if isinstance(v, _NUMERIC_TYPES):
+            try:
+                column[i] = v
+                ok[i] = True
+            except OverflowError:
+                pass
+    return column, ok
+
+
+class FeatureBatch:
+    """Feature matrix for a batch of logs.
+
+    ``matrix`` is a C-contiguous float32 array in DETECTOR_FEATURES order,
+    which is the dtype the Isolation Forest trees evaluate in. ``columns``
+    keeps the float64 values for rule thresholds, and ``valid`` is False for
+    rows whose raw fields could not form a finite numeric vector.
+    """
+
+    def __init__(self, columns, valid, names=DETECTOR_FEATURES):
+        self.names = list(names)
+        self.columns = columns
+        self.valid = valid
+        self.matrix = np.ascontiguousarray(
+            np.column_stack([columns[name] for name in self.names]), dtype=np.float32
+        ) if len(valid) else np.empty((0, len(self.names)), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.valid)
+
+    def row(self, i):
+        """Feature dict for one row, matching AnomalyDetector.extract_features"""
+        return {name: self.columns[name][i] for name in self.names}
+
+
+class ColumnarFeatureExtractor:
+    """Vectorized counterpart of AnomalyDetector.extract_features"""
+
+    def __init__(self, common_cities=DETECTOR_COMMON_CITIES):
+        self.common_cities = list(common_cities)
+
+    @timed('features')
+    def extract(self, logs):
+        """Extract detector features for a list of log dicts or a DataFrame"""
+        if is_dataframe(logs):
+            return self._extract_frame(logs)
+        return self._extract_records(logs)
+
+    def _extract_records(self, logs):
+        n = len(logs)
+        valid = np.fromiter((isinstance(log, dict) for log in logs), dtype=bool, count=n)
+        records = [log if isinstance(log, dict) else {} for log in logs]
+
+        times = parse_event_times(r.get('event_time', now_eat()) for r in records)
+
+        failed_attempts, ok = numeric_column([r.get('failed_attempts', 0) for r in records])
+        valid &= ok
+        request_frequency, ok = numeric_column([r.get('request_count', 1) for r in records])
+        valid &= ok
+        request_size, ok = numeric_column([r.get('bytes_transferred', 0) for r in records])
+        valid &= ok
+        request_size = request_size / 1024.0  # KB
+
+        diversity = np.zeros(n, dtype=np.float64)
+        for i, r in enumerate(records):
+            try:
+                diversity[i] = len(set(r.get('source_ips', [])))
+            except Exception:
+                valid[i] = False
+
+        is_ethiopian_ip = np.fromiter((r.get('country_code') == 'ET' for r in records), dtype=bool, count=n)
+        cities = self.common_cities
+        unusual_location = np.fromiter((r.get('city') not in cities for r in records), dtype=bool, count=n)
+
+        return self._build(times, failed_attempts, diversity, request_frequency,
+                           is_ethiopian_ip, unusual_location, request_size, valid)
+
+    def _extract_frame(self, df):
+        """Column-wise extraction; missing or null cells take the per-log defaults"""
+        import pandas as pd
+
+        n = len(df)
+        valid = np.ones(n, dtype=bool)
+
+        if 'event_time' in df and pd.api.types.is_datetime64_any_dtype(df['event_time']):
+            times = ethiopian_calendar().features_datetimes(df['event_time'])
+        else:
+            times = parse_event_times(self._frame_column(df, 'event_time', now_eat()))
+
+        failed_attempts, ok = self._frame_numeric(df, 'failed_attempts', 0)
+        valid &= ok
+        request_frequency, ok = self._frame_numeric(df, 'request_count', 1)
+        valid &= ok
+        request_size, ok = self._frame_numeric(df, 'bytes_transferred', 0)
+        valid &= ok
+        request_size = request_size / 1024.0  # KB
+
+        diversity = np.zeros(n, dtype=np.float64)
+        if 'source_ips' in df:
+            for i, ips in enumerate(self._frame_column(df, 'source_ips', [])):
+                try:
+                    diversity[i] = len(set(ips))
+                except Exception:
+                    valid[i] = False
+
+        if 'country_code' in df:
+            is_ethiopian_ip = (df['country_code'] == 'ET').to_numpy(dtype=bool)
+        else:
+            is_ethiopian_ip = np.zeros(n, dtype=bool)
+        if 'city' in df:
+            unusual_location = (~df['city'].isin(self.common_cities)).to_numpy(dtype=bool)
+        else:
+            unusual_location = np.ones(n, dtype=bool)
+
+        return self._build(times, failed_attempts, diversity, request_frequency,
+                           is_ethiopian_ip, unusual_location, request_size, valid)
+
+    def _build(self, times, failed_attempts, diversity, request_frequency,
+               is_ethiopian_ip, unusual_location, request_size, valid):
+        hour = times['hour']
+        columns = {
+            'hour_of_day': hour,
+            'is_weekend': times['is_weekend'].astype(np.float64),
+            'failed_attempts': failed_attempts,
+            'source_ip_diversity': diversity,
+            'request_frequency': request_frequency,
+            'is_ethiopian_ip': is_ethiopian_ip.astype(np.float64),
+            'unusual_location': unusual_location.astype(np.float64),
+            'is_business_hours': times['is_business_hours'].astype(np.float64),
+            'request_size': request_size,
+        }
+        # NaN hours (NaT timestamps) make sklearn reject the row, as in predict()
+        valid = valid & np.isfinite(hour) & np.isfinite(failed_attempts) & \
+            np.isfinite(request_frequency) & np.isfinite(request_size)
+        return FeatureBatch(columns, valid)
+
+    def _frame_numeric(self, df, name, default):
+        if name not in df:
+            return np.full(len(df), default, dtype=np.float64), np.ones(len(df), dtype=bool)
+        import pandas as pd
+
+        column = df[name]
+        if pd.api.types.is_numeric_dtype(column):
+            return column.fillna(default).to_numpy(dtype=np.float64), np.ones(len(df), dtype=bool)
+        return numeric_column(self._frame_column(df, name, default))
+
+    def _frame_column(self, df, name, default):
+        if name not in df:
+            return [default] * len(df)
+        return [default if self._is_missing(v) else v for v in df[name].tolist()]
+
+    @staticmethod
+    def _is_missing(value):
+        return value is None or (isinstance(value, float) and np.isnan(value))
@@ -0,0 +1,50 @@
+"""
+BunaSIEM Feature Schema
+Single source of truth for feature column order across the ML service
+"""
+
+# Columns fed to the Isolation Forest, in model input order
+DETECTOR_FEATURES = [
+    'hour_of_day',
+    'is_weekend',
+    'failed_attempts',
+    'source_ip_diversity',
+    'request_frequency',
+    'is_ethiopian_ip',
+    'unusual_location',
+    'is_business_hours',
+    'request_size',
+]
+
+# Columns produced by scripts/feature_engineer.py, in output order
+ENGINEER_FEATURES = [
+    # Time-based
+    'hour_of_day',
+    'is_weekend',
+    'is_holiday',
+    'is_business_hours',
+    'is_night_hours',
+    'day_of_week',
+    # Location-based
+    'is_ethiopian_ip',
+    'is_common_city',
+    'is_telecom_range',
+    'city_unknown',
+    # Behavioral
+    'failed_attempts',
+    'request_frequency',
+    'session_duration',
+    'concurrent_sessions',
+    # Network
+    'bytes_transferred',
+    'request_size_variance',
+    'unique_destinations',
+    'protocol_diversity',
+]
+
+DETECTOR_COMMON_CITIES = ['Addis Ababa', 'Dire Dawa', 'Adama', 'Hawassa', 'Mekele']
+
+
+def feature_index(name, schema=DETECTOR_FEATURES):
+    """Column index of a feature within a schema"""
+    return schema.index(name)
@@ -0,0 +1,412 @@
+"""
+BunaSIEM GeoIP
+Offline IP-to-location lookups over a memory-mapped range file built from a CSV
+"""
+
+import csv
+import hashlib
+import ipaddress
+import mmap
+import os
+import socket
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from models.ip_ranges import ip_to_int
+
+MAGIC = b'BUNAGEO1'
+# magic, IPv4 ranges, IPv6 ranges, locations, string bytes, digest of everything after the header
+_HEADER = struct.Struct('<8s4Q16s')
+_HEADER_SIZE = 64
+
+LOCATION_FIELDS = ('country_code', 'region', 'city')
+_SEPARATOR = '\x1f'
+_MISSING = object()
+
+
+def _layout(n4, n6, n_locations, n_bytes):
+    """(name, dtype, shape, offset) of each section; every section starts 8-byte aligned"""
+    sections = [
+        ('v4_starts', '<u4', (n4,)),
+        ('v4_ends', '<u4', (n4,)),
+        ('v4_locations', '<u4', (n4,)),
+        # IPv6 keys are (high, low) 64-bit halves, since numpy has no 128-bit integer type
+        ('v6_starts', '<u8', (n6, 2)),
+        ('v6_ends', '<u8', (n6, 2)),
+        ('v6_locations', '<u4', (n6,)),
+        ('location_offsets', '<u4', (n_locations + 1,)),
+        ('strings', 'u1', (n_bytes,)),
+    ]
+    layout = []
+    offset = _HEADER_SIZE
+    for name, dtype, shape in sections:
+        layout.append((name, dtype, shape, offset))
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+        offset += -offset % 8
+    return layout
+
+
+def _read_ranges(path):
+    """(version, start, end, location, line) per CSV row; location is (country_code, region, city).
+
+    Rows give either a ``network`` (CIDR) or ``start_ip`` and ``end_ip``, then
+    ``country_code`` and optionally ``region`` and ``city``. Blank lines and
+    lines starting with # are skipped.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        lines = [(number, line) for number, line in enumerate(f, 1)
+                 if line.strip() and not line.lstrip().startswith('#')]
+    reader = csv.DictReader(line for _, line in lines)
+    columns = set(reader.fieldnames or ())
+    if 'country_code' not in columns or not ('network' in columns or {'start_ip', 'end_ip'} <= columns):
+        raise ValueError(f"{path}: needs a network or start_ip,end_ip column and a country_code column")
+
+    ranges = []
+    for (number, _), row in zip(lines[1:], reader):
+        try:
+            if row.get('network'):
+                network = ipaddress.ip_network(row['network'].strip(), strict=False)
+                start, end = ip_to_int(str(network.network_address)), ip_to_int(str(network.broadcast_address))
+            else:
+                start, end = ip_to_int((row['start_ip'] or '').strip()), ip_to_int((row['end_ip'] or '').strip())
+        except ValueError:
+            start = end = None
+        if start is None or end is None or start[0] != end[0] or start[1] > end[1]:
+            raise ValueError(f"{path}:{number}: not an address range")
+        location = ((row.get('country_code') or '').strip().upper(),
+                    (row.get('region') or '').strip(), (row.get('city') or '').strip())
+        ranges.append((start[0], start[1], end[1], location, number))
+    return ranges
+
+
+def _flatten(ranges, path):
+    """Disjoint (start, end, location) segments; nested ranges win over the ranges they sit in.
+
+    Ranges must be nested or disjoint. Adjacent segments with the same
+    location are merged.
+    """
+    # Outer ranges sort before the ranges they contain; a later duplicate wins
+    ranges.sort(key=lambda r: (r[0], -r[1]))
+    segments = []
+    stack = []
+    cursor = None
+
+    def close_until(position):
+        nonlocal cursor
+        while stack and stack[-1][1] < position:
+            start, end, location, _ = stack.pop()
+            if cursor <= end:
+                segments.append((cursor, end, location))
+            cursor = end + 1
+
+    for start, end, location, number in ranges:
+        close_until(start)
+        if stack:
+            if end > stack[-1][1]:
+                raise ValueError(f"{path}:{number}: range partly overlaps the range on line {stack[-1][3]}")
+            if cursor < start:
+                segments.append((cursor, start - 1, stack[-1][2]))
+        stack.append((start, end, location, number))
+        cursor = start
+    close_until(float('inf'))
+
+    merged = []
+    for segment in segments:
+        if merged and merged[-1][2] == segment[2] and merged[-1][1] + 1 == segment[0]:
+            merged[-1] = (merged[-1][0], segment[1], segment[2])
+        else:
+            merged.append(segment)
+    return merged
+
+
+def build_geoip(csv_path, output_path):
+    """Compile a GeoIP CSV into the range file GeoIPResolver maps; returns a summary"""
+    ranges = _read_ranges(csv_path)
+    tables = {version: _flatten([r[1:] for r in ranges if r[0] == version], csv_path) for version in (4, 6)}
+
+    locations = {}
+    for segments in tables.values():
+        for _, _, location in segments:
+            locations.setdefault(location, len(locations))
+    encoded = [_SEPARATOR.join(location).encode('utf-8') for location in locations]
+    offsets = np.cumsum([0] + [len(e) for e in encoded])
+    strings = b''.join(encoded)
+
+    v4, v6 = tables[4], tables[6]
+    arrays = {
+        'v4_starts': [s[0] for s in v4],
+        'v4_ends': [s[1] for s in v4],
+        'v4_locations': [locations[s[2]] for s in v4],
+        'v6_starts': [(s[0] >> 64, s[0] & 0xFFFFFFFFFFFFFFFF) for s in v6],
+        'v6_ends': [(s[1] >> 64, s[1] & 0xFFFFFFFFFFFFFFFF) for s in v6],
+        'v6_locations': [locations[s[2]] for s in v6],
+        'location_offsets': offsets,
+        'strings': np.frombuffer(strings, dtype='u1'),
+    }
+    body = bytearray()
+    for name, dtype, shape, offset in _layout(len(v4), len(v6), len(locations), len(strings)):
+        body += b'\0' * (offset - _HEADER_SIZE - len(body))
+        body += np.asarray(arrays[name], dtype=dtype).reshape(shape).tobytes()
+    digest = hashlib.blake2b(bytes(body), digest_size=16).digest()
+    header = _HEADER.pack(MAGIC, len(v4), len(v6), len(locations), len(strings), digest)
+
+    # Written next to the target and renamed, so running services never map a half-written file
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(_HEADER_SIZE, b'\0'))
+        f.write(body)
+    os.replace(tmp_path, output_path)
+    return {
+        'ipv4_ranges': len(v4),
+        'ipv6_ranges': len(v6),
+        'locations': len(locations),
+        'bytes': _HEADER_SIZE + len(body),
+        'fingerprint': digest.hex(),
+    }
+
+
+class GeoIPResolver:
+    """Country, region and city of IP addresses, read from a build_geoip range file.
+
+    The file is memory-mapped read-only and its arrays are used in place, so
+    opening it costs no parsing and every process mapping the same file
+    shares one page-cache copy. Lookups are binary searches over sorted
+    disjoint ranges; repeated addresses are answered from a small LRU.
+    """
+
+    def __init__(self, path, cache_size=4096, override=False):
+        self.path = path
+        self.cache_size = cache_size
+        self.override = override
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER_SIZE:
+            raise ValueError(f"{path}: not a GeoIP range file")
+        magic, n4, n6, n_locations, n_bytes, digest = _HEADER.unpack_from(self._map)
+        layout = _layout(n4, n6, n_locations, n_bytes)
+        if magic != MAGIC or len(self._map) < layout[-1][3] + n_bytes:
+            raise ValueError(f"{path}: not a GeoIP range file")
+        arrays = {
+            name: np.frombuffer(self._map, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+            for name, dtype, shape, offset in layout
+        }
+        self._v4 = arrays['v4_starts'], arrays['v4_ends'], arrays['v4_locations']
+        self._v6 = arrays['v6_starts'], arrays['v6_ends'], arrays['v6_locations']
+        self._offsets = arrays['location_offsets']
+        self._strings_offset = layout[-1][3]
+        self._fingerprint = digest.hex()
+        self._locations = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.enriched = 0
+
+    @classmethod
+    def from_env(cls):
+        """Resolver over ML_GEOIP_DB, or None when it is unset or unreadable"""
+        path = os.getenv('ML_GEOIP_DB')
+        if not path:
+            return None
+        try:
+            return cls(path, cache_size=int(os.getenv('ML_GEOIP_CACHE_SIZE', 4096)),
+                       override=os.getenv('ML_GEOIP_OVERRIDE', '0').lower() in ('1', 'true', 'yes'))
+        except (OSError, ValueError) as e:
+            print(f" GeoIP database unavailable: {e}")
+            return None
+
+    def __getstate__(self):
+        # Worker processes map the file themselves instead of receiving a copy
+        return {'path': self.path, 'cache_size': self.cache_size, 'override': self.override}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['cache_size'], state['override'])
+
+    def fingerprint(self):
+        """Digest of the range file's contents, stored when it was built"""
+        return self._fingerprint
+
+    def location(self, index):
+        """(country_code, region, city) of a location index"""
+        location = self._locations.get(index)
+        if location is None:
+            start = self._strings_offset + int(self._offsets[index])
+            end = self._strings_offset + int(self._offsets[index + 1])
+            location = self._locations[index] = tuple(self._map[start:end].decode('utf-8').split(_SEPARATOR))
+        return location
+
+    def _search_v4(self, keys):
+        starts, ends, locations = self._v4
+        result = np.full(len(keys), -1, dtype=np.int64)
+        if not len(starts):
+            return result
+        # Keys share the file's dtype, so searchsorted reads the mapped array without converting it
+        position = np.searchsorted(starts, keys, side='right') - 1
+        found = position >= 0
+        position = np.where(found, position, 0)
+        found &= keys <= ends[position]
+        result[found] = locations[position[found]]
+        return result
+
+    def _search_v6(self, high, low):
+        starts, ends, locations = self._v6
+        result = np.full(len(high), -1, dtype=np.int64)
+        n = len(starts)
+        if not n:
+            return result
+        # Vectorized binary search for the first range starting after each key
+        left = np.zeros(len(high), dtype=np.int64)
+        right = np.full(len(high), n, dtype=np.int64)
+        while True:
+            active = left < right
+            if not active.any():
+                break
+            middle = (left + right) // 2
+            probe = starts[np.minimum(middle, n - 1)]
+            at_or_before = (probe[:, 0] < high) | ((probe[:, 0] == high) & (probe[:, 1] <= low))
+            left = np.where(active & at_or_before, middle + 1, left)
+            right = np.where(active & ~at_or_before, middle, right)
+        position = left - 1
+        found = position >= 0
+        position = np.where(found, position, 0)
+        end = ends[position]
+        found &= (high < end[:, 0]) | ((high == end[:, 0]) & (low <= end[:, 1]))
+        result[found] = locations[position[found]]
+        return result
+
+    def lookup_many(self, ips):
+        """Location index per address (-1 when no range matches)"""
+        ips = list(ips)
+        result = np.full(len(ips), -1, dtype=np.int64)
+
+        v4_index, v4_packed, v6_index, v6_keys = [], [], [], []
+        for i, ip in enumerate(ips):
+            if isinstance(ip, str):
+                try:
+                    v4_packed.append(socket.inet_pton(socket.AF_INET, ip))
+                    v4_index.append(i)
+                    continue
+                except OSError:
+                    pass
+            parsed = ip_to_int(ip)
+            if parsed is None:
+                continue
+            version, value = parsed
+            if version == 4:
+                v4_packed.append(value.to_bytes(4, 'big'))
+                v4_index.append(i)
+            else:
+                v6_index.append(i)
+                v6_keys.append(value)
+
+        if v4_index:
+            keys = np.frombuffer(b''.join(v4_packed), dtype='>u4').astype(self._v4[0].dtype)
+            result[v4_index] = self._search_v4(keys)
+        if v6_index:
+            high = np.array([key >> 64 for key in v6_keys], dtype=self._v6[0].dtype)
+            low = np.array([key & 0xFFFFFFFFFFFFFFFF for key in v6_keys], dtype=self._v6[0].dtype)
+            result[v6_index] = self._search_v6(high, low)
+        return result
+
+    def locate_many(self, ips):
+        """(country_code, region, city) or None per address; hot addresses come from the LRU"""
+        ips = list(ips)
+        results = [None] * len(ips)
+        pending = {}
+        with self._lock:
+            for i, ip in enumerate(ips):
+                if type(ip) is not str:
+                    continue
+                location = self._cache.get(ip, _MISSING)
+                if location is _MISSING:
+                    pending.setdefault(ip, []).append(i)
+                else:
+                    self._cache.move_to_end(ip)
+                    results[i] = location
+                    self.hits += 1
+            self.misses += len(pending)
+        if not pending:
+            return results
+
+        found = self.lookup_many(pending)
+        located = {}
+        for (ip, index), location_index in zip(pending.items(), found.tolist()):
+            location = self.location(location_index) if location_index >= 0 else None
+            located[ip] = location
+            for i in index:
+                results[i] = location
+        with self._lock:
+            for ip, location in located.items():
+                self._cache[ip] = location
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return results
+
+    def lookup(self, ip):
+        """(country_code, region, city) of one address, or None"""
+        return self.locate_many([ip])[0]
+
+    def enrich(self, logs):
+        """``logs`` with country_code, region and city filled in from source_ip.
+
+        Only fields a log lacks are filled, unless ``override`` is set, in
+        which case a resolved location replaces the caller's. Logs that gain
+        fields are copied; returns ``logs`` itself when none do.
+        """
+        wanted = []
+        for i, log in enumerate(logs):
+            if type(log) is dict and (self.override or not log.get('city') or not log.get('country_code')):
+                ip = log.get('source_ip')
+                if type(ip) is str and ip:
+                    wanted.append(i)
+        if not wanted:
+            return logs
+
+        out = None
+        enriched = 0
+        for i, location in zip(wanted, self.locate_many([logs[i]['source_ip'] for i in wanted])):
+            if location is None:
+                continue
+            log = logs[i]
+            fields = {name: value for name, value in zip(LOCATION_FIELDS, location)
+                      if value and (self.override or not log.get(name))}
+            if fields:
+                if out is None:
+                    out = list(logs)
+                out[i] = {**log, **fields}
+                enriched += 1
+        if out is None:
+            return logs
+        with self._lock:
+            self.enriched += enriched
+        return out
+
+    def stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'fingerprint': self._fingerprint,
+                'ipv4_ranges': len(self._v4[0]),
+                'ipv6_ranges': len(self._v6[0]),
+                'locations': len(self._offsets) - 1,
+                'override': self.override,
+                'cache_size': self.cache_size,
+                'cached': len(self._cache),
+                'hits': self.hits,
+                'misses': self.misses,
+                'enriched': self.enriched,
+            }
+
+
+_resolver = _MISSING
+
+
+def geoip_resolver():
+    """Process-wide resolver over ML_GEOIP_DB, or None when GeoIP is off"""
+    global _resolver
+    if _resolver is _MISSING:
+        _resolver = GeoIPResolver.from_env()
+    return _resolver
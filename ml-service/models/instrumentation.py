@@ -0,0 +1,268 @@
+"""
+BunaSIEM Instrumentation
+Per-stage latency histograms, Prometheus exposition and a slow-request sampling profiler
+"""
+
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from time import perf_counter
+
+from models.metrics import Histogram
+
+# Hot-path stages, in the order a request goes through them
+STAGES = ('parse', 'normalize', 'features', 'inference', 'rules', 'patterns', 'correlation', 'threat_intel', 'serialize')
+
+# Seconds; stages run from a few microseconds (one log) to seconds (large batches)
+LATENCY_BUCKETS = [0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_NULL = nullcontext()
+
+
+class _Stage:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(perf_counter() - self.start)
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of threads serving requests; requests slower than
+    ``threshold`` are written out as folded stacks (one ``frame;frame;... count``
+    line per stack), the input of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, output_dir, threshold, interval=0.005, sample_rate=1.0, max_files=100):
+        self.output_dir = output_dir
+        self.threshold = threshold
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.samples = 0
+        self.written = 0
+        self.skipped = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    @classmethod
+    def from_env(cls):
+        """Profiler for requests slower than ML_PROFILE_SLOW_MS, or None when that is unset"""
+        threshold_ms = float(os.getenv('ML_PROFILE_SLOW_MS', 0))
+        if threshold_ms <= 0:
+            return None
+        return cls(os.getenv('ML_PROFILE_DIR', '/tmp/bunasiem-profiles'), threshold_ms / 1000.0,
+                   interval=float(os.getenv('ML_PROFILE_INTERVAL_MS', 5)) / 1000.0,
+                   sample_rate=float(os.getenv('ML_PROFILE_SAMPLE_RATE', 1.0)),
+                   max_files=int(os.getenv('ML_PROFILE_MAX_FILES', 100)))
+
+    def start(self):
+        """Begin sampling the calling thread; returns a token for finish(), or None if not sampled"""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        self._ensure_running()
+        ident = threading.get_ident()
+        stacks = Counter()
+        with self._lock:
+            self._active[ident] = stacks
+        return ident, stacks
+
+    def finish(self, token, name, elapsed):
+        ident, stacks = token
+        with self._lock:
+            if self._active.get(ident) is stacks:
+                del self._active[ident]
+        if elapsed < self.threshold or not stacks:
+            return None
+        if self.written >= self.max_files:
+            self.skipped += 1
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        label = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') or 'request'
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{label}-{elapsed * 1000:.0f}ms.folded")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.written += 1
+        return path
+
+    def _ensure_running(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._active = {}
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        stacks[_fold(frame)] += 1
+                        self.samples += 1
+
+    def stats(self):
+        return {
+            'threshold_ms': self.threshold * 1000,
+            'samples': self.samples,
+            'profiles_written': self.written,
+            'profiles_skipped': self.skipped,
+            'output_dir': self.output_dir,
+        }
+
+
+_frame_labels = {}
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        label = _frame_labels.get(code)
+        if label is None:
+            label = _frame_labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        names.append(label)
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Instrumentation:
+    """Stage and request latency histograms for one process.
+
+    Stages are timed with ``stage(name)`` blocks or the ``timed`` decorator;
+    with metrics switched off both cost nothing.
+    """
+
+    def __init__(self, enabled=True, profiler=None, stages=STAGES, buckets=LATENCY_BUCKETS):
+        self.enabled = enabled
+        self.profiler = profiler
+        self.buckets = buckets
+        self.stages = {name: Histogram(buckets) for name in stages}
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Histograms unless ML_METRICS=0, plus the slow-request profiler if ML_PROFILE_SLOW_MS is set"""
+        enabled = os.getenv('ML_METRICS', '1').lower() not in ('0', 'false', 'no')
+        return cls(enabled=enabled, profiler=SlowRequestProfiler.from_env())
+
+    def stage(self, name):
+        return _Stage(self.stages[name]) if self.enabled else _NULL
+
+    def start_request(self, profile=True):
+        token = self.profiler.start() if profile and self.profiler is not None else None
+        return perf_counter(), token
+
+    def finish_request(self, timing, endpoint):
+        start, token = timing
+        elapsed = perf_counter() - start
+        if self.enabled:
+            self._request_histogram(endpoint).observe(elapsed)
+        if token is not None:
+            self.profiler.finish(token, endpoint, elapsed)
+        return elapsed
+
+    def _request_histogram(self, endpoint):
+        histogram = self.requests.get(endpoint)
+        if histogram is None:
+            with self._lock:
+                histogram = self.requests.setdefault(endpoint, Histogram(self.buckets))
+        return histogram
+
+    def drain(self):
+        """Stage observations since the last drain, for merge() in another process"""
+        return {name: histogram.drain() for name, histogram in self.stages.items() if histogram.count}
+
+    def merge(self, drained):
+        for name, state in drained.items():
+            self.stages[name].add(*state)
+
+    def render(self, histograms=()):
+        """Prometheus text format of the stage and request histograms.
+
+        ``histograms`` adds (metric name, help, Histogram) families.
+        """
+        lines = []
+        _family(lines, 'bunasiem_stage_seconds', 'Time spent in each hot-path stage', 'histogram',
+                [({'stage': name}, histogram) for name, histogram in self.stages.items()])
+        _family(lines, 'bunasiem_request_seconds', 'Request latency per endpoint', 'histogram',
+                [({'endpoint': name}, histogram) for name, histogram in sorted(self.requests.items())])
+        for name, help_text, histogram in histograms:
+            _family(lines, name, help_text, 'histogram', [({}, histogram)])
+        if self.profiler is not None:
+            stats = self.profiler.stats()
+            _family(lines, 'bunasiem_profiler_samples_total', 'Stack samples taken of in-flight requests',
+                    'counter', [({}, stats['samples'])])
+            _family(lines, 'bunasiem_profiles_written_total', 'Folded-stack profiles written for slow requests',
+                    'counter', [({}, stats['profiles_written'])])
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, extra=None):
+    items = list(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+
+def _family(lines, name, help_text, kind, series):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in series:
+        if kind != 'histogram':
+            lines.append(f"{name}{_labels(labels)} {value}")
+            continue
+        snapshot = value.snapshot()
+        for bound, count in snapshot['buckets'].items():
+            lines.append(f"{name}_bucket{_labels(labels, ('le', bound))} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {snapshot['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+
+
+# Process-wide instance shared by the service, the models and the async server
+INSTRUMENTATION = Instrumentation.from_env()
+
+
+def timed(stage):
+    """Decorator recording each call's duration under ``stage``; returns the function untouched when metrics are off"""
+    def decorate(fn):
+        if not INSTRUMENTATION.enabled:
+            return fn
+        histogram = INSTRUMENTATION.stages[stage]
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+        return wrapper
+    return decorate
@@ -0,0 +1,211 @@
+"""
+BunaSIEM IP Range Index
+Compiled CIDR matching for Ethiopian address allocations
+"""
+
+import hashlib
+import ipaddress
+import os
+import socket
+
+import numpy as np
+
+# Default Ethiopian allocations; ETHIOPIAN_IP_RANGES_FILE can add more
+ETHIOPIAN_IP_RANGES = [
+    ('196.188.0.0/16', 'ethio_telecom'),  # Ethiopian Telecom
+    ('197.156.0.0/16', 'ethio_telecom'),  # Ethiopian Telecom
+    ('10.0.0.0/8', 'private'),            # Private networks in Ethiopia
+]
+
+TELECOM_LABEL = 'ethio_telecom'
+
+
+def ip_to_int(ip):
+    """(version, integer) for an address string, or None if it is not an IP.
+
+    IPv4-mapped IPv6 addresses (::ffff:a.b.c.d) are treated as IPv4.
+    """
+    if not isinstance(ip, str):
+        return None
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip), 'big')
+    except OSError:
+        pass
+    try:
+        address = ipaddress.IPv6Address(ip)
+    except ValueError:
+        return None
+    if address.ipv4_mapped is not None:
+        return 4, int(address.ipv4_mapped)
+    return 6, int(address)
+
+
+class IPRangeIndex:
+    """Sorted, non-overlapping interval arrays built from CIDR blocks.
+
+    CIDR blocks are either nested or disjoint, so they flatten into disjoint
+    segments labelled with their most specific block. A lookup is a single
+    binary search. IPv4 keys are int64 arrays. IPv6 keys are object arrays of
+    Python ints, because numpy has no 128-bit integer type.
+    """
+
+    def __init__(self, ranges=()):
+        self.labels = []
+        networks = {4: [], 6: []}
+        for entry in ranges:
+            cidr, label = entry if isinstance(entry, (tuple, list)) else (entry, None)
+            network = ipaddress.ip_network(cidr, strict=False)
+            if label not in self.labels:
+                self.labels.append(label)
+            networks[network.version].append((
+                int(network.network_address), int(network.broadcast_address),
+                network.prefixlen, self.labels.index(label)
+            ))
+        self._v4 = self._compile(networks[4], np.int64)
+        self._v6 = self._compile(networks[6], object)
+        self.size = len(networks[4]) + len(networks[6])
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """Digest of the segments and labels; equal indexes agree across processes"""
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(repr(self.labels).encode(), digest_size=8)
+            for table in (self._v4, self._v6):
+                for array in table:
+                    digest.update(repr(array.tolist()).encode())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    @classmethod
+    def from_file(cls, path, default_label=None, base=()):
+        """Load one CIDR per line, optionally followed by a label (comma or whitespace separated)"""
+        ranges = list(base)
+        with open(path) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                parts = line.replace(',', ' ').split()
+                ranges.append((parts[0], parts[1] if len(parts) > 1 else default_label))
+        return cls(ranges)
+
+    @staticmethod
+    def _compile(networks, dtype):
+        # Sort outer blocks before the blocks they contain, then sweep with a
+        # stack of enclosing blocks to emit disjoint segments
+        networks.sort(key=lambda n: (n[0], n[2]))
+        segments = []
+        stack = []
+        cursor = None
+
+        def close_until(position):
+            nonlocal cursor
+            while stack and stack[-1][1] < position:
+                start, end, _, label = stack.pop()
+                if cursor <= end:
+                    segments.append((cursor, end, label))
+                cursor = end + 1
+
+        for network in networks:
+            start = network[0]
+            close_until(start)
+            if stack and cursor < start:
+                segments.append((cursor, start - 1, stack[-1][3]))
+            stack.append(network)
+            cursor = start
+        close_until(float('inf'))
+
+        starts = np.array([s[0] for s in segments], dtype=dtype)
+        ends = np.array([s[1] for s in segments], dtype=dtype)
+        labels = np.array([s[2] for s in segments], dtype=np.int64)
+        return starts, ends, labels
+
+    def _search(self, keys, table):
+        starts, ends, labels = table
+        result = np.full(len(keys), -1, dtype=np.int64)
+        if not len(starts) or not len(keys):
+            return result
+        position = np.searchsorted(starts, keys, side='right') - 1
+        found = position >= 0
+        position = np.where(found, position, 0)
+        found &= keys <= ends[position]
+        result[found] = labels[position[found]]
+        return result
+
+    def lookup_many(self, ips):
+        """Label index per address (-1 when no range matches)"""
+        ips = list(ips)
+        result = np.full(len(ips), -1, dtype=np.int64)
+
+        v4_index, v4_packed, v6_index, v6_keys = [], [], [], []
+        for i, ip in enumerate(ips):
+            if isinstance(ip, str):
+                try:
+                    v4_packed.append(socket.inet_pton(socket.AF_INET, ip))
+                    v4_index.append(i)
+                    continue
+                except OSError:
+                    pass
+            parsed = ip_to_int(ip)
+            if parsed is None:
+                continue
+            version, value = parsed
+            if version == 4:
+                v4_packed.append(value.to_bytes(4, 'big'))
+                v4_index.append(i)
+            else:
+                v6_index.append(i)
+                v6_keys.append(value)
+
+        if v4_index:
+            keys = np.frombuffer(b''.join(v4_packed), dtype='>u4').astype(np.int64)
+            result[v4_index] = self._search(keys, self._v4)
+        if v6_index:
+            keys = np.empty(len(v6_keys), dtype=object)
+            keys[:] = v6_keys
+            result[v6_index] = self._search(keys, self._v6)
+        return result
+
+    def contains_many(self, ips):
+        """Boolean mask of addresses that fall in any range"""
+        return self.lookup_many(ips) >= 0
+
+    def lookup(self, ip):
+        """Label of the most specific range containing ip, or None"""
+        parsed = ip_to_int(ip)
+        if parsed is None:
+            return None
+        version, value = parsed
+        table = self._v4 if version == 4 else self._v6
+        keys = np.array([value], dtype=table[0].dtype)
+        index = self._search(keys, table)[0]
+        return self.labels[index] if index >= 0 else None
+
+    def contains(self, ip):
+        """True if ip falls in any range"""
+        parsed = ip_to_int(ip)
+        if parsed is None:
+            return False
+        version, value = parsed
+        table = self._v4 if version == 4 else self._v6
+        keys = np.array([value], dtype=table[0].dtype)
+        return bool(self._search(keys, table)[0] >= 0)
+
+    def label_index(self, label):
+        """Index that lookup_many uses for label, or -1 if it is unknown"""
+        return self.labels.index(label) if label in self.labels else -1
+
+
+_ethiopian_index = None
+
+
+def ethiopian_ip_index():
+    """Process-wide index of Ethiopian ranges, extended by ETHIOPIAN_IP_RANGES_FILE"""
+    global _ethiopian_index
+    if _ethiopian_index is None:
+        path = os.getenv('ETHIOPIAN_IP_RANGES_FILE')
+        if path:
+            _ethiopian_index = IPRangeIndex.from_file(path, default_label=TELECOM_LABEL, base=ETHIOPIAN_IP_RANGES)
+        else:
+            _ethiopian_index = IPRangeIndex(ETHIOPIAN_IP_RANGES)
+    return _ethiopian_index
@@ -0,0 +1,189 @@
+"""
+BunaSIEM Log Normalizer
+Maps native CloudTrail, Azure Monitor and Ethio Telecom records onto the flat detector fields
+"""
+
+import os
+import threading
+
+from models.geoip import geoip_resolver
+from models.instrumentation import timed
+
+# Keys whose presence identifies a record's source; any one key set is enough.
+# Records that already carry event_time are flat and pass through untouched.
+SOURCE_SIGNATURES = [
+    ('flat', [('event_time',)]),
+    ('aws_cloudtrail', [('eventTime', 'eventSource'), ('eventTime', 'eventName')]),
+    ('azure_monitor', [('callerIpAddress',), ('time', 'operationName')]),
+    ('ethio_telecom', [('timestamp', 'bytes_sent'), ('timestamp', 'office'), ('timestamp', 'location')]),
+]
+
+# Flat field -> candidate paths into the native record, the first non-null value wins
+FIELD_PLANS = {
+    'aws_cloudtrail': {
+        'event_time': [('eventTime',)],
+        'source_ip': [('sourceIPAddress',)],
+        'event_type': [('eventName',)],
+        'username': [('userIdentity', 'userName'), ('userIdentity', 'principalId')],
+        'bytes_transferred': [('additionalEventData', 'bytesTransferredOut')],
+    },
+    'azure_monitor': {
+        'event_time': [('time',)],
+        'source_ip': [('callerIpAddress',), ('identity', 'claims', 'ipaddr')],
+        'event_type': [('operationName',)],
+        'username': [('identity', 'claims', 'http://schemas.xmlsoap.org/ws/2005/05/identity/claims/upn'),
+                     ('identity', 'claims', 'name'), ('caller',)],
+    },
+    'ethio_telecom': {
+        'event_time': [('timestamp',)],
+        'city': [('location', 'city')],
+        'country_code': [('location', 'country')],
+        'bytes_transferred': [('bytes_sent',)],
+    },
+}
+
+# (path, values) that mark a failed attempt; values None means "present at all".
+# Only applies when the record has no failed_attempts of its own.
+FAILURE_MARKERS = {
+    'aws_cloudtrail': [(('responseElements', 'ConsoleLogin'), ('Failure',)), (('errorCode',), None)],
+    'azure_monitor': [(('resultType',), ('Failure', 'Failed')), (('resultSignature',), ('Failed',))],
+    'ethio_telecom': [(('status',), ('failed',))],
+}
+
+# event_type values that mark a failed attempt by themselves, for records with no failed_attempts
+FAILURE_EVENT_TYPES = frozenset({'FailedLogin'} | {
+    value for markers in FAILURE_MARKERS.values() for _, values in markers if values for value in values})
+
+_EMPTY = {}
+
+
+def _sub(value):
+    return value if type(value) is dict else _EMPTY
+
+
+def _path_expr(path):
+    expr = 'r'
+    for key in path[:-1]:
+        expr = f"_sub({expr}.get({key!r}))"
+    return f"{expr}.get({path[-1]!r})"
+
+
+def compile_plan(source, fields, failure_markers=()):
+    """Straight-line function mapping a list of native records of one source to flat dicts.
+
+    The plan is turned into Python source once, so a record costs one dict
+    copy and a fixed sequence of lookups rather than a walk over the mapping.
+    """
+    lines = [
+        'def normalize(records):',
+        '    out = []',
+        '    append = out.append',
+        '    for r in records:',
+        '        n = dict(r)',
+    ]
+    for target, paths in fields.items():
+        lines.append(f"        v = {_path_expr(paths[0])}")
+        for path in paths[1:]:
+            lines.append('        if v is None:')
+            lines.append(f"            v = {_path_expr(path)}")
+        lines.append('        if v is not None:')
+        lines.append(f"            n[{target!r}] = v")
+    if failure_markers:
+        conditions = []
+        for path, values in failure_markers:
+            if values is None:
+                conditions.append(f"{_path_expr(path)} is not None")
+            else:
+                conditions.append(f"{_path_expr(path)} in {tuple(values)!r}")
+        lines.append(f"        if r.get('failed_attempts') is None and ({' or '.join(conditions)}):")
+        lines.append("            n['failed_attempts'] = 1")
+    lines.append(f"        n.setdefault('source', {source!r})")
+    lines.append('        append(n)')
+    lines.append('    return out')
+
+    namespace = {'_sub': _sub}
+    exec(compile('\n'.join(lines), f"<normalize {source}>", 'exec'), namespace)
+    return namespace['normalize']
+
+
+class LogNormalizer:
+    """Detects each record's source and applies that source's compiled plan.
+
+    Flat records, records of unknown shape and non-dict values are returned
+    as they are (the same objects), so normalizing twice changes nothing.
+    With a GeoIP resolver, records without a city or country_code get them
+    (and region) from source_ip, as copies.
+    """
+
+    def __init__(self, signatures=SOURCE_SIGNATURES, plans=FIELD_PLANS, failure_markers=FAILURE_MARKERS,
+                 geoip=None):
+        self.signatures = signatures
+        self.geoip = geoip
+        self.plans = {
+            source: compile_plan(source, fields, failure_markers.get(source, ()))
+            for source, fields in plans.items()
+        }
+        self.counts = {source: 0 for source, _ in signatures}
+        self.counts['unknown'] = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Normalizer unless ML_NORMALIZE_LOGS=0, resolving locations when ML_GEOIP_DB is set"""
+        if os.getenv('ML_NORMALIZE_LOGS', '1').lower() in ('0', 'false', 'no'):
+            return None
+        return cls(geoip=geoip_resolver())
+
+    def detect(self, record, hint=None):
+        """Source name of one record, or None; ``hint`` is tried first"""
+        if type(record) is not dict:
+            return None
+        if hint is not None:
+            for keys in self._keys(hint):
+                if all(key in record for key in keys):
+                    return hint
+        for source, alternatives in self.signatures:
+            for keys in alternatives:
+                if all(key in record for key in keys):
+                    return source
+        return None
+
+    def _keys(self, source):
+        for name, alternatives in self.signatures:
+            if name == source:
+                return alternatives
+        return ()
+
+    @timed('normalize')
+    def normalize(self, logs):
+        """Flat versions of ``logs``, in order; returns ``logs`` itself when nothing needs mapping or locating"""
+        groups = {}
+        source = None
+        for i, log in enumerate(logs):
+            # Exports are usually all one source, so the last match is tried first
+            source = self.detect(log, source)
+            groups.setdefault(source or 'unknown', []).append(i)
+
+        with self._lock:
+            for name, index in groups.items():
+                self.counts[name] += len(index)
+
+        mapped = [name for name in groups if name in self.plans]
+        out = logs
+        if mapped:
+            out = list(logs)
+            for name in mapped:
+                index = groups[name]
+                for i, record in zip(index, self.plans[name]([logs[i] for i in index])):
+                    out[i] = record
+        if self.geoip is not None:
+            out = self.geoip.enrich(out)
+        return out
+
+    def normalize_one(self, log):
+        return self.normalize([log])[0]
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+        return {'sources': counts, 'geoip': self.geoip.stats() if self.geoip is not None else None}
@@ -0,0 +1,84 @@
+"""
+BunaSIEM Log Sources
+Reads log archives (JSON arrays, NDJSON, optionally gzip) one record at a time
+"""
+
+import gzip
+import json
+import os
+
+LOG_SUFFIXES = ('.json', '.ndjson', '.jsonl')
+
+# Top-level keys that wrap a list of records in exported JSON documents
+WRAPPER_KEYS = ('logs', 'Records', 'records', 'value')
+
+
+def is_log_file(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return name.endswith(LOG_SUFFIXES)
+
+
+def find_log_files(paths):
+    """Log files under the given files and directories, in sorted order"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(os.path.join(root, name) for name in sorted(files) if is_log_file(name))
+        else:
+            found.append(path)
+    return found
+
+
+def open_log_file(path):
+    return gzip.open(path, 'rt', encoding='utf-8') if path.endswith('.gz') else open(path, encoding='utf-8')
+
+
+def iter_file_records(path):
+    """Records of one file.
+
+    NDJSON is streamed line by line. A JSON document (an array, or an object
+    wrapping one under a key in WRAPPER_KEYS) has to be parsed whole, so its
+    memory use is that of the largest single file.
+    """
+    with open_log_file(path) as f:
+        first_line = f.readline()
+        while first_line and not first_line.strip():
+            first_line = f.readline()
+        if not first_line:
+            return
+
+        stripped = first_line.strip()
+        if not stripped.startswith('['):
+            try:
+                record = json.loads(stripped)
+            except ValueError:
+                record = None
+            if isinstance(record, dict):
+                # NDJSON: one object per line
+                yield from _unwrap(record)
+                for line in f:
+                    if line.strip():
+                        yield from _unwrap(json.loads(line))
+                return
+
+        document = json.loads(first_line + f.read())
+    yield from _unwrap(document)
+
+
+def _unwrap(document):
+    if isinstance(document, list):
+        return document
+    if isinstance(document, dict):
+        for key in WRAPPER_KEYS:
+            if isinstance(document.get(key), list):
+                return document[key]
+    return [document]
+
+
+def iter_records(paths):
+    """(path, record) for every record in every log file under ``paths``"""
+    for path in find_log_files(paths):
+        for record in iter_file_records(path):
+            yield path, record
@@ -0,0 +1,53 @@
+"""
+BunaSIEM Service Metrics
+Small thread-safe histograms for hot-path statistics
+"""
+
+import bisect
+import threading
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative counts per upper bound, Prometheus style)"""
+
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        buckets = {}
+        running = 0
+        for bound, bucket_count in zip(self.bounds + [float('inf')], counts):
+            running += bucket_count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = running
+        return {'buckets': buckets, 'sum': total, 'count': count}
+
+    def drain(self):
+        """(counts, sum, count) observed since the last drain; resets them"""
+        with self._lock:
+            state = (self.counts, self.sum, self.count)
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.sum = 0.0
+            self.count = 0
+        return state
+
+    def add(self, counts, total, count):
+        """Fold in drain() output from another histogram with the same bounds"""
+        with self._lock:
+            for i, bucket_count in enumerate(counts):
+                self.counts[i] += bucket_count
+            self.sum += total
+            self.count += count
@@ -0,0 +1,145 @@
+"""
+BunaSIEM Model Registry
+Versioned model artifacts with metadata, loaded memory-mapped
+"""
+
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from models.compiled_forest import CompiledForest, FOREST_FILE
+from models.feature_schema import DETECTOR_FEATURES
+
+DEFAULT_REGISTRY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'registry')
+
+ARTIFACT_FILE = 'model.joblib'
+METADATA_FILE = 'metadata.json'
+CURRENT_FILE = 'CURRENT'
+
+
+class ModelRegistryError(RuntimeError):
+    """Raised when no usable artifact can be loaded"""
+
+
+def training_hash(X_train):
+    """Stable fingerprint of the training matrix"""
+    digest = hashlib.sha256()
+    digest.update(str(X_train.shape).encode())
+    digest.update(str(X_train.dtype).encode())
+    digest.update(X_train.tobytes())
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    """Directory of versioned artifacts: ``<root>/<version>/{model.joblib,forest.npz,metadata.json}``.
+
+    ``<root>/CURRENT`` names the version to serve. Artifacts are written
+    uncompressed so joblib can memory-map their arrays on load.
+    """
+
+    def __init__(self, root=None):
+        self.root = root or os.getenv('MODEL_REGISTRY_DIR', DEFAULT_REGISTRY_DIR)
+
+    def versions(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if os.path.isfile(os.path.join(self.root, name, METADATA_FILE))
+        )
+
+    def current_version(self):
+        path = os.path.join(self.root, CURRENT_FILE)
+        if os.path.exists(path):
+            with open(path) as f:
+                version = f.read().strip()
+            if version:
+                return version
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def save(self, model, X_train=None, feature_schema=DETECTOR_FEATURES, extra=None, make_current=True):
+        """Write a new artifact version and return its metadata"""
+        import joblib
+        import sklearn
+
+        created_at = datetime.now(timezone.utc)
+        data_hash = training_hash(X_train) if X_train is not None else None
+        version = created_at.strftime('%Y%m%dT%H%M%S%f') + (f"-{data_hash[:8]}" if data_hash else '')
+
+        metadata = {
+            'version': version,
+            'created_at': created_at.isoformat(),
+            'model_class': type(model).__name__,
+            'feature_schema': list(feature_schema),
+            'sklearn_version': sklearn.__version__,
+            'training_hash': data_hash,
+            'training_samples': int(X_train.shape[0]) if X_train is not None else None,
+            'params': {k: v for k, v in model.get_params().items() if isinstance(v, (int, float, str, bool, type(None)))},
+        }
+        metadata.update(extra or {})
+
+        directory = os.path.join(self.root, version)
+        os.makedirs(directory, exist_ok=True)
+        joblib.dump(model, os.path.join(directory, ARTIFACT_FILE), compress=0)
+        self.export_forest(model, directory)
+        with open(os.path.join(directory, METADATA_FILE), 'w') as f:
+            json.dump(metadata, f, indent=2)
+
+        if make_current:
+            self.set_current(version)
+        return metadata
+
+    def export_forest(self, model, directory):
+        """Write the packed-array form of an isolation forest next to its artifact"""
+        if hasattr(model, 'estimators_features_'):
+            CompiledForest.from_model(model).save(os.path.join(directory, FOREST_FILE))
+
+    def load_forest(self, version):
+        """Exported CompiledForest for a version, or None if it has none"""
+        path = os.path.join(self.root, version, FOREST_FILE)
+        return CompiledForest.load(path) if os.path.exists(path) else None
+
+    def set_current(self, version):
+        # Write then rename so readers never see a half-written pointer
+        tmp_path = os.path.join(self.root, CURRENT_FILE + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+        os.replace(tmp_path, os.path.join(self.root, CURRENT_FILE))
+
+    def metadata(self, version):
+        with open(os.path.join(self.root, version, METADATA_FILE)) as f:
+            return json.load(f)
+
+    def resolve(self, version=None, feature_schema=DETECTOR_FEATURES):
+        """Metadata of a version, defaulting to CURRENT, checked against the feature schema without loading the model"""
+        version = version or self.current_version()
+        if version is None:
+            raise ModelRegistryError(f"No model versions in {self.root}")
+
+        metadata = self.metadata(version)
+        if metadata.get('feature_schema') != list(feature_schema):
+            raise ModelRegistryError(
+                f"Model {version} was trained on {metadata.get('feature_schema')}, "
+                f"service expects {list(feature_schema)}"
+            )
+        return metadata
+
+    def load(self, version=None, mmap=True, feature_schema=DETECTOR_FEATURES):
+        """Load (model, metadata) for a version, defaulting to CURRENT"""
+        # Unpickling the model imports scikit-learn anyway; nothing else here needs it
+        import joblib
+        import sklearn
+
+        metadata = self.resolve(version, feature_schema)
+        version = metadata['version']
+        if metadata.get('sklearn_version') != sklearn.__version__:
+            print(f"Model {version} was built with scikit-learn {metadata.get('sklearn_version')}, "
+                  f"running {sklearn.__version__}")
+
+        start = time.perf_counter()
+        model = joblib.load(os.path.join(self.root, version, ARTIFACT_FILE), mmap_mode='r' if mmap else None)
+        metadata = dict(metadata, load_seconds=time.perf_counter() - start)
+        return model, metadata
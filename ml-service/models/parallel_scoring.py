@@ -0,0 +1,115 @@
+"""
+BunaSIEM Parallel Scoring
+Process pool that splits large scoring batches across cores
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from models.model_registry import ModelRegistry
+
+# Set in each pool process by _init_worker
+_worker_model = None
+
+
+def n_jobs_from_env(default=1):
+    """Thread count for tree fitting (ML_N_JOBS; -1 means every core)"""
+    return int(os.getenv('ML_N_JOBS', default))
+
+
+def spawn_pool(workers, initializer, initargs=()):
+    """Process pool whose workers start fresh instead of forking the caller's threads"""
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=initializer,
+        initargs=initargs,
+    )
+
+
+def _init_worker(registry_root, version):
+    global _worker_model
+    # Memory-mapped: every worker reads the same page-cache copy of the tree arrays
+    _worker_model, _ = ModelRegistry(registry_root).load(version, mmap=True)
+
+
+def _score_chunk(X):
+    return _worker_model.decision_function(X)
+
+
+class ParallelScorer:
+    """Scores row chunks of large batches in a pool of worker processes.
+
+    Workers load the registry version memory-mapped instead of receiving a
+    pickled copy of the model. Processes are spawned (not forked, so server
+    threads are never copied) on the first large batch. A pool belongs to the
+    process that started it: a pre-fork worker that inherited one (without its
+    manager thread) starts its own. A row's score does not depend on which
+    chunk it lands in, so results equal a single-process call.
+    """
+
+    def __init__(self, registry, version, workers, min_rows=50000):
+        self.registry = registry
+        self.version = version
+        self.workers = workers
+        self.min_rows = min_rows
+        self.batches = 0
+        self.rows = 0
+        self.executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, registry, version):
+        """Scorer configured by ML_SCORING_*, or None when it is switched off"""
+        workers = int(os.getenv('ML_SCORING_WORKERS', 0))
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        if workers <= 1:
+            return None
+        if not version or version == 'legacy':
+            print(" Parallel scoring needs a registry model version; scoring in-process")
+            return None
+        return cls(registry, version, workers, min_rows=int(os.getenv('ML_SCORING_MIN_ROWS', 50000)))
+
+    def accepts(self, n_rows, version):
+        return n_rows >= self.min_rows and version == self.version
+
+    def _pool(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self.executor = spawn_pool(self.workers, _init_worker, (self.registry.root, self.version))
+                    self._pid = os.getpid()
+        return self.executor
+
+    def decision_function(self, X):
+        """decision_function of the registry model, one chunk per worker"""
+        chunks = np.array_split(np.asarray(X), self.workers)
+        scores = np.concatenate(list(self._pool().map(_score_chunk, chunks)))
+        self.batches += 1
+        self.rows += len(scores)
+        return scores
+
+    def warm_up(self, X):
+        """Spawn the workers and load their models now rather than on the first large batch"""
+        chunks = [np.asarray(X)] * self.workers
+        list(self._pool().map(_score_chunk, chunks))
+
+    def close(self):
+        # An inherited pool's processes and manager thread belong to the parent
+        if self.executor is not None and self._pid == os.getpid():
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'min_rows': self.min_rows,
+            'model_version': self.version,
+            'batches': self.batches,
+            'rows': self.rows,
+        }
@@ -1,49 +1,108 @@
-import re
-from datetime import datetime, time
+import hashlib
+from datetime import datetime
+import numpy as np
 import pandas as pd
+from models.feature_extractor import parse_event_times
+from models.ip_ranges import ethiopian_ip_index
+from models.ethiopian_calendar import ethiopian_calendar
+from models.detection_rules import RuleInputs, detection_rules
+from models.instrumentation import timed
 
 class PatternMatcher:
-    def __init__(self):
-        self.ethiopian_ip_ranges = [
-            '196.188.0.0/16',  # Ethiopian Telecom
-            '197.156.0.0/16',  # Ethiopian Telecom
-            '10.0.0.0/8',      # Private networks in Ethiopia
-        ]
-        self.ethiopian_business_hours = {
-            'start': time(8, 30),  # 8:30 AM
-            'end': time(17, 30)    # 5:30 PM
-        }
-        self.common_ethiopian_cities = [
-            'Addis Ababa', 'Dire Dawa', 'Adama', 'Hawassa', 
-            'Mekele', 'Bahir Dar', 'Gondar', 'Jimma'
-        ]
+    # Fields the default rules read and the value each takes when a log lacks it;
+    # other fields a rule reads default to None
+    RULE_FIELDS = {
+        'event_time': None,
+        'city': '',
+        'country_code': '',
+        'event_type': '',
+        'source_ip': '',
+        'failed_attempts': 0,
+        'bytes_transferred': 0,
+    }
+    
+    def __init__(self, rules=None):
+        # Pattern rules come from the detection rule files (DETECTION_RULES_PATH)
+        self.rules = rules if rules is not None else detection_rules()
+        self.ethiopian_ip_index = ethiopian_ip_index()
+        # Holidays, weekends and business hours (8:30 AM - 5:30 PM) in East Africa Time
+        self.calendar = ethiopian_calendar()
+        start, end = self.calendar.business_hours
+        self.ethiopian_business_hours = {'start': start, 'end': end}
+        # Neither table changes after startup, so they are hashed once rather than per cache lookup
+        self._table_fingerprints = (self.calendar.fingerprint(), self.ethiopian_ip_index.fingerprint())
+        # (rule snapshot fingerprint, rule_version) of the last snapshot seen
+        self._rule_version = None
         
     def detect_ethiopian_patterns(self, logs):
         """Detect Ethiopian-specific security patterns"""
-        suspicious_activities = []
+        return self.summarize_rule_flags(self.rule_flags(logs))
+    
+    @timed('patterns')
+    def rule_flags(self, logs):
+        """Evaluate every pattern rule as a boolean column over a batch of logs.
+        
+        Accepts a list of log dicts, a DataFrame or an Arrow table and returns a
+        DataFrame with one row per log and one column per rule in rule_checks().
+        """
+        ruleset = self.rules.snapshot
+        frame, inputs = self.rule_inputs(logs, ruleset.log_fields['patterns'])
+        hits = ruleset.evaluate('patterns', inputs)
+        flags = pd.DataFrame({rule.name: mask for rule, mask in hits}, index=pd.RangeIndex(len(frame)))
+        # Keeps the summaries on the rule set these flags came from across a reload
+        flags.attrs['rule_checks'] = [(rule.name, rule.message, rule.weight) for rule, _ in hits]
+        return flags
+    
+    def rule_inputs(self, logs, fields=()):
+        """(rule frame, RuleInputs) for a batch, with the time and address fields the rules derive"""
+        frame = self._rule_frame(logs, fields)
+        parsed = {}
+        
+        def times(name, missing):
+            # EAT time features; ``missing`` where event_time is missing or unreadable
+            if not parsed:
+                event_time = frame['event_time']
+                has_time = event_time.astype(bool).to_numpy()
+                found = parse_event_times(event_time[has_time].tolist())
+                readable = np.zeros(len(frame), dtype=bool)
+                readable[has_time] = found['parsed']
+                parsed['readable'] = readable
+                parsed['found'] = found
+                parsed['index'] = np.flatnonzero(has_time)
+            column = np.full(len(frame), missing)
+            column[parsed['index']] = parsed['found'][name]
+            return np.where(parsed['readable'], column, missing)
+        
+        inputs = RuleInputs(len(frame), lambda name: frame[name].tolist(), {
+            # Seconds since EAT midnight
+            'time_of_day': lambda: times('time_us', np.nan) / 1e6,
+            'hour': lambda: times('hour', np.nan),
+            'business_hours': lambda: times('is_business_hours', False),
+            'weekend': lambda: times('is_weekend', False),
+            'holiday': lambda: times('is_holiday', False),
+            'ethiopian_ip': lambda: self.ethiopian_ip_index.contains_many(frame['source_ip']),
+        })
+        return frame, inputs
+    
+    def rule_checks(self, flags=None):
+        """(flag column, activity message, confidence weight) per pattern rule, in check order"""
+        if flags is not None and 'rule_checks' in flags.attrs:
+            return flags.attrs['rule_checks']
+        return [(rule.name, rule.message, rule.weight) for rule in self.rules.snapshot.rules['patterns']]
+    
+    @timed('patterns')
+    def summarize_rule_flags(self, flags):
+        """Aggregate per-log rule flags into the detect_ethiopian_patterns result"""
+        checks = self.rule_checks(flags)
+        hits = flags[[name for name, _, _ in checks]].to_numpy(dtype=bool)
+        rule_index = np.nonzero(hits.ravel())[0] % max(len(checks), 1)
+        
+        suspicious_activities = [checks[i][1] for i in rule_index]
         patterns_detected = []
-        confidence = 0.0
         
-        for log in logs:
-            # Check for Ethiopian business hours violations
-            if self.is_outside_business_hours(log):
-                suspicious_activities.append("Activity outside Ethiopian business hours")
-                confidence += 0.3
-            
-            # Check for unusual geographic patterns
-            if self.is_unusual_ethiopian_location(log):
-                suspicious_activities.append("Access from unusual Ethiopian location")
-                confidence += 0.4
-            
-            # Check for Ethiopian IP anomalies
-            if self.is_suspicious_ethiopian_ip(log):
-                suspicious_activities.append("Suspicious activity from Ethiopian IP range")
-                confidence += 0.5
-            
-            # Check for data exfiltration patterns
-            if self.is_data_exfiltration(log):
-                suspicious_activities.append("Possible data exfiltration pattern")
-                confidence += 0.6
+        # Accumulate in log order, as the per-log loop did, so float rounding matches
+        weights = np.array([weight for _, _, weight in checks])
+        confidence = float(np.cumsum(weights[rule_index])[-1]) if len(rule_index) else 0.0
         
         # Normalize confidence
         confidence = min(confidence, 1.0)
@@ -53,80 +112,69 @@ class PatternMatcher:
             'confidence': confidence,
             'suspicious_activities': suspicious_activities,
             'patterns_detected': list(set(patterns_detected)),
-            'total_logs_analyzed': len(logs)
+            'total_logs_analyzed': len(flags)
         }
-    
-    def is_outside_business_hours(self, log):
-        """Check if activity is outside Ethiopian business hours"""
-        event_time = log.get('event_time')
-        if not event_time:
-            return False
-        
-        try:
-            event_dt = pd.to_datetime(event_time)
-            event_time_only = event_dt.time()
-            
-            # Check if outside business hours (8:30 AM - 5:30 PM)
-            if event_time_only < self.ethiopian_business_hours['start'] or \
-               event_time_only > self.ethiopian_business_hours['end']:
-                return True
-        except:
-            pass
-        
-        return False
-    
-    def is_unusual_ethiopian_location(self, log):
-        """Check if location is unusual for Ethiopian context"""
-        city = log.get('city', '')
-        country = log.get('country_code', '')
-        
-        # If it's an Ethiopian IP but from unusual city
-        if country == 'ET' and city and city not in self.common_ethiopian_cities:
-            return True
-        
-        # If it's a login attempt from unusual location
-        if log.get('event_type') in ['Login', 'SignIn'] and city not in self.common_ethiopian_cities:
-            return True
-            
-        return False
-    
-    def is_suspicious_ethiopian_ip(self, log):
-        """Check for suspicious activities from Ethiopian IP ranges"""
-        source_ip = log.get('source_ip', '')
-        
-        # Check if IP is in Ethiopian ranges
-        is_ethiopian_ip = any(source_ip.startswith(prefix.split('.')[0] + '.' + prefix.split('.')[1]) 
-                            for prefix in ['196.188', '197.156'])
-        
-        if is_ethiopian_ip:
-            # Check for suspicious patterns
-            if log.get('failed_attempts', 0) > 5:
-                return True
-            if log.get('event_type') in ['DeleteSecurityGroup', 'ModifySecurityGroup']:
-                return True
-            if log.get('bytes_transferred', 0) > 5000000:  # 5MB
-                return True
-        
-        return False
-    
-    def is_data_exfiltration(self, log):
-        """Detect potential data exfiltration patterns"""
-        bytes_out = log.get('bytes_transferred', 0)
-        event_type = log.get('event_type', '')
-        
-        # Large outbound transfers during unusual hours
-        if bytes_out > 10000000:  # 10MB
-            if self.is_outside_business_hours(log):
-                return True
-        
-        # Specific exfiltration-related events
-        exfiltration_events = ['CopyDBClusterSnapshot', 'CreateDBInstanceReadReplica', 
-                              'ModifyDBInstance', 'CreateStack', 'UpdateStack']
-        
-        if event_type in exfiltration_events and bytes_out > 0:
-            return True
-            
-        return False
+
+    @timed('patterns')
+    def summarize_rows(self, flags):
+        """summarize_rule_flags of each row on its own, for all rows at once"""
+        checks = self.rule_checks(flags)
+        hits = flags[[name for name, _, _ in checks]].to_numpy(dtype=bool)
+        confidences = self.log_confidences(flags)
+        return [
+            {
+                'suspicious': bool(row.any()),
+                'confidence': float(confidence),
+                'suspicious_activities': [message for hit, (_, message, _) in zip(row, checks) if hit],
+                'patterns_detected': [],
+                'total_logs_analyzed': 1
+            }
+            for row, confidence in zip(hits, confidences)
+        ]
+
+    def rule_version(self):
+        """Short hash of the rule configuration; changes whenever a rule does.
+
+        Computed once per rule snapshot: the result cache asks on every lookup.
+        """
+        fingerprint = self.rules.snapshot.fingerprint
+        cached = self._rule_version
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        config = repr((fingerprint, self.RULE_FIELDS) + self._table_fingerprints)
+        version = hashlib.blake2b(config.encode(), digest_size=8).hexdigest()
+        self._rule_version = (fingerprint, version)
+        return version
+
+    def log_confidences(self, flags):
+        """Per-log pattern confidence, equal to summarize_rule_flags on each row alone"""
+        checks = self.rule_checks(flags)
+        hits = flags[[name for name, _, _ in checks]].to_numpy(dtype=bool)
+        confidence = np.zeros(len(flags))
+        # Add weights in check order; adding 0.0 for a miss leaves the sum unchanged
+        for column, (_, _, weight) in enumerate(checks):
+            confidence = confidence + np.where(hits[:, column], weight, 0.0)
+        return np.minimum(confidence, 1.0)
+
+    def _rule_frame(self, logs, fields=()):
+        """Columns the rules read, with the RULE_FIELDS defaults for absent values"""
+        defaults = dict(self.RULE_FIELDS)
+        for name in fields:
+            defaults.setdefault(name, None)
+        if hasattr(logs, 'to_pandas'):
+            logs = logs.to_pandas()
+        if isinstance(logs, pd.DataFrame):
+            columns = {}
+            for name, default in defaults.items():
+                if name in logs:
+                    column = logs[name].astype(object)
+                    columns[name] = column.where(column.notna(), default).tolist()
+                else:
+                    columns[name] = [default] * len(logs)
+        else:
+            columns = {name: [log.get(name, default) for log in logs]
+                       for name, default in defaults.items()}
+        return pd.DataFrame({name: pd.Series(values, dtype=object) for name, values in columns.items()})
     
     def get_ethiopian_threat_intelligence(self):
         """Get current Ethiopian threat intelligence"""
@@ -0,0 +1,178 @@
+"""
+BunaSIEM Result Cache
+Reuses detector and pattern results for logs with identical scoring inputs
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_ISO_TIME = re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:Z|[+-]\d{2}:?\d{2})?')
+_MISSING = '<missing>'
+
+# Raw fields that feed the detector features or the pattern rules
+KEY_FIELDS = ['failed_attempts', 'request_count', 'bytes_transferred', 'city', 'country_code', 'event_type']
+
+
+class ResultCache:
+    """Bounded LRU cache with TTL of (ml_result, pattern_result) pairs.
+
+    The key is a digest of everything the two results are computed from:
+    the EAT hour, weekend, holiday and business-hours class of event_time and where it falls
+    among the rules' time_of_day thresholds (not the exact timestamp), the raw
+    numeric and location fields plus any field a rule reads, source IP diversity,
+    Ethiopian IP membership and any windowed behaviour values. Logs without
+    an event_time are never cached, since the detector fills in "now".
+
+    The cache empties itself when the detector's model or the matcher's rule
+    set changes. Cached result dicts are shared and must not be mutated.
+    """
+
+    def __init__(self, anomaly_detector, pattern_matcher, max_entries=50000, ttl_seconds=300):
+        self.anomaly_detector = anomaly_detector
+        self.pattern_matcher = pattern_matcher
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._key_fields = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, anomaly_detector, pattern_matcher):
+        """Cache configured by ML_RESULT_CACHE_*, or None when it is switched off"""
+        max_entries = int(os.getenv('ML_RESULT_CACHE_SIZE', 0))
+        if max_entries <= 0:
+            return None
+        return cls(anomaly_detector, pattern_matcher, max_entries=max_entries,
+                   ttl_seconds=float(os.getenv('ML_RESULT_CACHE_TTL', 300)))
+
+    def key_fields(self, ruleset):
+        """KEY_FIELDS plus any other log field the detection rules read"""
+        fields = self._key_fields.get(ruleset.fingerprint)
+        if fields is None:
+            extra = set(ruleset.log_fields['patterns']) | set(ruleset.log_fields['detector'])
+            fields = self._key_fields[ruleset.fingerprint] = KEY_FIELDS + sorted(extra - set(KEY_FIELDS))
+        return fields
+
+    def fingerprint(self, log, behavior=None, ruleset=None):
+        """Digest of the scoring inputs of one log, or None if it must not be cached"""
+        if not isinstance(log, dict) or isinstance(behavior, Exception):
+            return None
+        if ruleset is None:
+            ruleset = self.pattern_matcher.rules.snapshot
+        time_key = self._time_key(log.get('event_time'), ruleset)
+        if time_key is None:
+            return None
+        try:
+            diversity = len(set(log.get('source_ips', [])))
+        except Exception:
+            return None
+        key = (
+            time_key,
+            tuple(repr(log.get(name, _MISSING)) for name in self.key_fields(ruleset)),
+            diversity,
+            self.anomaly_detector.ethiopian_ip_index.contains(log.get('source_ip', '')),
+            tuple(sorted(behavior.items())) if behavior else None,
+        )
+        return hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+
+    def _time_key(self, event_time, ruleset):
+        if event_time is None:
+            return None
+        if type(event_time) is str and _ISO_TIME.fullmatch(event_time):
+            times = self.pattern_matcher.calendar.features_one(event_time)
+            if times is None or not np.isfinite(times['time_us']):
+                return ('raw', event_time)
+            # Same arithmetic as the rules' time_of_day column
+            seconds = times['time_us'] / 1e6
+            return ('iso', times['hour'], times['is_weekend'], times['is_holiday'], times['is_business_hours'],
+                    ruleset.time_class(seconds))
+        return ('raw', repr(event_time))
+
+    def score(self, logs):
+        """(ml_result, pattern_result) for each log, scoring only the cache misses"""
+        self._check_version()
+        windows = self.anomaly_detector.behavior_windows
+        behaviors = windows.observe_many(logs) if windows is not None else [None] * len(logs)
+
+        results = [None] * len(logs)
+        ruleset = self.pattern_matcher.rules.snapshot
+        keys = [self.fingerprint(log, behavior, ruleset) for log, behavior in zip(logs, behaviors)]
+        now = time.monotonic()
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key is not None:
+                    results[i] = self._get(key, now)
+            self.misses += sum(1 for result in results if result is None)
+            self.hits += sum(1 for result in results if result is not None)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        miss_logs = [logs[i] for i in missing]
+        miss_behaviors = [behaviors[i] for i in missing] if windows is not None else None
+        ml_results = self.anomaly_detector.predict_batch(miss_logs, behaviors=miss_behaviors)
+        pattern_results = self.pattern_matcher.summarize_rows(self.pattern_matcher.rule_flags(miss_logs))
+        with self._lock:
+            for i, ml_result, pattern_result in zip(missing, ml_results, pattern_results):
+                results[i] = (ml_result, pattern_result)
+                if keys[i] is not None:
+                    self._put(keys[i], results[i], now)
+        return results
+
+    def _check_version(self):
+        version = (self.anomaly_detector.model_version(), self.pattern_matcher.rule_version())
+        if version != self.version:
+            with self._lock:
+                if self.version is not None:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.version = version
+
+    def _get(self, key, now):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < now:
+            del self.entries[key]
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def _put(self, key, value, now):
+        self.entries[key] = (now + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'model_version': self.version[0][0] if self.version else None,
+                'rule_version': self.version[1] if self.version else None,
+            }
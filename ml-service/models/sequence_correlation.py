@@ -0,0 +1,290 @@
+"""
+BunaSIEM Sequence Correlation
+Per-entity state machines over the multi-step "sequences" detection rules
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from models.ethiopian_calendar import EAT, epoch_seconds, parse_eat
+from models.instrumentation import timed
+
+DEFAULT_MAX_KEYS = 200000
+
+# Threat levels from least to most severe; rule severities use the same names
+THREAT_LEVELS = ('low', 'medium', 'high', 'critical')
+
+# Slab row of one partial match: step reached, count toward it, when the step
+# started, first matched event, events matched, and when the match expires
+_STEP, _COUNT, _STARTED, _FIRST, _EVENTS, _EXPIRES = range(6)
+ROW_WIDTH = 6
+
+
+def escalate(threat_level, severities):
+    """``threat_level`` raised to the most severe of ``severities``"""
+    rank = THREAT_LEVELS.index(threat_level)
+    for severity in severities:
+        rank = max(rank, THREAT_LEVELS.index(severity))
+    return THREAT_LEVELS[rank]
+
+
+def event_timestamps(values, default):
+    """event_timestamp of many event_time values at once"""
+    times = parse_eat(values)
+    seconds = epoch_seconds(times['day'], times['time_us'])
+    return np.where(np.isfinite(seconds), seconds, float(default))
+
+
+def _isoformat(seconds):
+    return datetime.fromtimestamp(seconds, EAT).isoformat()
+
+
+class SequenceStates:
+    """Partial matches of one sequence rule, keyed by entity.
+
+    Like SlidingWindowCounter, every key owns a fixed-width row of one shared
+    slab (float64 here, for timestamps). Keys only get a row once they match
+    the first step, and lose it when they complete the sequence or miss a
+    step's time bound. Steps have different time bounds, so expiries are
+    indexed in a heap of (expires, key, row) entries: every row the stream
+    clock has passed is dropped before a new one is allocated. Entries
+    left stale by a later step are skipped when they surface. Rows are also
+    kept in least recently advanced order, and the front row is evicted when
+    ``max_keys`` is reached.
+    """
+
+    def __init__(self, sequence, max_keys=DEFAULT_MAX_KEYS):
+        self.sequence = sequence
+        self.max_keys = max_keys
+        self.rows = OrderedDict()
+        self.slab = array('d')
+        self.free = []
+        self.deadlines = []
+        self._tiebreak = itertools.count()
+        self.clock = float('-inf')
+        self.incidents = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _new_row(self, key):
+        self._expire()
+        if self.free:
+            base = self.free.pop()
+        elif len(self.rows) >= self.max_keys:
+            _, base = self.rows.popitem(last=False)
+            self.evictions += 1
+        else:
+            base = len(self.slab)
+            self.slab.extend(array('d', bytes(8 * ROW_WIDTH)))
+        self.rows[key] = base
+        return base
+
+    def _set_expiry(self, key, base, expires):
+        slab = self.slab
+        slab[base + _EXPIRES] = expires
+        if len(self.deadlines) > 2 * len(self.rows) + 64:
+            # Drop the stale entries so the heap stays proportional to the live rows
+            self.deadlines = [(slab[row + _EXPIRES], next(self._tiebreak), name, row) for name, row in self.rows.items()]
+            heapq.heapify(self.deadlines)
+        else:
+            heapq.heappush(self.deadlines, (expires, next(self._tiebreak), key, base))
+
+    def _expire(self):
+        rows, slab, clock, deadlines = self.rows, self.slab, self.clock, self.deadlines
+        while deadlines and deadlines[0][0] < clock:
+            expires, _, key, base = heapq.heappop(deadlines)
+            # Stale when the row has since advanced, completed or been reused
+            if rows.get(key) == base and slab[base + _EXPIRES] == expires:
+                del rows[key]
+                self.free.append(base)
+                self.expired += 1
+
+    def advance(self, key, timestamp, hits, weights):
+        """Feed one event that hit at least one step; returns an incident dict when it completes the sequence.
+
+        ``hits`` and ``weights`` hold, per step, whether the event matches it
+        and how much it adds to that step's count.
+        """
+        steps = self.sequence.steps
+        rows, slab = self.rows, self.slab
+        if timestamp > self.clock:
+            self.clock = timestamp
+        base = rows.get(key)
+        if base is not None and timestamp > slab[base + _EXPIRES]:
+            # Missed the step's time bound: start over
+            del rows[key]
+            self.free.append(base)
+            self.expired += 1
+            base = None
+
+        if base is None:
+            if not hits[0]:
+                return None
+            base = self._new_row(key)
+            slab[base:base + ROW_WIDTH] = array('d', (0, 0, timestamp, timestamp, 0, 0))
+            self._set_expiry(key, base, timestamp + steps[0].within)
+            step = 0
+        else:
+            rows.move_to_end(key)
+            step = int(slab[base + _STEP])
+            if not hits[step]:
+                if step and hits[step - 1]:
+                    # The previous step goes on (more failures before the login): its bound restarts
+                    slab[base + _STARTED] = timestamp
+                    slab[base + _EVENTS] += 1
+                    self._set_expiry(key, base, timestamp + steps[step].within)
+                return None
+
+        slab[base + _COUNT] += weights[step]
+        slab[base + _EVENTS] += 1
+        if slab[base + _COUNT] < steps[step].min_count:
+            return None
+        step += 1
+        if step < len(steps):
+            slab[base + _STEP] = step
+            slab[base + _COUNT] = 0
+            slab[base + _STARTED] = timestamp
+            self._set_expiry(key, base, timestamp + steps[step].within)
+            return None
+
+        del rows[key]
+        self.free.append(base)
+        self.incidents += 1
+        sequence = self.sequence
+        return {
+            'incident': sequence.name,
+            'severity': sequence.severity,
+            'description': sequence.message,
+            'key_field': sequence.key,
+            'key': key,
+            'first_seen': _isoformat(slab[base + _FIRST]),
+            'last_seen': _isoformat(timestamp),
+            'events': int(slab[base + _EVENTS]),
+        }
+
+    def __len__(self):
+        return len(self.rows)
+
+    def memory_bytes(self):
+        return self.slab.itemsize * len(self.slab)
+
+
+class SequenceCorrelator:
+    """Follows every sequence rule per entity across batches and reports an
+    incident when an entity completes one, such as a burst of failed logins
+    followed by a login from the same address.
+
+    Step conditions are evaluated for a whole batch with the same vectorized
+    predicates as the pattern rules; only logs that hit some step reach the
+    per-entity state machines. State lives in this process only; behind a
+    pre-fork server each worker sees the share of traffic routed to it.
+    """
+
+    def __init__(self, pattern_matcher, rules=None, max_keys=DEFAULT_MAX_KEYS):
+        self.pattern_matcher = pattern_matcher
+        self.rules = rules if rules is not None else pattern_matcher.rules
+        self.max_keys = max_keys
+        # sequence name -> SequenceStates, for the rule set in self._ruleset
+        self.states = {}
+        self._ruleset = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, pattern_matcher):
+        """Correlator configured by ML_CORRELATION_*, or None when it is switched off"""
+        if os.getenv('ML_CORRELATION', '').lower() not in ('1', 'true', 'yes'):
+            return None
+        return cls(pattern_matcher, max_keys=int(os.getenv('ML_CORRELATION_MAX_KEYS', DEFAULT_MAX_KEYS)))
+
+    def _sync(self, ruleset):
+        """Follow a rule reload; sequences whose definition is unchanged keep their partial matches"""
+        if ruleset is self._ruleset:
+            return
+        states = {}
+        for sequence in ruleset.rules['sequences']:
+            current = self.states.get(sequence.name)
+            if current is not None and current.sequence.signature == sequence.signature:
+                current.sequence = sequence
+            else:
+                current = SequenceStates(sequence, self.max_keys)
+            states[sequence.name] = current
+        self.states = states
+        self._ruleset = ruleset
+
+    @timed('correlation')
+    def observe_many(self, logs):
+        """Incidents each log completes, as one list per log"""
+        found = [[] for _ in range(len(logs))]
+        ruleset = self.rules.snapshot
+        if not ruleset.rules['sequences'] or not len(logs):
+            return found
+        frame, inputs = self.pattern_matcher.rule_inputs(logs, ruleset.log_fields['sequences'])
+
+        plans = []
+        candidates = np.zeros(len(frame), dtype=bool)
+        for sequence, masks in ruleset.evaluate_steps(inputs):
+            hits = np.column_stack(masks)
+            rows = np.flatnonzero(hits.any(axis=1))
+            if not len(rows):
+                continue
+            weights = np.ones((len(rows), len(sequence.steps)))
+            for column, step in enumerate(sequence.steps):
+                if step.count_field:
+                    # Events that carry a count (failed_attempts) add it; others add one
+                    counts = inputs.numbers(step.count_field)[rows]
+                    weights[:, column] = np.maximum(np.nan_to_num(counts, nan=1.0), 1.0)
+            plans.append((sequence, rows, hits[rows], weights))
+            candidates[rows] = True
+
+        if not plans:
+            with self._lock:
+                self._sync(ruleset)
+            return found
+        # Only the logs that hit a step need a timestamp
+        candidate_rows = np.flatnonzero(candidates)
+        event_times = frame['event_time'].to_numpy()
+        timestamps = np.empty(len(frame))
+        timestamps[candidate_rows] = event_timestamps(event_times[candidate_rows].tolist(), time.time())
+
+        with self._lock:
+            self._sync(ruleset)
+            for sequence, rows, hits, weights in plans:
+                states = self.states[sequence.name]
+                keys = frame[sequence.key].to_numpy()[rows].tolist()
+                for i, key, timestamp, hit_row, weight_row in zip(rows.tolist(), keys, timestamps[rows].tolist(),
+                                                                   hits.tolist(), weights.tolist()):
+                    if not key or type(key) is not str:
+                        continue
+                    incident = states.advance(key, timestamp, hit_row, weight_row)
+                    if incident is not None:
+                        found[i].append(incident)
+        return found
+
+    def stats(self):
+        with self._lock:
+            states = self.states
+            return {
+                'sequences': {
+                    name: {
+                        'key_field': state.sequence.key,
+                        'steps': len(state.sequence.steps),
+                        'keys': len(state),
+                        'incidents': state.incidents,
+                        'expired': state.expired,
+                        'evictions': state.evictions,
+                    }
+                    for name, state in states.items()
+                },
+                'keys': sum(len(state) for state in states.values()),
+                'max_keys': self.max_keys,
+                'incidents': sum(state.incidents for state in states.values()),
+                'memory_bytes': sum(state.memory_bytes() for state in states.values()),
+            }
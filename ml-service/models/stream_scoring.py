@@ -0,0 +1,170 @@
+"""
+BunaSIEM Stream Scoring
+Scores newline-delimited JSON logs in fixed-size chunks with bounded memory
+"""
+
+import gzip
+import io
+import json
+from itertools import islice
+
+import numpy as np
+
+from models.sequence_correlation import escalate
+from models.threat_intel import CONFIDENCE_SCORES
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_ndjson(stream, compressed=None):
+    """Binary line iterator over a (possibly gzip-compressed) byte stream.
+
+    When ``compressed`` is None the gzip magic bytes decide.
+    """
+    reader = stream if hasattr(stream, 'peek') else io.BufferedReader(stream)
+    if compressed is None:
+        compressed = reader.peek(2)[:2] == GZIP_MAGIC
+    return gzip.GzipFile(fileobj=reader, mode='rb') if compressed else reader
+
+
+def iter_records(lines, start=1):
+    """(line_number, record, error) for each non-blank line, numbered from 1"""
+    for line_number, line in enumerate(lines, start):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line), None
+        except ValueError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+
+
+class StreamScorer:
+    """Runs the detector, pattern rules and threat intel over a record stream.
+
+    Only one chunk of records is held at a time. The summary keeps counters
+    instead of per-log lists, so memory does not grow with the input.
+    """
+
+    def __init__(self, anomaly_detector, pattern_matcher, threat_intel=None, normalizer=None, correlator=None):
+        self.anomaly_detector = anomaly_detector
+        self.pattern_matcher = pattern_matcher
+        self.threat_intel = threat_intel
+        self.normalizer = normalizer
+        self.correlator = correlator
+
+    def score_chunk(self, logs):
+        """Combined per-log results for one chunk of dict logs"""
+        ml_results = self.anomaly_detector.predict_batch(logs)
+        flags = self.pattern_matcher.rule_flags(logs)
+        pattern_confidence = self.pattern_matcher.log_confidences(flags)
+        intel = self.threat_intel.match_batch(logs) if self.threat_intel is not None else [[] for _ in logs]
+        incidents = self.correlator.observe_many(logs) if self.correlator is not None else None
+        flag_rows = flags.to_dict('records')
+
+        results = []
+        for i, ml_result in enumerate(ml_results):
+            pattern_flags = {name: bool(value) for name, value in flag_rows[i].items()}
+            intel_confidence = max((CONFIDENCE_SCORES.get(m['confidence_level'], 0.0) for m in intel[i]), default=0.0)
+            result = {
+                'is_anomaly': bool(ml_result['is_anomaly'] or any(pattern_flags.values()) or intel[i]),
+                'confidence': max(ml_result['confidence'], float(pattern_confidence[i]), intel_confidence),
+                'ml_result': ml_result,
+                'pattern_flags': pattern_flags,
+                'threat_intel_matches': intel[i],
+            }
+            if incidents is not None:
+                result['incidents'] = incidents[i]
+                result['is_anomaly'] = result['is_anomaly'] or bool(incidents[i])
+            results.append(result)
+        return results
+
+    def new_summary(self):
+        summary = {
+            'total_logs_analyzed': 0,
+            'anomalies_detected': 0,
+            'errors': 0,
+            'threat_intel_hits': 0,
+            'pattern_counts': {name: 0 for name, _, _ in self.pattern_matcher.rule_checks()},
+        }
+        if self.correlator is not None:
+            # Incidents by sequence rule and by severity
+            summary['incident_counts'] = {}
+            summary['incident_severities'] = {}
+        return summary
+
+    @staticmethod
+    def merge_summary(total, part):
+        """Add the counters of one chunk's summary into ``total``"""
+        for key, value in part.items():
+            if isinstance(value, dict):
+                for name, count in value.items():
+                    total[key][name] = total[key].get(name, 0) + count
+            else:
+                total[key] += value
+        return total
+
+    @staticmethod
+    def finish_summary(summary):
+        anomaly_count = summary['anomalies_detected']
+        threat_level = 'critical' if anomaly_count > 5 else 'high' if anomaly_count > 2 else 'medium' if anomaly_count > 0 else 'low'
+        severities = summary.get('incident_severities', {})
+        summary['threat_level'] = escalate(threat_level, [severity for severity, count in severities.items() if count])
+        return {'summary': summary}
+
+    def score_batch(self, chunk, summary):
+        """Result dicts for one chunk of iter_records() tuples, counted into ``summary``"""
+        logs = [record for _, record, error in chunk if error is None and isinstance(record, dict)]
+        if self.normalizer is not None:
+            logs = self.normalizer.normalize(logs)
+        scored = iter(self.score_chunk(logs)) if logs else iter(())
+        for line_number, record, error in chunk:
+            if error is None and not isinstance(record, dict):
+                error = 'Each line must be a JSON object'
+            if error is not None:
+                summary['errors'] += 1
+                yield {'line': line_number, 'error': error}
+                continue
+            result = next(scored)
+            summary['total_logs_analyzed'] += 1
+            summary['anomalies_detected'] += result['is_anomaly']
+            summary['threat_intel_hits'] += bool(result['threat_intel_matches'])
+            counts = summary['pattern_counts']
+            for name, hit in result['pattern_flags'].items():
+                # A rule reload mid-stream can add flag columns
+                counts[name] = counts.get(name, 0) + hit
+            for incident in result.get('incidents', ()):
+                for key, value in (('incident_counts', incident['incident']), ('incident_severities', incident['severity'])):
+                    summary[key][value] = summary[key].get(value, 0) + 1
+            yield dict(result, line=line_number)
+
+    def score_records(self, records, chunk_size=1000):
+        """Yield one result dict per input record, then a final summary dict"""
+        summary = self.new_summary()
+        records = iter(records)
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            yield from self.score_batch(chunk, summary)
+        yield self.finish_summary(summary)
+
+    def encode_lines(self, lines, start=1):
+        """(encoded NDJSON results, chunk summary) for a list of raw input lines"""
+        summary = self.new_summary()
+        body = b''.join(encode_line(item) for item in self.score_batch(list(iter_records(lines, start)), summary))
+        return body, summary
+
+    def score_ndjson(self, stream, chunk_size=1000, compressed=None):
+        """Encoded NDJSON output lines for an NDJSON byte stream"""
+        for item in self.score_records(iter_records(open_ndjson(stream, compressed)), chunk_size):
+            yield encode_line(item)
+
+
+def encode_line(item):
+    return (json.dumps(item, default=_json_default) + '\n').encode()
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,168 @@
+"""
+BunaSIEM Streaming Trainer
+Fits the anomaly model on log history of any size with fixed peak memory
+"""
+
+import time
+from itertools import islice
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from models.behavior_windows import BehaviorWindows, apply_behavior
+from models.feature_extractor import ColumnarFeatureExtractor
+from models.log_normalizer import LogNormalizer
+from models.feature_schema import DETECTOR_FEATURES
+from models.model_registry import ModelRegistry
+from models.parallel_scoring import n_jobs_from_env
+
+DEFAULT_CHUNK_SIZE = 50000
+DEFAULT_RESERVOIR_SIZE = 200000
+
+
+class ReservoirSampler:
+    """Uniform sample of at most ``capacity`` rows from a stream (Algorithm R)"""
+
+    def __init__(self, capacity, n_features, seed=None):
+        self.capacity = capacity
+        self.rows = np.empty((capacity, n_features), dtype=np.float32)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, rows):
+        rows = np.asarray(rows, dtype=np.float32)
+        fill = min(max(self.capacity - self.seen, 0), len(rows))
+        if fill:
+            self.rows[self.seen:self.seen + fill] = rows[:fill]
+        rest = rows[fill:]
+        if len(rest):
+            # Row k of the stream (1-based) replaces a random slot with probability capacity / k;
+            # fancy assignment keeps the last of duplicate slots, as a sequential loop would
+            positions = self.seen + fill + np.arange(1, len(rest) + 1)
+            slots = (self.rng.random(len(rest)) * positions).astype(np.int64)
+            keep = slots < self.capacity
+            self.rows[slots[keep]] = rest[keep]
+        self.seen += len(rows)
+
+    @property
+    def sample(self):
+        return self.rows[:min(self.seen, self.capacity)]
+
+
+def replace_oldest_trees(model, X, n_replace, random_state=None):
+    """Warm-start ``n_replace`` new trees on X and drop as many of the oldest.
+
+    The decision threshold (offset_) is re-fitted on X afterwards so the
+    contamination rate holds for the refreshed forest.
+    """
+    n_trees = len(model.estimators_)
+    n_replace = min(n_replace, n_trees)
+    model.set_params(warm_start=True, n_estimators=n_trees + n_replace)
+    if random_state is not None:
+        model.set_params(random_state=random_state)
+    model.fit(X)
+
+    model.estimators_ = model.estimators_[n_replace:]
+    model.estimators_features_ = model.estimators_features_[n_replace:]
+    # Per-tree caches newer scikit-learn keeps alongside the estimators
+    for name in ('_average_path_length_per_tree', '_decision_path_lengths'):
+        if hasattr(model, name):
+            setattr(model, name, getattr(model, name)[n_replace:])
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+
+    if model.contamination == 'auto':
+        model.offset_ = -0.5
+    else:
+        model.offset_ = np.percentile(model.score_samples(X), 100.0 * model.contamination)
+    return model
+
+
+class StreamingTrainer:
+    """Streams log records in chunks, extracts features chunk by chunk and
+    keeps a bounded reservoir sample to fit on.
+
+    Peak memory is one chunk of records plus the reservoir, whatever the
+    length of the history. With ``behavior_windows`` the per-IP/user windows
+    are replayed over the stream (expected in time order) so the model sees
+    the same features a windowed detector serves.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, reservoir_size=DEFAULT_RESERVOIR_SIZE,
+                 registry=None, behavior_windows=False, seed=42, n_jobs=None):
+        self.chunk_size = chunk_size
+        self.reservoir_size = reservoir_size
+        self.registry = registry or ModelRegistry()
+        self.behavior_windows = BehaviorWindows() if behavior_windows else None
+        self.seed = seed
+        self.n_jobs = n_jobs if n_jobs is not None else n_jobs_from_env()
+        self.feature_extractor = ColumnarFeatureExtractor()
+        self.normalizer = LogNormalizer.from_env()
+        self.stats = {}
+
+    def sample(self, records):
+        """Reservoir of feature rows (DETECTOR_FEATURES order) from an iterable of logs"""
+        sampler = ReservoirSampler(self.reservoir_size, len(DETECTOR_FEATURES), seed=self.seed)
+        records = iter(records)
+        start = time.perf_counter()
+        rows_seen = chunks = 0
+        while True:
+            chunk = [record for record in islice(records, self.chunk_size) if isinstance(record, dict)]
+            if not chunk:
+                break
+            if self.normalizer is not None:
+                chunk = self.normalizer.normalize(chunk)
+            batch = self.feature_extractor.extract(chunk)
+            if self.behavior_windows is not None:
+                batch = apply_behavior(batch, chunk, self.behavior_windows.observe_many(chunk))
+            sampler.add(batch.matrix[batch.valid])
+            rows_seen += len(chunk)
+            chunks += 1
+
+        self.stats = {
+            'rows_seen': rows_seen,
+            'rows_valid': sampler.seen,
+            'chunks': chunks,
+            'reservoir_rows': len(sampler.sample),
+            'extract_seconds': time.perf_counter() - start,
+        }
+        print(f"Sampled {self.stats['reservoir_rows']} of {sampler.seen} valid rows "
+              f"({rows_seen} logs, {chunks} chunks) in {self.stats['extract_seconds']:.1f}s")
+        return sampler.sample
+
+    def fit(self, records, n_estimators=100, contamination=0.1, extra=None, make_current=True):
+        """Train a new forest from scratch and save it as a registry version"""
+        X = self._require_rows(self.sample(records))
+        model = IsolationForest(
+            contamination=contamination,
+            random_state=self.seed,
+            n_estimators=n_estimators,
+            max_samples='auto',
+            n_jobs=self.n_jobs
+        )
+        start = time.perf_counter()
+        model.fit(X)
+        return self._save(model, X, dict(extra or {}, mode='full', fit_seconds=time.perf_counter() - start),
+                          make_current)
+
+    def refresh(self, records, n_replace, base_version=None, extra=None, make_current=True):
+        """Replace the ``n_replace`` oldest trees of a registry model with trees fitted on ``records``"""
+        model, metadata = self.registry.load(base_version, mmap=False)
+        X = self._require_rows(self.sample(records))
+        model.set_params(n_jobs=self.n_jobs)
+        start = time.perf_counter()
+        # A new seed per refresh so replacement trees never repeat earlier ones
+        replace_oldest_trees(model, X, n_replace, random_state=self.seed + int(time.time()))
+        return self._save(model, X, dict(extra or {}, mode='refresh', parent_version=metadata['version'],
+                                         trees_replaced=n_replace, fit_seconds=time.perf_counter() - start),
+                          make_current)
+
+    def _require_rows(self, X):
+        if not len(X):
+            raise ValueError("No valid log rows to train on")
+        return X
+
+    def _save(self, model, X, extra, make_current):
+        extra = dict(extra, source='streaming', behavior_windows=self.behavior_windows is not None, **self.stats)
+        metadata = self.registry.save(model, X, extra=extra, make_current=make_current)
+        print(f"Saved model version {metadata['version']} ({extra['mode']}, {len(model.estimators_)} trees)")
+        return metadata
@@ -0,0 +1,293 @@
+"""
+BunaSIEM Threat Intelligence Store
+Indicator feeds in the threat_intelligence table shape, matched against every log
+"""
+
+import csv
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+from models.ip_ranges import IPRangeIndex, ip_to_int
+from models.instrumentation import timed
+
+DEFAULT_FEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'threat_intel')
+
+# Confidence reported for a log that hits an indicator of each level
+CONFIDENCE_SCORES = {'low': 0.4, 'medium': 0.7, 'high': 0.9}
+
+IP_FIELDS = ['source_ip', 'destination_ip']
+DOMAIN_FIELDS = ['domain', 'hostname', 'dns_query', 'url']
+HASH_FIELDS = ['file_hash', 'md5', 'sha1', 'sha256']
+
+_IPV6_KEY_OFFSET = 1 << 128  # keeps IPv6 keys apart from IPv4 ones in one dict
+
+
+def _parse_bool(value, default):
+    if isinstance(value, bool):
+        return value
+    if value is None or value == '':
+        return default
+    return str(value).strip().lower() in ('t', 'true', '1', 'yes')
+
+
+def _normalize_domain(value):
+    if not isinstance(value, str) or not value:
+        return None
+    if '://' in value:
+        value = urlsplit(value).hostname or ''
+    return value.strip().rstrip('.').lower() or None
+
+
+def _ip_key(value):
+    parsed = ip_to_int(value)
+    if parsed is None:
+        return None
+    version, number = parsed
+    return number if version == 4 else number + _IPV6_KEY_OFFSET
+
+
+class ThreatIntelSnapshot:
+    """Immutable indicator sets for one version of the feeds.
+
+    Exact indicators live in dicts keyed on a normalized value (IPs as
+    integers, domains and hashes lowercased). Each key maps to a small int
+    that indexes a shared metadata table, so metadata is not stored once per
+    indicator. CIDR indicators go into an IPRangeIndex. ``fingerprint``
+    hashes the active indicators, so equal feeds give equal fingerprints in
+    any process, unlike ``version``, which counts reloads.
+    """
+
+    def __init__(self, records=(), version=0):
+        self.version = version
+        self.loaded_at = time.time()
+        self.meta = []
+        meta_index = {}
+        self.ips = {}
+        self.domains = {}
+        self.hashes = {}
+        self.patterns = {}
+        cidrs = []
+        digest = hashlib.blake2b(digest_size=8)
+
+        for record in records:
+            if not _parse_bool(record.get('is_active'), True):
+                continue
+            indicator_type = record.get('indicator_type')
+            value = record.get('indicator_value')
+            if not isinstance(value, str) or not value.strip():
+                continue
+            value = value.strip()
+            meta = (
+                indicator_type,
+                record.get('threat_type') or 'unknown',
+                record.get('confidence_level') or 'medium',
+                _parse_bool(record.get('is_ethiopian_origin'), False),
+            )
+            index = meta_index.setdefault(meta, len(meta_index))
+            if index == len(self.meta):
+                self.meta.append(meta)
+            digest.update(repr((value, meta)).encode())
+
+            if indicator_type == 'ip_address':
+                if '/' in value:
+                    cidrs.append((value, index))
+                    continue
+                key = _ip_key(value)
+                self._add(self.ips, key, index)
+            elif indicator_type == 'domain':
+                self._add(self.domains, _normalize_domain(value), index)
+            elif indicator_type == 'hash':
+                self._add(self.hashes, value.lower(), index)
+            elif indicator_type == 'pattern':
+                self._add(self.patterns, value, index)
+
+        self.cidrs = IPRangeIndex(cidrs)
+        self.fingerprint = digest.hexdigest()
+
+    def _add(self, table, key, index):
+        if key is None:
+            return
+        # Keep the most confident entry when feeds disagree
+        current = table.get(key)
+        if current is None or self._rank(index) > self._rank(current):
+            table[key] = index
+
+    def _rank(self, index):
+        return list(CONFIDENCE_SCORES).index(self.meta[index][2]) if self.meta[index][2] in CONFIDENCE_SCORES else 0
+
+    def __len__(self):
+        return len(self.ips) + len(self.domains) + len(self.hashes) + len(self.patterns) + self.cidrs.size
+
+    def _match(self, indicator_type, value, index):
+        _, threat_type, confidence_level, is_ethiopian_origin = self.meta[index]
+        return {
+            'indicator_type': indicator_type,
+            'indicator_value': value,
+            'threat_type': threat_type,
+            'confidence_level': confidence_level,
+            'is_ethiopian_origin': is_ethiopian_origin,
+        }
+
+    def match(self, log):
+        """All indicators a single log hits"""
+        matches = []
+        if not isinstance(log, dict):
+            return matches
+
+        for field in IP_FIELDS:
+            value = log.get(field)
+            key = _ip_key(value)
+            if key is None:
+                continue
+            index = self.ips.get(key)
+            if index is None and self.cidrs.size:
+                index = self.cidrs.lookup(value)
+            if index is not None:
+                matches.append(self._match('ip_address', value, index))
+
+        for field in DOMAIN_FIELDS:
+            domain = _normalize_domain(log.get(field))
+            # Walk parent domains so sub.fake-cbe.et hits fake-cbe.et
+            while domain:
+                index = self.domains.get(domain)
+                if index is not None:
+                    matches.append(self._match('domain', domain, index))
+                    break
+                domain = domain.partition('.')[2]
+
+        for field in HASH_FIELDS:
+            value = log.get(field)
+            if isinstance(value, str):
+                index = self.hashes.get(value.lower())
+                if index is not None:
+                    matches.append(self._match('hash', value, index))
+
+        event_type = log.get('event_type')
+        if isinstance(event_type, str):
+            index = self.patterns.get(event_type)
+            if index is not None:
+                matches.append(self._match('pattern', event_type, index))
+
+        return matches
+
+
+class ThreatIntelStore:
+    """Loads indicator feeds and swaps in new snapshots without blocking readers.
+
+    Readers take ``self.snapshot`` once per request. A reload builds the next
+    snapshot off to the side and publishes it with a single reference
+    assignment, so scoring never waits on a reload.
+    """
+
+    FEED_PATTERNS = ['*.csv', '*.json', '*.ndjson', '*.jsonl']
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('THREAT_INTEL_PATH', DEFAULT_FEED_PATH)
+        self.snapshot = ThreatIntelSnapshot()
+        self._signature = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watch_interval = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def feed_files(self):
+        if os.path.isfile(self.path):
+            return [self.path]
+        files = []
+        for pattern in self.FEED_PATTERNS:
+            files.extend(glob.glob(os.path.join(self.path, pattern)))
+        return sorted(files)
+
+    def _feed_signature(self, files):
+        signature = []
+        for path in files:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def reload(self, force=False):
+        """Rebuild the snapshot if any feed file changed. Returns True if it swapped."""
+        with self._reload_lock:
+            files = self.feed_files()
+            signature = self._feed_signature(files)
+            if not force and signature == self._signature:
+                return False
+            try:
+                records = []
+                for path in files:
+                    records.extend(self.read_feed(path))
+                snapshot = ThreatIntelSnapshot(records, version=self.snapshot.version + 1)
+            except Exception as e:
+                print(f"Threat intel reload failed, keeping version {self.snapshot.version}: {e}")
+                return False
+            self.snapshot = snapshot
+            self._signature = signature
+            print(f"Threat intel version {snapshot.version} loaded: {len(snapshot)} indicators from {len(files)} feeds")
+            return True
+
+    @staticmethod
+    def read_feed(path):
+        """Records from a CSV table export, a JSON array or NDJSON"""
+        if path.endswith('.csv'):
+            with open(path, newline='') as f:
+                return list(csv.DictReader(f))
+        with open(path) as f:
+            if path.endswith(('.ndjson', '.jsonl')):
+                return [json.loads(line) for line in f if line.strip()]
+            data = json.load(f)
+        return data.get('indicators', []) if isinstance(data, dict) else data
+
+    def start_watcher(self, interval):
+        """Poll the feeds every ``interval`` seconds and reload on change"""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                self.reload()
+
+        self._watcher = threading.Thread(target=watch, name='threat-intel-watcher', daemon=True)
+        self._watcher.start()
+
+        if self._watch_interval is None and hasattr(os, 'register_at_fork'):
+            # Threads do not survive fork(); pre-fork workers start their own
+            os.register_at_fork(after_in_child=self._restart_after_fork)
+        self._watch_interval = interval
+
+    def _restart_after_fork(self):
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self.start_watcher(self._watch_interval)
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    @timed('threat_intel')
+    def match_batch(self, logs):
+        """Indicator matches per log, all taken from one snapshot"""
+        snapshot = self.snapshot
+        return [snapshot.match(log) for log in logs]
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'version': snapshot.version,
+            'fingerprint': snapshot.fingerprint,
+            'loaded_at': snapshot.loaded_at,
+            'indicators': len(snapshot),
+            'ip_addresses': len(snapshot.ips),
+            'cidr_ranges': snapshot.cidrs.size,
+            'domains': len(snapshot.domains),
+            'hashes': len(snapshot.hashes),
+            'patterns': len(snapshot.patterns),
+        }
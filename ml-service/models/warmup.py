@@ -0,0 +1,147 @@
+"""
+BunaSIEM Warm-up
+Runs a small dummy batch through every scoring path at startup, so the first
+real request does not pay for imports, model loading or first-call setup
+"""
+
+import os
+import time
+
+from models import wire_format
+from models.behavior_windows import BehaviorWindows
+from models.instrumentation import INSTRUMENTATION
+from models.log_normalizer import LogNormalizer
+from models.sequence_correlation import SequenceCorrelator
+
+# Flat logs reaching the detector's branches: business hours, a foreign burst
+# of failures, an off-hours transfer with a naive timestamp, and an unreadable time
+WARMUP_LOGS = [
+    {'event_time': '2025-01-15T10:30:00+03:00', 'source_ip': '196.188.10.20', 'event_type': 'ConsoleLogin',
+     'username': 'warmup@bunasiem.local', 'city': 'Addis Ababa', 'country_code': 'ET',
+     'bytes_transferred': 2048, 'failed_attempts': 0, 'request_count': 3},
+    {'event_time': '2025-01-18T23:45:00Z', 'source_ip': '203.0.113.7', 'event_type': 'FailedLogin',
+     'username': 'warmup@bunasiem.local', 'city': 'Unknown', 'country_code': 'US', 'failed_attempts': 8},
+    {'event_time': '2025-01-15 21:10:00', 'source_ip': '196.188.10.20', 'event_type': 'DataTransfer',
+     'username': 'warmup@bunasiem.local', 'city': 'Adama', 'country_code': 'ET',
+     'bytes_transferred': 2 * 10 ** 9, 'source_ips': ['196.188.10.20', '203.0.113.7']},
+    {'event_time': 'not a time', 'source_ip': '203.0.113.9', 'event_type': 'NetworkAccess'},
+]
+
+# One native record per source the normalizer maps
+WARMUP_NATIVE_LOGS = [
+    {'eventTime': '2025-01-15T07:30:00Z', 'eventSource': 'signin.amazonaws.com', 'eventName': 'ConsoleLogin',
+     'sourceIPAddress': '203.0.113.8', 'userIdentity': {'userName': 'warmup'}},
+    {'time': '2025-01-15T07:31:00Z', 'operationName': 'Sign-in activity', 'callerIpAddress': '196.188.10.21'},
+    {'timestamp': '2025-01-15T10:32:00+03:00', 'bytes_sent': 4096, 'office': 'warmup',
+     'location': {'city': 'Hawassa', 'country': 'ET'}},
+]
+
+
+class Warmup:
+    """Startup pass over the detector, pattern rules, threat intel, correlation
+    and response encoders with a dummy batch.
+
+    Behavior windows, correlation and normalizer counts come from private
+    instances, and the stage timings are discarded afterwards, so the dummy
+    logs leave no trace in the service's state or in /metrics. ``ready``
+    turns True once every step has succeeded; /health answers 503 until then.
+    Without ``scoring_pool`` the parallel scoring workers are left for each
+    pre-fork worker to start (gunicorn.conf.py post_fork): a pool started in
+    the preloading master does not survive fork().
+    """
+
+    def __init__(self, anomaly_detector, pattern_matcher, threat_intel, correlator=None, log_normalizer=None,
+                 enabled=True, scoring_pool=True):
+        self.anomaly_detector = anomaly_detector
+        self.pattern_matcher = pattern_matcher
+        self.threat_intel = threat_intel
+        self.correlator = correlator
+        self.log_normalizer = log_normalizer
+        self.enabled = enabled
+        self.scoring_pool = scoring_pool
+        # Nothing to wait for when switched off
+        self.ready = not enabled
+        self.seconds = None
+        self.steps = {}
+        self.error = None
+
+    @classmethod
+    def from_env(cls, anomaly_detector, pattern_matcher, threat_intel, correlator=None, log_normalizer=None):
+        """Warm-up unless ML_WARMUP=0; the scoring pool is skipped when ML_WARMUP_SCORING_POOL=0"""
+        enabled = os.getenv('ML_WARMUP', '1').lower() not in ('0', 'false', 'no')
+        scoring_pool = os.getenv('ML_WARMUP_SCORING_POOL', '1').lower() not in ('0', 'false', 'no')
+        return cls(anomaly_detector, pattern_matcher, threat_intel, correlator, log_normalizer, enabled, scoring_pool)
+
+    def _logs(self):
+        logs = [dict(log) for log in WARMUP_LOGS]
+        if self.log_normalizer is not None:
+            logs += LogNormalizer().normalize([dict(record) for record in WARMUP_NATIVE_LOGS])
+            geoip = self.log_normalizer.geoip
+            if geoip is not None:
+                # Fault in the mapped range pages without filling the LRU or counting lookups
+                geoip.lookup_many(log.get('source_ip') for log in logs)
+        return logs
+
+    def _steps(self, logs):
+        """(name, callable) pairs in the order a request meets them"""
+        detector = self.anomaly_detector
+        matcher = self.pattern_matcher
+        behaviors = BehaviorWindows().observe_many(logs) if detector.behavior_windows is not None else None
+        results = []
+
+        def score():
+            detector.predict(logs[0], behaviors[0] if behaviors is not None else None)
+            results.extend(detector.predict_batch(logs, behaviors))
+
+        def patterns():
+            matcher.detect_ethiopian_patterns(logs)
+            matcher.summarize_rows(matcher.rule_flags(logs))
+
+        def correlation():
+            SequenceCorrelator(matcher, rules=self.correlator.rules, max_keys=len(logs)).observe_many(logs)
+
+        def encode():
+            payload = {'ml_results': results}
+            for media_type in wire_format.available_formats():
+                wire_format.encode(payload, media_type)
+            if wire_format.ARROW in wire_format.available_formats(columnar=True):
+                wire_format.ml_results_table(results, {})
+
+        steps = [('model', lambda: detector.warm_up(self.scoring_pool)), ('detector', score), ('patterns', patterns),
+                 ('threat_intel', lambda: self.threat_intel.match_batch(logs))]
+        if self.correlator is not None:
+            steps.append(('correlation', correlation))
+        steps.append(('serialize', encode))
+        return steps
+
+    def run(self):
+        """Run every step once; ``ready`` only if all of them succeed"""
+        if not self.enabled:
+            return self.ready
+        start = time.perf_counter()
+        name = 'logs'
+        try:
+            for name, step in self._steps(self._logs()):
+                step_start = time.perf_counter()
+                step()
+                self.steps[name] = time.perf_counter() - step_start
+            self.ready = True
+        except Exception as e:
+            self.error = f"{name}: {e}"
+            print(f" Warm-up failed at {name}: {e}")
+        finally:
+            self.seconds = time.perf_counter() - start
+            # Warm-up is not traffic: keep its stage timings out of /metrics
+            INSTRUMENTATION.drain()
+        if self.ready:
+            print(f"Warm-up done in {self.seconds:.3f}s")
+        return self.ready
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'ready': self.ready,
+            'seconds': self.seconds,
+            'steps': dict(self.steps),
+            'error': self.error,
+        }
@@ -0,0 +1,153 @@
+"""
+BunaSIEM Wire Formats
+Content negotiation between JSON, MessagePack and Arrow IPC for the ML endpoints
+"""
+
+import json
+
+from models.instrumentation import timed
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+ARROW = 'application/vnd.apache.arrow.stream'
+
+# Alternative MIME names clients send for the same formats
+ALIASES = {
+    'application/x-msgpack': MSGPACK,
+    'application/vnd.msgpack': MSGPACK,
+    'application/vnd.apache.arrow.file': ARROW,
+}
+
+
+class UnsupportedFormat(ValueError):
+    """Request body in a format this service cannot read (415)"""
+
+
+class InvalidBody(ValueError):
+    """Request body that does not decode in its declared format (400)"""
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def available_formats(columnar=False):
+    """Formats this process can produce; Arrow only where the response is a table"""
+    formats = [JSON]
+    if _msgpack() is not None:
+        formats.append(MSGPACK)
+    if columnar and _pyarrow() is not None:
+        formats.append(ARROW)
+    return formats
+
+
+def _media_type(value):
+    media_type = value.split(';', 1)[0].strip().lower()
+    if media_type.startswith('application/') and media_type.endswith('+json'):
+        return JSON
+    return ALIASES.get(media_type, media_type)
+
+
+def negotiate(accept_mimetypes, columnar=False):
+    """Best response format for an Accept header; JSON unless a binary one is preferred"""
+    offered = available_formats(columnar)
+    best = accept_mimetypes.best_match(offered + list(ALIASES), default=JSON)
+    best = ALIASES.get(best, best)
+    return best if best in offered else JSON
+
+
+def decode_body(request, columnar=False):
+    """Request payload as Python objects, by Content-Type.
+
+    An Arrow body (``columnar`` endpoints only) is a table of logs and
+    decodes to ``{'logs': [...]}``.
+    """
+    return decode_bytes(request.get_data(), request.content_type, columnar)
+
+
+@timed('parse')
+def decode_bytes(body, content_type, columnar=False):
+    """decode_body() for a raw body.
+
+    Raises UnsupportedFormat for a content type this process cannot read
+    and InvalidBody for a body that does not decode.
+    """
+    media_type = _media_type(content_type or JSON)
+    if media_type == MSGPACK:
+        msgpack = _msgpack()
+        if msgpack is None:
+            raise UnsupportedFormat("MessagePack support is not installed")
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise InvalidBody(f"Invalid MessagePack body: {str(e) or type(e).__name__}") from e
+    if media_type == ARROW:
+        pyarrow = _pyarrow()
+        if not columnar:
+            raise UnsupportedFormat("Arrow bodies are only accepted for batches of logs")
+        if pyarrow is None:
+            raise UnsupportedFormat("Arrow support is not installed")
+        try:
+            table = pyarrow.ipc.open_stream(body).read_all()
+            for i, field in enumerate(table.schema):
+                # The detector parses event times from ISO strings
+                if pyarrow.types.is_timestamp(field.type) or pyarrow.types.is_date(field.type):
+                    table = table.set_column(i, field.name, table.column(i).cast(pyarrow.string()))
+            rows = table.to_pylist()
+        except Exception as e:
+            raise InvalidBody(f"Invalid Arrow body: {str(e) or type(e).__name__}") from e
+        # Nulls mean "field absent" so the detector's defaults still apply
+        return {'logs': [{k: v for k, v in row.items() if v is not None} for row in rows]}
+    if media_type != JSON:
+        raise UnsupportedFormat(f"Unsupported Content-Type {media_type}; send {', '.join(available_formats(columnar))}")
+    try:
+        return json.loads(body) if body else None
+    except ValueError as e:
+        raise InvalidBody(f"Invalid JSON body: {str(e) or type(e).__name__}") from e
+
+
+@timed('serialize')
+def encode(payload, media_type):
+    """Serialized MessagePack or JSON payload"""
+    if media_type == MSGPACK:
+        return _msgpack().packb(payload, use_bin_type=True, default=_default)
+    return json.dumps(payload, default=_default).encode()
+
+
+@timed('serialize')
+def ml_results_table(ml_results, metadata):
+    """Arrow IPC stream with one row per log; everything else goes in the schema metadata"""
+    pyarrow = _pyarrow()
+    contexts = [result.get('ethiopian_context') or {} for result in ml_results]
+    table = pyarrow.table({
+        'is_anomaly': pyarrow.array([result['is_anomaly'] for result in ml_results], pyarrow.bool_()),
+        'confidence': pyarrow.array([result['confidence'] for result in ml_results], pyarrow.float64()),
+        'high_risk': pyarrow.array([context.get('high_risk', False) for context in contexts], pyarrow.bool_()),
+        'reasons': pyarrow.array([context.get('reasons', []) for context in contexts], pyarrow.list_(pyarrow.string())),
+        'error': pyarrow.array([result.get('error') for result in ml_results], pyarrow.string()),
+    })
+    table = table.replace_schema_metadata({'bunasiem': json.dumps(metadata, default=_default)})
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _default(value):
+    # numpy scalars that slip into results
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
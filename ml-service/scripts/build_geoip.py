@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM GeoIP Builder
+Compiles a GeoIP CSV into the memory-mapped range file ML_GEOIP_DB points at
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.geoip import build_geoip
+
+DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'geoip'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the GeoIP range file from a CSV')
+    parser.add_argument('csv', nargs='?', default=os.path.join(DATA_DIR, 'ethiopia_seed.csv'),
+                        help='network or start_ip,end_ip rows with country_code, region and city')
+    parser.add_argument('--output', default=os.path.join(DATA_DIR, 'geoip.bin'))
+    args = parser.parse_args()
+
+    try:
+        summary = build_geoip(args.csv, args.output)
+    except (OSError, ValueError) as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+    print(f"✅ {args.output}: {summary['ipv4_ranges']} IPv4 and {summary['ipv6_ranges']} IPv6 ranges, "
+          f"{summary['locations']} locations, {summary['bytes']} bytes (fingerprint {summary['fingerprint']})")
+    print(f"Set ML_GEOIP_DB={os.path.abspath(args.output)} to use it")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Forest Export Script
+Flattens a trained IsolationForest into the packed arrays used for inference
+"""
+
+import argparse
+import os
+import sys
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.compiled_forest import CompiledForest, FOREST_FILE
+from models.model_registry import ModelRegistry
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export an IsolationForest to packed NumPy arrays')
+    parser.add_argument('model_path', nargs='?', help='joblib/pickle IsolationForest (default: a registry version)')
+    parser.add_argument('--version', help='registry version to export (default: CURRENT)')
+    parser.add_argument('--registry', help='registry directory (default: MODEL_REGISTRY_DIR or models/registry)')
+    parser.add_argument('--output', help=f'output .npz (default: {FOREST_FILE} next to the model)')
+    args = parser.parse_args()
+
+    if args.model_path:
+        model = joblib.load(args.model_path)
+        output = args.output or os.path.join(os.path.dirname(os.path.abspath(args.model_path)), FOREST_FILE)
+    else:
+        registry = ModelRegistry(args.registry)
+        model, metadata = registry.load(args.version)
+        output = args.output or os.path.join(registry.root, metadata['version'], FOREST_FILE)
+
+    forest = CompiledForest.from_model(model)
+    probe = np.random.default_rng(0).normal(0, 20, (1024, forest.n_features))
+    error = forest.max_abs_error(model, probe)
+    forest.save(output)
+    print(f"Exported {forest.n_trees} trees ({len(forest.feature)} nodes, depth {forest.max_depth}) "
+          f"to {output}; max |score - sklearn| = {error:.3g}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,25 +4,30 @@ BunaSIEM Feature Engineering
 Feature extraction for Ethiopian security logs
 """
 
-import pandas as pd
+import os
+import sys
 import numpy as np
-from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.feature_schema import ENGINEER_FEATURES
+from models.feature_extractor import parse_event_times, numeric_column
+from models.ethiopian_calendar import ethiopian_calendar, now_eat
+from models.ip_ranges import ethiopian_ip_index, TELECOM_LABEL
+from models.geoip import geoip_resolver
 
 class EthiopianFeatureEngineer:
     def __init__(self):
-        self.ethiopian_holidays = [
-            '2025-01-07',  # Ethiopian Christmas
-            '2025-01-19',  # Epiphany
-            '2025-03-02',  # Adwa Victory Day
-            '2025-04-28',  # Ethiopian Good Friday
-            '2025-04-30',  # Ethiopian Easter
-            '2025-05-01',  # International Workers' Day
-            '2025-05-28',  # Downfall of Derg
-        ]
+        self.ip_index = ethiopian_ip_index()
+        # Holidays (fixed and movable feasts), weekends and business hours in East Africa Time
+        self.calendar = ethiopian_calendar()
+        # Fills in city and country_code from source_ip when ML_GEOIP_DB is set
+        self.geoip = geoip_resolver()
     
     def extract_features(self, log_data):
         """Extract comprehensive features for Ethiopian context"""
         features = {}
+        if self.geoip is not None:
+            log_data = self.geoip.enrich([log_data])[0]
         
         # Time-based features
         features.update(self._extract_time_features(log_data))
@@ -36,39 +41,89 @@ class EthiopianFeatureEngineer:
         # Network features
         features.update(self._extract_network_features(log_data))
         
-        return features
+        return {name: features[name] for name in ENGINEER_FEATURES}
+    
+    def extract_features_batch(self, logs):
+        """Extract features for many logs as a float32 matrix in ENGINEER_FEATURES order.
+
+        Timestamps are parsed in one vectorized pass. Non-numeric inputs become
+        NaN, as does day_of_week for timestamps that fail to parse.
+        """
+        n = len(logs)
+        if self.geoip is not None:
+            logs = self.geoip.enrich(logs)
+        records = [log if isinstance(log, dict) else {} for log in logs]
+        times = parse_event_times(r.get('event_time', now_eat()) for r in records)
+        
+        parsed = times['parsed']
+        hour = np.where(parsed, times['hour'], 12.0)
+        
+        city = [r.get('city', '') for r in records]
+        range_labels = self.ip_index.lookup_many(r.get('source_ip', '') for r in records)
+        common_cities = ['Addis Ababa', 'Dire Dawa', 'Adama', 'Hawassa', 'Mekele']
+        
+        columns = {
+            'hour_of_day': hour,
+            'is_weekend': parsed & times['is_weekend'],
+            'is_holiday': parsed & times['is_holiday'],
+            'is_business_hours': parsed & times['is_business_hours'],
+            'is_night_hours': parsed & times['is_night_hours'],
+            'day_of_week': np.where(parsed, times['day_of_week'], np.nan),
+            'is_ethiopian_ip': np.fromiter((r.get('country_code', '') == 'ET' for r in records), dtype=bool, count=n),
+            'is_common_city': np.fromiter((c in common_cities for c in city), dtype=bool, count=n),
+            'is_telecom_range': range_labels == self.ip_index.label_index(TELECOM_LABEL),
+            'city_unknown': np.fromiter((not c for c in city), dtype=bool, count=n),
+            'failed_attempts': self._numeric_or_nan([r.get('failed_attempts', 0) for r in records]),
+            'request_frequency': self._numeric_or_nan([r.get('request_count', 1) for r in records]),
+            'session_duration': self._numeric_or_nan([r.get('session_duration', 0) for r in records]),
+            'concurrent_sessions': self._numeric_or_nan([r.get('concurrent_sessions', 1) for r in records]),
+            'bytes_transferred': self._numeric_or_nan([r.get('bytes_transferred', 0) for r in records]) / 1024.0,
+            'request_size_variance': self._numeric_or_nan([r.get('request_size_variance', 0) for r in records]),
+            'unique_destinations': self._sized([r.get('destination_ips', []) for r in records], distinct=False),
+            'protocol_diversity': self._sized([r.get('protocols', []) for r in records], distinct=True),
+        }
+        
+        matrix = np.empty((n, len(ENGINEER_FEATURES)), dtype=np.float32)
+        for j, name in enumerate(ENGINEER_FEATURES):
+            matrix[:, j] = columns[name]
+        return matrix
+    
+    def _numeric_or_nan(self, values):
+        column, ok = numeric_column(values)
+        column[~ok] = np.nan
+        return column
+    
+    def _sized(self, values, distinct):
+        column = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                column[i] = len(set(value)) if distinct else len(value)
+            except TypeError:
+                column[i] = np.nan
+        return column
     
     def _extract_time_features(self, log_data):
         """Extract time-based features for Ethiopian context"""
-        event_time = log_data.get('event_time', datetime.now().isoformat())
-        
-        try:
-            dt = pd.to_datetime(event_time)
-            hour = dt.hour
-            day_of_week = dt.dayofweek
-            is_weekend = 1 if day_of_week >= 5 else 0
-            is_holiday = 1 if dt.strftime('%Y-%m-%d') in self.ethiopian_holidays else 0
-            
-            # Ethiopian business hours: 8:30 AM - 5:30 PM
-            is_business_hours = 1 if 8 <= hour <= 17 else 0
-            
-            # Ethiopian night hours: 10 PM - 6 AM
-            is_night_hours = 1 if hour < 6 or hour > 22 else 0
-            
-        except:
-            hour = 12
-            is_weekend = 0
-            is_holiday = 0
-            is_business_hours = 0
-            is_night_hours = 0
+        times = self.calendar.features_one(log_data.get('event_time', now_eat()))
+        if times is None:
+            # Not a time: noon with no flags set and no weekday, as in extract_features_batch
+            return {
+                'hour_of_day': 12,
+                'is_weekend': 0,
+                'is_holiday': 0,
+                'is_business_hours': 0,
+                'is_night_hours': 0,
+                'day_of_week': np.nan
+            }
         
+        # East Africa Time; business hours 8:30 AM - 5:30 PM, night hours before 6 AM and from 11 PM
         return {
-            'hour_of_day': hour,
-            'is_weekend': is_weekend,
-            'is_holiday': is_holiday,
-            'is_business_hours': is_business_hours,
-            'is_night_hours': is_night_hours,
-            'day_of_week': day_of_week
+            'hour_of_day': times['hour'],
+            'is_weekend': int(times['is_weekend']),
+            'is_holiday': int(times['is_holiday']),
+            'is_business_hours': int(times['is_business_hours']),
+            'is_night_hours': int(times['is_night_hours']),
+            'day_of_week': times['day_of_week']
         }
     
     def _extract_location_features(self, log_data):
@@ -82,7 +137,7 @@ class EthiopianFeatureEngineer:
         return {
             'is_ethiopian_ip': 1 if country == 'ET' else 0,
             'is_common_city': 1 if city in common_cities else 0,
-            'is_telecom_range': 1 if source_ip.startswith(('196.188.', '197.156.')) else 0,
+            'is_telecom_range': 1 if self.ip_index.lookup(source_ip) == TELECOM_LABEL else 0,
             'city_unknown': 1 if not city else 0
         }
     
@@ -119,6 +174,6 @@ if __name__ == '__main__':
     }
     
     features = engineer.extract_features(sample_log)
-    print(" Extracted Features:")
+    print("Extracted Features:")
     for key, value in features.items():
         print(f"  {key}: {value}")
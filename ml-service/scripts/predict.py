@@ -4,25 +4,33 @@ BunaSIEM Prediction Script
 Standalone prediction utility
 """
 
+import os
 import sys
 import json
-import joblib
-import numpy as np
-from anomaly_detector import AnomalyDetector
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.anomaly_detector import AnomalyDetector
+from models.log_normalizer import LogNormalizer
 
 def main():
     if len(sys.argv) != 2:
         print("Usage: python predict.py '<json_log_data>'")
+        print("For log archives use scripts/rescore.py")
         return
-    
+
     try:
         log_data = json.loads(sys.argv[1])
-        detector = AnomalyDetector()
+        # Same mapping and GeoIP location the service applies
+        normalizer = LogNormalizer.from_env()
+        if normalizer is not None:
+            log_data = normalizer.normalize_one(log_data)
+        # Strict: score with the registry model, never train one on the fly
+        detector = AnomalyDetector(strict=True)
         result = detector.predict(log_data)
-        
-        print(" Prediction Results:")
+
+        print("🔍 Prediction Results:")
         print(json.dumps(result, indent=2))
-        
+
     except Exception as e:
         print(f"❌ Error: {e}")
 
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Model Registration Script
+Imports an existing model pickle into the versioned model registry
+"""
+
+import argparse
+import os
+import sys
+
+import joblib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.model_registry import ModelRegistry
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Register a model pickle as a new registry version')
+    parser.add_argument('model_path', help='path to a joblib/pickle IsolationForest')
+    parser.add_argument('--registry', help='registry directory (default: MODEL_REGISTRY_DIR or models/registry)')
+    parser.add_argument('--no-current', action='store_true', help='do not make this version current')
+    args = parser.parse_args()
+
+    model = joblib.load(args.model_path)
+    registry = ModelRegistry(args.registry)
+    metadata = registry.save(model, extra={'source': os.path.abspath(args.model_path)},
+                             make_current=not args.no_current)
+    print(f"Registered {args.model_path} as version {metadata['version']} in {registry.root}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Bulk Rescoring Script
+Backfills detector, pattern and threat intel results over log archives
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.bulk_rescoring import OUTPUT_FORMATS, BulkRescorer
+from models.model_registry import ModelRegistry
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rescore log archives with a registry model version')
+    parser.add_argument('paths', nargs='+', help='log files or directories (.json, .ndjson, .jsonl, optionally .gz)')
+    parser.add_argument('--output', required=True, help='output directory; its checkpoint lets interrupted runs resume')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='ndjson')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='logs scored per batch')
+    parser.add_argument('--version', help='model version to score with (default: current)')
+    parser.add_argument('--registry', help='registry directory (default: MODEL_REGISTRY_DIR or models/registry)')
+    parser.add_argument('--behavior-windows', action='store_true',
+                        help='replay per-IP/user sliding windows within each file (files must be in time order)')
+    args = parser.parse_args()
+
+    rescorer = BulkRescorer(
+        args.output,
+        registry=ModelRegistry(args.registry),
+        version=args.version,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        output_format=args.format,
+        behavior_windows=args.behavior_windows,
+    )
+    totals = rescorer.run(args.paths)
+    print(f"Rescored {totals['rows']} logs in {totals['files']} files ({totals['anomalies']} anomalies, "
+          f"{totals['errors']} errors, {totals['skipped']} files skipped, {totals['failed']} failed) "
+          f"in {totals['seconds']:.1f}s")
+    if totals['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+BunaSIEM Streaming Training Script
+Trains or refreshes the anomaly model from exported log files of any size
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models.log_sources import iter_records
+from models.model_registry import ModelRegistry
+from models.streaming_trainer import DEFAULT_CHUNK_SIZE, DEFAULT_RESERVOIR_SIZE, StreamingTrainer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the anomaly model from log files with bounded memory')
+    parser.add_argument('paths', nargs='+', help='log files or directories (.json, .ndjson, .jsonl, optionally .gz)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='logs per feature extraction chunk')
+    parser.add_argument('--reservoir-size', type=int, default=DEFAULT_RESERVOIR_SIZE, help='rows kept for fitting')
+    parser.add_argument('--refresh', type=int, metavar='N',
+                        help='replace the N oldest trees of the base model instead of training from scratch')
+    parser.add_argument('--base-version', help='model version to refresh (default: current)')
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--contamination', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n-jobs', type=int, help='threads for tree fitting, -1 for every core (default: ML_N_JOBS or 1)')
+    parser.add_argument('--behavior-windows', action='store_true',
+                        help='replay per-IP/user sliding windows over the logs (files must be in time order)')
+    parser.add_argument('--registry', help='registry directory (default: MODEL_REGISTRY_DIR or models/registry)')
+    parser.add_argument('--no-current', action='store_true', help='do not make the new version current')
+    args = parser.parse_args()
+
+    trainer = StreamingTrainer(
+        chunk_size=args.chunk_size,
+        reservoir_size=args.reservoir_size,
+        registry=ModelRegistry(args.registry),
+        behavior_windows=args.behavior_windows,
+        seed=args.seed,
+        n_jobs=args.n_jobs,
+    )
+    records = (record for _, record in iter_records(args.paths))
+    extra = {'inputs': [os.path.abspath(path) for path in args.paths]}
+
+    if args.refresh:
+        trainer.refresh(records, args.refresh, base_version=args.base_version, extra=extra,
+                        make_current=not args.no_current)
+    else:
+        trainer.fit(records, n_estimators=args.n_estimators, contamination=args.contamination, extra=extra,
+                    make_current=not args.no_current)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,6 @@ Generates realistic security logs for Ethiopian context
 import json
 import random
 from datetime import datetime, timedelta
-import requests
 
 # Ethiopian cities and IP ranges
 ETHIOPIAN_CITIES = ["Addis Ababa", "Dire Dawa", "Adama", "Hawassa", "Mekele", "Bahir Dar", "Gondar", "Jimma"]
@@ -103,6 +102,8 @@ def generate_ethio_telecom_log():
 
 def send_to_backend(logs, log_type):
     """Send generated logs to backend API"""
+    # Imported here so the generators can be reused without requests installed
+    import requests
     try:
         url = "http://localhost:3001/api/logs"
         payload = {
@@ -123,15 +124,15 @@ def send_to_backend(logs, log_type):
         return False
 
 def main():
-    print(" BunaSIEM Ethiopian Log Generator")
-    print(" Generating realistic security logs for Ethiopia...")
+    print("🚀 BunaSIEM Ethiopian Log Generator")
+    print("🌍 Generating realistic security logs for Ethiopia...")
     
     # Generate logs
     aws_logs = [generate_aws_log() for _ in range(5)]
     azure_logs = [generate_azure_log() for _ in range(5)]
     ethio_logs = [generate_ethio_telecom_log() for _ in range(5)]
     
-    print(f" Generated: {len(aws_logs)} AWS, {len(azure_logs)} Azure, {len(ethio_logs)} Ethio Telecom logs")
+    print(f"📊 Generated: {len(aws_logs)} AWS, {len(azure_logs)} Azure, {len(ethio_logs)} Ethio Telecom logs")
     
     # Save to files
     with open('../sample-logs/generated-aws-logs.json', 'w') as f:
@@ -143,18 +144,18 @@ def main():
     with open('../sample-logs/generated-ethio-logs.json', 'w') as f:
         json.dump(ethio_logs, f, indent=2)
     
-    print(" Logs saved to sample-logs/ directory")
+    print("💾 Logs saved to sample-logs/ directory")
     
     # Ask to send to backend
-    send_to_api = input(" Send logs to backend API? (y/n): ").lower().strip()
+    send_to_api = input("📨 Send logs to backend API? (y/n): ").lower().strip()
     if send_to_api == 'y':
-        print(" Sending logs to backend...")
+        print("🔄 Sending logs to backend...")
         send_to_backend(aws_logs, "aws_cloudtrail")
         send_to_backend(azure_logs, "azure_monitor")
         send_to_backend(ethio_logs, "ethio_telecom")
-        print(" Log generation complete!")
+        print("🎉 Log generation complete!")
     else:
-        print(" Logs saved locally. Use them for testing.")
+        print("💾 Logs saved locally. Use them for testing.")
 
 if __name__ == "__main__":
     main()